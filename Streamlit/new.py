@@ -1,65 +1,93 @@
 import os
+import sys
+from contextlib import contextmanager
 from datetime import datetime
 
-import psycopg2
 from dotenv import load_dotenv
 from langchain.chains import ConversationalRetrievalChain
 from langchain.prompts import PromptTemplate
 from langchain.schema import AIMessage, HumanMessage
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.vectorstores import FAISS
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from psycopg2.pool import ThreadedConnectionPool
 from PyPDF2 import PdfReader
 
 import streamlit as st
 
-
-# PostgreSQL database connection
-def connect_db():
-    conn = psycopg2.connect(
+# Share the backend's RAG engine instead of duplicating it here
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend"))
+from chunking import chunking_from_env, token_splitter  # noqa: E402
+from index_manifest import remove_pdf, sync_index  # noqa: E402
+from ingest import list_pdfs  # noqa: E402
+from rag_engine import RAGEngine, save_index  # noqa: E402
+from vector_index import IndexConfig, apply_index_config  # noqa: E402
+
+
+# PostgreSQL connection pool shared by every session and rerun
+@st.cache_resource
+def get_db_pool():
+    return ThreadedConnectionPool(
+        minconn=1,
+        maxconn=int(os.getenv("POSTGRES_POOL_SIZE", "10")),
         host="localhost", 
         database="eduquery", 
         user="postgres", 
         password="Sa@251004"
     )
-    return conn
 
-# Function to create the questions table if it doesn't exist
+# Function to borrow a pooled connection, committing on success and rolling back on error
+@contextmanager
+def get_conn():
+    pool = get_db_pool()
+    conn = pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        # Broken connections are closed instead of going back to the pool
+        pool.putconn(conn, close=bool(conn.closed))
+
+# Function to create the questions table if it doesn't exist (once per process)
+@st.cache_resource
 def create_table():
-    """Create the questions table if it does not exist."""
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS questions (
-            id SERIAL PRIMARY KEY,
-            question TEXT NOT NULL,
-            dissimilar BOOLEAN NOT NULL,
-            submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        );
-    ''')
-    conn.commit()
-    conn.close()
+    """Create the questions table and its index if they do not exist."""
+    with get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS questions (
+                id SERIAL PRIMARY KEY,
+                question TEXT NOT NULL,
+                dissimilar BOOLEAN NOT NULL,
+                submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        ''')
+        # Serves the teacher tables' filter on dissimilar and newest-first ordering
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS questions_dissimilar_submitted_at_idx
+            ON questions (dissimilar, submitted_at DESC);
+        ''')
 
 # Function to insert a new question with dissimilar status into the database
 def insert_question(question, dissimilar):
     """Insert a new student question into the database with dissimilar status."""
-    conn = connect_db()
-    cursor = conn.cursor()
-    cursor.execute("INSERT INTO questions (question, dissimilar) VALUES (%s, %s) RETURNING id;", (question, dissimilar))
-    question_id = cursor.fetchone()[0]
-    conn.commit()
-    conn.close()
+    with get_conn() as conn:
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO questions (question, dissimilar) VALUES (%s, %s) RETURNING id;", (question, dissimilar))
+        question_id = cursor.fetchone()[0]
     return question_id
 
 # Function to retrieve all questions and their dissimilar status
 def get_questions(dissimilar):
     """Retrieve questions from the database with custom timestamp formatting."""
-    conn = connect_db()
-    cursor = conn.cursor()
-    
-    # SQL query to get questions based on dissimilar status
-    cursor.execute("SELECT question, submitted_at FROM questions WHERE dissimilar = %s ORDER BY submitted_at DESC;", (dissimilar,))
-    rows = cursor.fetchall()
+    with get_conn() as conn:
+        cursor = conn.cursor()
+
+        # SQL query to get questions based on dissimilar status
+        cursor.execute("SELECT question, submitted_at FROM questions WHERE dissimilar = %s ORDER BY submitted_at DESC;", (dissimilar,))
+        rows = cursor.fetchall()
     
     formatted_questions = []
     
@@ -72,48 +100,33 @@ def get_questions(dissimilar):
         
         formatted_questions.append((question, formatted_timestamp))
     
-    conn.close()
     return formatted_questions
 
 def clear_all_entries():
     """Delete all entries from the questions table."""
-    conn = connect_db()
-    cursor = conn.cursor()
-    
-    # SQL query to delete all rows from the questions table
-    cursor.execute("DELETE FROM questions;")
-    conn.commit()  # Commit the transaction
-    conn.close()
-
-
-def calculate_similarities(questions_csv, embeddings_csv, questions_mongo, embeddings_mongo):
-    similarities = cosine_similarity(embeddings_csv, embeddings_mongo)
-    dissimilarities = 1 - similarities
-    results = []
-
-    for i, question_csv in enumerate(questions_csv):
-        for j, question_mongo in enumerate(questions_mongo):
-            dissimilarity = round(dissimilarities[i, j], 2)  # Round to 2 decimal places
-            rag_answer = "True" if 0.0 <= dissimilarity <= 0.35 else "False"
-            results.append({
-                "question_from_csv": question_csv,
-                "question_from_mongo": question_mongo,
-                "dissimilarity": dissimilarity,  # Rounded value
-                "rag_answer": rag_answer
-            })
-
-    results_df = pd.DataFrame(results)
-    grouped_and_sorted = (
-        results_df.groupby("question_from_csv", group_keys=False)
-        .apply(lambda group: group.sort_values(by="dissimilarity", ascending=True).head(3))
-    )
-    return grouped_and_sorted.to_dict(orient="records")
+    with get_conn() as conn:
+        cursor = conn.cursor()
+
+        # SQL query to delete all rows from the questions table
+        cursor.execute("DELETE FROM questions;")
+
 
 load_dotenv()
-embeddings = OpenAIEmbeddings()
+
+# OpenAI embeddings client, created once per process rather than on every rerun
+@st.cache_resource
+def get_embeddings():
+    return OpenAIEmbeddings()
+
+embeddings = get_embeddings()
 # Directory for storing PDFs and FAISS index
 UPLOAD_FOLDER = './teacher_pdfs'
 INDEX_PATH = "./faiss_index"
+# Index type (flat, ivf, hnsw, ivfpq) and search parameters, shared with the backend's settings
+index_config = IndexConfig.from_env()
+# Token-sized chunks with near-duplicate removal, the same settings as the backend
+CHUNKING = chunking_from_env()
+text_splitter = token_splitter(CHUNKING["chunk_tokens"], CHUNKING["overlap_tokens"])
 
 # Ensure the upload folder exists
 if not os.path.exists(UPLOAD_FOLDER):
@@ -135,24 +148,23 @@ def check_existing_index(index_path):
 
 # Function to get text from uploaded PDF files
 def get_pdf_text(pdf_docs):
-    text = ""
+    # Join once at the end instead of re-copying the text for every page
+    pages = []
     for pdf in pdf_docs:
         pdf_reader = PdfReader(pdf)
         for page in pdf_reader.pages:
-            text += page.extract_text()
-    return text
+            pages.append(page.extract_text() or "")
+    return "".join(pages)
 
-# Function to split the text into chunks for vector store
+# Function to split the text into token-sized chunks for vector store
 def get_text_chunks(text):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=100)
     chunks = text_splitter.split_text(text)
     return chunks
 
 # Function to create and save a vector store from text chunks
 def get_vector_store(text_chunks):
-    embeddings = OpenAIEmbeddings()
     vector_store = FAISS.from_texts(text_chunks, embeddings)
-    vector_store.save_local(INDEX_PATH)
+    save_index(apply_index_config(vector_store, index_config), INDEX_PATH)
 
 # Function to create a conversational retrieval chain for answering questions
 def get_conversational_chain(vectorstore):
@@ -183,7 +195,7 @@ def get_conversational_chain(vectorstore):
     )
 
     llm = ChatOpenAI(model_name="gpt-4o", temperature=0.1)
-    retriever = vectorstore.as_retriever()
+    retriever = vectorstore.as_retriever(search_kwargs={"k": index_config.k})
 
     chain = ConversationalRetrievalChain.from_llm(
         llm=llm,
@@ -192,6 +204,11 @@ def get_conversational_chain(vectorstore):
     )
     return chain
 
+# Process-wide RAG engine shared by every session and rerun
+@st.cache_resource
+def get_rag_engine():
+    return RAGEngine(INDEX_PATH, embeddings, get_conversational_chain, index_config=index_config)
+
 # Function to handle login and role selection
 def handle_login():
     if 'logged_in' not in st.session_state:
@@ -240,12 +257,13 @@ def teacher_dashboard():
             with open(file_path, "wb") as f:
                 f.write(pdf.getbuffer())
         
-        # Process the PDFs and create the vector store
+        # Process the PDFs and update the vector store, embedding only new files
         if st.button("Submit & Process PDFs"):
-            raw_text = get_pdf_text(uploaded_files)
-            text_chunks = get_text_chunks(raw_text)
-            get_vector_store(text_chunks)
-            st.success("PDFs processed successfully! Knowledge base created.")
+            result = sync_index(
+                list_pdfs(UPLOAD_FOLDER), embeddings, get_text_chunks, INDEX_PATH,
+                index_config=index_config, chunking=CHUNKING
+            )
+            st.success(f"PDFs processed successfully! Added {len(result['added'])}, unchanged {result['unchanged']}.")
 
     # Display uploaded files
     uploaded_files_list = os.listdir(UPLOAD_FOLDER)
@@ -257,12 +275,20 @@ def teacher_dashboard():
                 for file in uploaded_files_list:
                     st.write(file)
     with col2:
-    # Button to delete all uploaded PDFs
+    # Button to delete all uploaded PDFs and their vectors
         if st.button("Delete All PDFs"):
             for file in uploaded_files_list:
                 os.remove(os.path.join(UPLOAD_FOLDER, file))
+            sync_index([], embeddings, get_text_chunks, INDEX_PATH, index_config=index_config, chunking=CHUNKING)
             st.success("All PDFs have been deleted successfully!")
 
+    # Delete a single PDF and only its vectors
+    file_to_delete = st.selectbox("Select a PDF to delete", ["Select PDF"] + uploaded_files_list)
+    if file_to_delete != "Select PDF" and st.button("Delete PDF"):
+        remove_pdf(os.path.join(UPLOAD_FOLDER, file_to_delete), embeddings, get_text_chunks, INDEX_PATH,
+                   index_config=index_config, chunking=CHUNKING)
+        st.success(f"{file_to_delete} has been deleted successfully!")
+
     if st.sidebar.button("Clear All Entries"):
         clear_all_entries()
     col1, col2 = st.columns([1, 1])  # Create two columns with equal width
@@ -291,10 +317,10 @@ def student_dashboard():
     st.write("You can ask questions based on the PDFs uploaded by the teacher.")
     
     # Check if vector store exists
-    if check_existing_index(INDEX_PATH):
-        # Load the existing index
-        vector_store = FAISS.load_local(INDEX_PATH,embeddings=embeddings,allow_dangerous_deserialization=True)
-        chain = get_conversational_chain(vector_store)
+    rag_engine = get_rag_engine()
+    if rag_engine.is_ready():
+        # Reuse the index and chain already loaded by the engine
+        vector_store, chain = rag_engine.get()
 
         # Initialize chat history if not present
         if "chat_history" not in st.session_state:
@@ -316,7 +342,6 @@ def student_dashboard():
             st.session_state.chat_history.append(HumanMessage(content=user_question))
             with st.chat_message("Human"):
                 st.markdown(user_question)
-            #calculate_similarities(user_question) 
             # Get the AI's response based on the uploaded PDFs
             response = chain.run(question=user_question,context=vector_store, chat_history=st.session_state.chat_history)
             st.session_state.chat_history.append(AIMessage(content=response))
@@ -0,0 +1,162 @@
+import threading
+import time
+from datetime import timezone
+
+import numpy as np
+
+from embedding_cache import normalize_question
+from faq_matcher import normalize_rows
+
+
+class SemanticAnswerCache:
+    """Serve answers to questions that are semantically close to ones answered before.
+
+    Entries hold the normalized question embedding, the stored answer and
+    where it came from ("rag" or "teacher"). A lookup returns the closest
+    live entry whose cosine distance is at most `max_distance`. Entries
+    expire after `ttl` seconds, and RAG answers are dropped when the FAISS
+    index they were generated from is replaced. `lookup_question` finds an
+    entry by its normalized question text, without an embedding.
+
+    `index_version`, if given, is a callable returning the version of the
+    index on disk. A RAG entry from any other version is never served, even
+    if no request has reloaded the index yet.
+    """
+
+    def __init__(self, max_distance=0.05, ttl=7 * 24 * 3600, max_entries=5000, index_version=None):
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.index_version = index_version
+
+        self._lock = threading.Lock()
+        self._entries = []
+        self._matrix = None
+        self._by_question = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, question, embedding, answer, source="rag", index_version=None, created_at=None):
+        vector = normalize_rows(embedding)[0]
+        entry = {
+            "question": question,
+            "answer": answer,
+            "source": source,
+            "index_version": index_version,
+            "expires_at": (created_at or time.time()) + self.ttl,
+        }
+        with self._lock:
+            self._entries.append(entry)
+            self._matrix = vector[None, :] if self._matrix is None else np.vstack([self._matrix, vector])
+            self._by_question[normalize_question(question)] = len(self._entries) - 1
+            if len(self._entries) > self.max_entries:
+                self._compact()
+
+    def lookup(self, embedding, max_distance=None):
+        """Return the matching entry with its "distance", or None on a miss.
+
+        `max_distance` overrides the configured one, e.g. to accept a looser
+        match when the LLM is unavailable.
+        """
+        max_distance = self.max_distance if max_distance is None else max_distance
+        with self._lock:
+            entries, matrix = self._entries, self._matrix
+        if matrix is None:
+            self.misses += 1
+            return None
+
+        scores = matrix @ normalize_rows(embedding)[0]
+        now = time.time()
+        for index in np.argsort(-scores)[:5]:
+            distance = 1.0 - float(scores[index])
+            if distance > max_distance:
+                break
+            entry = entries[index]
+            if entry["expires_at"] >= now and self._current(entry):
+                self.hits += 1
+                return dict(entry, distance=distance)
+
+        self.misses += 1
+        return None
+
+    def lookup_question(self, question):
+        """Return the newest live entry for exactly this question (distance 0), or None."""
+        with self._lock:
+            index = self._by_question.get(normalize_question(question))
+            entry = self._entries[index] if index is not None else None
+        if entry is not None and entry["expires_at"] >= time.time() and self._current(entry):
+            self.hits += 1
+            return dict(entry, distance=0.0)
+        self.misses += 1
+        return None
+
+    def _current(self, entry):
+        # Check a RAG entry against the index on disk; stale ones are dropped with the rest of their version
+        if self.index_version is None or entry["source"] != "rag":
+            return True
+        version = self.index_version()
+        if entry["index_version"] == version:
+            return True
+        self.invalidate(source="rag", keep_index_version=version)
+        return False
+
+    def invalidate(self, source=None, keep_index_version=None):
+        """Drop entries from `source` (all sources if None).
+
+        With `keep_index_version`, entries generated from that index version
+        are kept, so only answers built from an older index are dropped.
+        """
+        with self._lock:
+            keep = [
+                i for i, entry in enumerate(self._entries)
+                if not (
+                    (source is None or entry["source"] == source)
+                    and (keep_index_version is None or entry["index_version"] != keep_index_version)
+                )
+            ]
+            self._select(keep)
+
+    def _compact(self):
+        # Remove expired entries first, then the oldest ones beyond capacity
+        now = time.time()
+        keep = [i for i, entry in enumerate(self._entries) if entry["expires_at"] >= now]
+        self._select(keep[-self.max_entries:])
+
+    def _select(self, keep):
+        self._entries = [self._entries[i] for i in keep]
+        self._matrix = self._matrix[keep] if keep else None
+        self._by_question = {normalize_question(entry["question"]): i for i, entry in enumerate(self._entries)}
+
+    def load(self, rag_collection, teacher_answering_collection, index_version=None):
+        """Populate the cache from stored RAG answers and answered teacher questions."""
+        projection = {"_id": 0, "user_message": 1, "answer": 1, "teacher_answer": 1, "embedding": 1, "created_at": 1}
+
+        # Questions routed lexically may have been stored with a null embedding
+        for doc in rag_collection.find({"embedding": {"$ne": None}, "index_version": index_version}, projection):
+            self.add(doc["user_message"], doc["embedding"], doc["answer"], source="rag",
+                     index_version=index_version, created_at=_timestamp(doc))
+
+        for doc in teacher_answering_collection.find({"status": "answered", "embedding": {"$ne": None}}, projection):
+            self.add(doc["user_message"], doc["embedding"], doc["teacher_answer"], source="teacher",
+                     created_at=_timestamp(doc))
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._entries),
+        }
+
+
+# Function to read a document's creation time as a UNIX timestamp
+def _timestamp(doc):
+    created_at = doc.get("created_at")
+    if created_at is None:
+        return None
+    # pymongo returns naive datetimes that are in UTC
+    return created_at.replace(tzinfo=created_at.tzinfo or timezone.utc).timestamp()
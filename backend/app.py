@@ -1,51 +1,204 @@
-from flask import Flask, request, jsonify
+import json
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_pymongo import PyMongo
 from flask_cors import CORS
-from pymongo import MongoClient
-import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from langchain_openai import OpenAIEmbeddings
-from utils import process_question  # Assuming this is a custom utility function
-
-# Initialize OpenAI embeddings
-embeddings = OpenAIEmbeddings()
-
-# Connect to MongoDB
+from bson import ObjectId
+from pymongo import MongoClient, UpdateOne
+import os
+from datetime import datetime, timezone
+import threading
+from answer_cache import SemanticAnswerCache
+from chat_history import ChatHistoryStore
+from faq_matcher import FAQMatcher
+from faq_snapshot import load_faq_snapshot
+from faq_store import FAQFeed, faq_document, fetch_faq_bank, upsert_faqs
+from lexical_router import LexicalRouter
+from llm_limiter import LLMLimiter, Overloaded
+from metrics import (LLM_SHED, ROUTE_TOTAL, SIMILARITY_SCORE, registry, request_timings,
+                     start_request_timings, timed)
+from rag_engine import IndexVersionReader, read_index_version
+from sessions import SessionStore
+from teacher_clusters import TeacherClusters, ensure_cluster_indexes
+from teacher_queue import ChangeNotifier, ensure_indexes, list_clusters, wait_for_changes
+from utils import INDEX_PATH, embedding_batcher, embedding_cache, embeddings, process_question, rag_engine
+from write_behind import WriteBehindQueue
+
+# Connect to MongoDB; MONGO_DB picks another database, e.g. a scratch one for load tests
+MONGO_DB = os.getenv("MONGO_DB", "tutor")
 client = MongoClient('mongodb://localhost:27017/')
-db = client['tutor']
+db = client[MONGO_DB]
 COLLECTION_NAME = "openai_embedding"
 rag_collection = db['rag_answering']
 teacher_answering_collection = db['teacher_answering']
 
-# Function to embed the user question using OpenAI embeddings
+# RAG answers and teacher-queue questions are written in bulk by a background worker
+write_queue = WriteBehindQueue(
+    db,
+    max_batch=int(os.getenv("WRITE_BEHIND_BATCH", "100")),
+    flush_interval=float(os.getenv("WRITE_BEHIND_INTERVAL", "0.5")),
+    spill_path=os.getenv("WRITE_BEHIND_SPILL_PATH", "./write_behind_spill.jsonl") or None,
+    stamp_field="updated_at",
+)
+
+# Teacher dashboards page through pending questions and long-poll for changes
+ensure_indexes(teacher_answering_collection)
+teacher_queue_changes = ChangeNotifier()
+
+# Function to wake long-polling dashboards once queued questions reach MongoDB
+def notify_teacher_queue(collection_name, docs):
+    if collection_name == teacher_answering_collection.name:
+        teacher_queue_changes.notify()
+
+write_queue.on_flush(notify_teacher_queue)
+
+# Pending questions at least this similar to a cluster's first question join it, so the teacher answers
+# them once; clusters are kept in MongoDB and every worker syncs them every TEACHER_CLUSTER_SYNC_INTERVAL seconds
+teacher_clusters_collection = db['teacher_clusters']
+ensure_cluster_indexes(teacher_clusters_collection)
+teacher_clusters = TeacherClusters(
+    threshold=float(os.getenv("TEACHER_CLUSTER_THRESHOLD", "0.9")),
+    max_clusters=int(os.getenv("TEACHER_CLUSTER_MAX", "10000")),
+    collection=teacher_clusters_collection,
+    questions=teacher_answering_collection,
+    write_queue=write_queue,
+    sync_interval=float(os.getenv("TEACHER_CLUSTER_SYNC_INTERVAL", "1")),
+)
+teacher_clusters.load()
+
+# Function to move questions written after their cluster was answered or merged into an open cluster
+def settle_teacher_questions(collection_name, docs):
+    if collection_name == teacher_answering_collection.name:
+        teacher_clusters.settle(docs)
+
+write_queue.on_flush(settle_teacher_questions)
+
+# Per-session chat histories; set CHAT_HISTORY_PERSIST=0 to keep them in memory only
+chat_history = ChatHistoryStore(
+    max_messages=int(os.getenv("CHAT_HISTORY_MESSAGES", "50")),
+    max_sessions=int(os.getenv("CHAT_HISTORY_SESSIONS", "10000")),
+    collection=db['chat_history'] if os.getenv("CHAT_HISTORY_PERSIST", "1") != "0" else None,
+    write_queue=write_queue,
+)
+
+# Token budget for the earlier turns sent to the chain with each question
+CHAT_HISTORY_TOKENS = int(os.getenv("CHAT_HISTORY_TOKENS", "1000"))
+
+# Questions scoring above this cosine similarity to an FAQ are answered by RAG
+SIMILARITY_THRESHOLD = 0.8
+
+# Function to embed the user question using the cached OpenAI embeddings
 def embed_question(question):
-    return embeddings.embed_query(question)
+    with timed("embed"):
+        return embeddings.embed_query(question)
 
-# Function to fetch questions and embeddings from MongoDB
+# Function to fetch questions and embeddings from MongoDB (packed float32, or legacy arrays)
 def fetch_from_mongodb():
-    collection = db[COLLECTION_NAME]
-    documents = list(collection.find({}, {"_id": 0, "question": 1, "embedding": 1}))
-    
-    questions = [doc["question"] for doc in documents]
-    stored_embeddings = [doc["embedding"] for doc in documents]
-    return questions, np.array(stored_embeddings)
-
-# Fetch the questions and embeddings from MongoDB
-mongo_question, mongo_embed = fetch_from_mongodb()
+    return fetch_faq_bank(db[COLLECTION_NAME])
+
+# Load the FAQ bank from the on-disk snapshot, fetching only newer documents from MongoDB.
+# FAQ_SNAPSHOT_DTYPE=float16 or int8 shrinks it (check accuracy with `python faq_snapshot.py --check`);
+# an empty FAQ_SNAPSHOT_PATH reads everything from MongoDB instead.
+FAQ_SNAPSHOT_PATH = os.getenv("FAQ_SNAPSHOT_PATH", "./faq_snapshot")
+faq_loaded_at = datetime.now(timezone.utc)
+if FAQ_SNAPSHOT_PATH:
+    mongo_question, mongo_answers, mongo_embed, mongo_scales = load_faq_snapshot(
+        db[COLLECTION_NAME], FAQ_SNAPSHOT_PATH, dtype=os.getenv("FAQ_SNAPSHOT_DTYPE", "float32")
+    )
+else:
+    mongo_question, mongo_embed = fetch_from_mongodb()
+    mongo_answers, mongo_scales = None, None
+
+# Build the FAQ matcher once; set FAQ_MATCHER_BACKEND=faiss for very large FAQ banks
+faq_matcher = FAQMatcher(
+    mongo_question, mongo_embed, backend=os.getenv("FAQ_MATCHER_BACKEND", "numpy"),
+    scales=mongo_scales, normalized=bool(FAQ_SNAPSHOT_PATH)
+)
+
+# Exact and confident lexical FAQ matches are routed without an embedding call; LEXICAL_ROUTING=0 turns this off
+LEXICAL_ROUTING = os.getenv("LEXICAL_ROUTING", "1") != "0"
+# The snapshot carries the answer texts, so the router is built from it rather than another collection scan
+LEXICAL_MIN_OVERLAP = float(os.getenv("LEXICAL_MIN_OVERLAP", "0.8"))
+if mongo_answers is not None:
+    lexical_router = LexicalRouter(mongo_question, mongo_answers, min_overlap=LEXICAL_MIN_OVERLAP)
+else:
+    lexical_router = LexicalRouter.from_collection(db[COLLECTION_NAME], min_overlap=LEXICAL_MIN_OVERLAP)
+
+# Questions answered by a teacher join the FAQ bank (matcher, lexical router and the
+# openai_embedding collection) right away; FAQ_LEARNING=0 turns this off
+FAQ_LEARNING = os.getenv("FAQ_LEARNING", "1") != "0"
+faq_bank_lock = threading.Lock()
+
+# Every worker picks up the questions other workers added to the FAQ bank within FAQ_SYNC_INTERVAL seconds
+faq_feed = FAQFeed(db[COLLECTION_NAME], since=faq_loaded_at, interval=float(os.getenv("FAQ_SYNC_INTERVAL", "5")))
+
+# Semantic cache of previous RAG and teacher answers, keyed by question embedding; RAG answers are
+# checked against the index version on disk (re-read at most every INDEX_VERSION_CHECK_INTERVAL seconds)
+answer_cache = SemanticAnswerCache(
+    max_distance=float(os.getenv("ANSWER_CACHE_MAX_DISTANCE", "0.05")),
+    ttl=float(os.getenv("ANSWER_CACHE_TTL", str(7 * 24 * 3600))),
+    index_version=IndexVersionReader(INDEX_PATH, float(os.getenv("INDEX_VERSION_CHECK_INTERVAL", "2"))),
+)
+answer_cache.load(rag_collection, teacher_answering_collection, index_version=read_index_version(INDEX_PATH))
+
+# RAG answers are only valid for the index they were generated from
+rag_engine.on_reload(lambda version: answer_cache.invalidate(source="rag", keep_index_version=version))
+
+# At most LLM_MAX_CONCURRENT RAG answers are generated at once; the rest queue fairly per session,
+# and past LLM_MAX_QUEUE waiting or LLM_MAX_WAIT seconds they get a cached/FAQ answer or are deferred
+llm_limiter = LLMLimiter(
+    max_concurrent=int(os.getenv("LLM_MAX_CONCURRENT", "8")),
+    max_queue=int(os.getenv("LLM_MAX_QUEUE", "64")),
+    max_queued_per_user=int(os.getenv("LLM_MAX_QUEUED_PER_USER", "2")),
+    max_wait=float(os.getenv("LLM_MAX_WAIT", "10")),
+)
+
+# Looser cache distance accepted as a fallback when the LLM is saturated
+FALLBACK_MAX_DISTANCE = float(os.getenv("FALLBACK_MAX_DISTANCE", "0.15"))
 
 # Initialize the Flask app
 app = Flask(__name__)
 CORS(app)  # Enable CORS to allow requests from other domains
 
 # MongoDB configuration
-app.config["MONGO_URI"] = "mongodb://localhost:27017/tutor"
+app.config["MONGO_URI"] = f"mongodb://localhost:27017/{MONGO_DB}"
 mongo = PyMongo(app)
 
 # Get the collections
 users_collection = mongo.db.users
 
-# Message History (to store chat messages)
-message_history = []
+# Session tokens issued at login, shared by every worker through MongoDB and valid for SESSION_TTL seconds
+session_store = SessionStore(db['sessions'], ttl=int(os.getenv("SESSION_TTL", str(7 * 24 * 3600))))
+
+# Expose the embedding batcher histograms and cache counters on /metrics
+for histogram in (embedding_batcher.batch_sizes, embedding_batcher.wait_times, embedding_batcher.queue_depths,
+                  llm_limiter.wait_times):
+    registry.register(histogram)
+registry.add_collector(lambda: [
+    ("eduquery_embedding_cache_hits", "Embedding cache hits.", embedding_cache.hits),
+    ("eduquery_embedding_cache_misses", "Embedding cache misses.", embedding_cache.misses),
+    ("eduquery_answer_cache_hits", "Semantic answer cache hits.", answer_cache.hits),
+    ("eduquery_answer_cache_misses", "Semantic answer cache misses.", answer_cache.misses),
+    ("eduquery_embedding_queue_depth_current", "Texts waiting for an embedding batch.", embedding_batcher.stats()["queue_depth"]),
+    ("eduquery_write_behind_queued", "Documents waiting to be written to MongoDB.", write_queue.stats()["queued"]),
+    ("eduquery_write_behind_flushed", "Documents written to MongoDB by the write-behind worker.", write_queue.flushed),
+    ("eduquery_write_behind_spilled", "Documents spilled to disk while MongoDB was unavailable.", write_queue.spilled),
+    ("eduquery_write_behind_dropped", "Documents dropped because the spill file was full.", write_queue.dropped),
+    ("eduquery_chat_sessions", "Chat sessions with history held in memory.", chat_history.stats()["sessions"]),
+    ("eduquery_lexical_exact_matches", "Messages matched to an FAQ question by normalized text.", lexical_router.exact),
+    ("eduquery_lexical_matches", "Messages matched to an FAQ question by BM25 and word overlap.", lexical_router.lexical),
+    ("eduquery_lexical_misses", "Messages that fell through to the embedding path.", lexical_router.misses),
+    ("eduquery_llm_in_flight", "RAG answers being generated.", llm_limiter.stats()["in_flight"]),
+    ("eduquery_llm_queue_depth", "RAG requests waiting for an LLM slot.", llm_limiter.stats()["queued"]),
+    ("eduquery_faq_questions", "Questions in the FAQ matcher, including ones added since startup.", len(faq_matcher)),
+    ("eduquery_teacher_clusters_open", "Clusters of pending teacher questions open for new members.", len(teacher_clusters)),
+    ("eduquery_teacher_clusters_joined", "Escalated questions that joined an existing cluster.", teacher_clusters.joined),
+    ("eduquery_teacher_clusters_merged", "Duplicate clusters opened by two workers at once and merged.", teacher_clusters.merged),
+])
+
+# Collect a per-request timing breakdown when the client sends X-Debug-Timing
+@app.before_request
+def start_debug_timings():
+    start_request_timings(enabled=bool(request.headers.get("X-Debug-Timing")))
 
 # ------------------------- Routes -------------------------
 
@@ -62,9 +215,10 @@ def login():
     if not user:
         return jsonify({"message": "Invalid username or password"}), 400
 
-    # Successfully authenticated, return user data
+    # Successfully authenticated, return user data and a session token for the chat routes
     return jsonify({
         "message": "Login successful",
+        "session_id": session_store.issue(user['username']),
         "user": {
             "name": user['name'],
             "username": user['username'],
@@ -73,6 +227,178 @@ def login():
         }
     }), 200
 
+# Function to route a message that matched an FAQ question lexically, without embedding it
+def route_lexical(user_message, lexical):
+    cached = None
+    # A verbatim FAQ question with a stored answer is answered directly
+    if lexical["kind"] == "exact" and lexical["answer"]:
+        route = "faq"
+    else:
+        with timed("answer_cache"):
+            cached = answer_cache.lookup_question(user_message)
+        route = "cache" if cached is not None else "rag"
+    ROUTE_TOTAL.inc(route=route)
+
+    return {
+        "route": route,
+        "embedding": None,
+        "most_similar_question": lexical["question"],
+        "similarity_score": lexical["score"],
+        "cached": cached,
+        "lexical": lexical
+    }
+
+# Function to embed a message and decide whether the FAQ, the cache, RAG or the teacher answers it
+def route_message(user_message):
+    sync_faq_bank()
+
+    # Try the in-memory exact and BM25 indexes before paying for an embedding
+    if LEXICAL_ROUTING:
+        with timed("lexical_match"):
+            lexical = lexical_router.match(user_message)
+        if lexical is not None:
+            return route_lexical(user_message, lexical)
+
+    # Embed the user's question
+    return route_embedded(user_message, embed_question(user_message))
+
+# Function to route an embedded message by FAQ similarity and the semantic answer cache
+def route_embedded(user_message, user_embedding):
+    # Find the most similar FAQ question and its cosine similarity score
+    with timed("faq_match"):
+        most_similar_question, most_similar_index, similarity_score = faq_matcher.best(user_embedding)
+    SIMILARITY_SCORE.observe(similarity_score)
+    
+    # Serve repeat questions straight from the semantic answer cache
+    with timed("answer_cache"):
+        cached = answer_cache.lookup(user_embedding)
+    if cached is not None:
+        route = "cache"
+    # If the question is similar, use RAG for answering
+    elif similarity_score > SIMILARITY_THRESHOLD:
+        route = "rag"
+    else:
+        route = "teacher"
+    ROUTE_TOTAL.inc(route=route)
+
+    return {
+        "route": route,
+        "embedding": user_embedding,
+        "most_similar_question": most_similar_question,
+        "similarity_score": similarity_score,
+        "cached": cached,
+        "lexical": None
+    }
+
+# Function to format a stored FAQ answer as a bot response
+def faq_bot_response(routing):
+    return f"{routing['lexical']['answer']} (Similarity: {routing['similarity_score']})"
+
+# Function to format a cached answer as a bot response
+def cached_bot_response(routing):
+    cached = routing["cached"]
+    if cached["source"] == "teacher":
+        return f"Teacher Bot: {cached['answer']}"
+    return f"{cached['answer']} (Similarity: {routing['similarity_score']})"
+
+# Function to store a generated RAG answer and return the bot response
+def store_rag_answer(user_message, routing, answer):
+    index_version = rag_engine.version
+    embedding = routing["embedding"]
+    if embedding is None:
+        # Lexically routed questions were not embedded up front; the chain's retrieval has often cached it since
+        embedding = embeddings.cached_query(user_message)
+    if embedding is not None:
+        save_rag_answer(user_message, routing, answer, embedding, index_version)
+    else:
+        # Otherwise embed it in a batch off the request path, and store the answer when the vector arrives
+        embedding_batcher.submit(user_message).add_done_callback(
+            lambda future: save_rag_answer(user_message, routing, answer,
+                                           None if future.exception() else future.result(), index_version)
+        )
+
+    return f"{answer} (Similarity: {routing['similarity_score']})"
+
+# Function to queue a RAG answer for the RAG collection and, if its question was embedded, the answer cache
+def save_rag_answer(user_message, routing, answer, embedding, index_version):
+    document = {
+        "user_message": user_message,
+        "most_similar_question": routing["most_similar_question"],
+        "similarity_score": routing["similarity_score"],
+        "answer": answer,
+        "index_version": index_version,
+        "created_at": datetime.now(timezone.utc)
+    }
+    if embedding is not None:
+        document["embedding"] = embedding
+        answer_cache.add(user_message, embedding, answer, source="rag", index_version=index_version)
+    with timed("db_insert"):
+        write_queue.put(rag_collection.name, document)
+
+# Function to queue a question for the teacher and return the bot response
+def escalate_to_teacher(user_message, routing, session, deferred=False):
+    # If the question is not similar, queue it for the teacher_answering collection
+    question_id = ObjectId()
+    question = {
+        "_id": question_id,
+        # Repeats of a pending question share its cluster and are answered together
+        "cluster_id": teacher_clusters.assign(question_id, routing["embedding"]),
+        "user_message": user_message,
+        "session_id": session,  # So the teacher's answer reaches the student's history
+        "similarity_score": routing["similarity_score"],
+        "embedding": routing["embedding"],
+        "created_at": datetime.now(timezone.utc),
+        "status": "pending"  # Mark it as pending teacher's review
+    }
+    if deferred:
+        question["deferred"] = True  # RAG could have answered, but the LLM was saturated
+    with timed("db_insert"):
+        write_queue.put(teacher_answering_collection.name, question)
+
+    if deferred:
+        return "Teacher Bot: The assistant is busy right now, so your question has been passed to the teacher. We'll get back to you shortly."
+    return f"Teacher Bot: Your question has been submitted for review by the teacher. We'll get back to you shortly."
+
+# Function to answer without the LLM when it is saturated: a close cached or FAQ answer, else defer to the teacher
+def degraded_response(user_message, routing, session, reason):
+    fallback = None
+    if routing["embedding"] is not None:
+        fallback = answer_cache.lookup(routing["embedding"], max_distance=FALLBACK_MAX_DISTANCE)
+    faq_answer = lexical_router.answer_for(routing["most_similar_question"] or "")
+
+    if fallback is not None:
+        routing["degraded"] = "cache"
+        bot_response = cached_bot_response(dict(routing, cached=fallback))
+    elif faq_answer:
+        routing["degraded"] = "faq"
+        bot_response = f"{faq_answer} (Similarity: {routing['similarity_score']})"
+    else:
+        routing["degraded"] = "deferred"
+        bot_response = escalate_to_teacher(user_message, routing, session, deferred=True)
+    LLM_SHED.inc(reason=reason, fallback=routing["degraded"])
+    return bot_response
+
+# Function to identify the caller from the session token issued at login (X-Session-Id or session_id);
+# None without a valid token, so an unidentified caller gets neither history nor chain context
+def current_session():
+    data = request.get_json(silent=True) or {}
+    return session_store.resolve(request.headers.get("X-Session-Id") or data.get("session_id"))
+
+# Function to queue callers without a session by address, so they still can't take every LLM slot
+def limiter_key(session):
+    return session or f"addr:{request.remote_addr}"
+
+# Function to add the user and bot messages to the session's history
+def record_history(session, user_message, bot_response):
+    if session is None:
+        return
+    chat_history.append(session, "user", user_message)
+    chat_history.append(session, "bot", bot_response)
+
+# Function to format one Server-Sent Event
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 # API to handle sending messages and processing them
 @app.route("/api/send-message", methods=["POST"])
 def send_message():
@@ -81,60 +407,106 @@ def send_message():
     if not user_message:
         return jsonify({"error": "Message is required!"}), 400
     
-    # Embed the user's question
-    user_embedding = embed_question(user_message)
-    
-    # Calculate cosine similarity between the user message embedding and stored embeddings
-    similarities = cosine_similarity([user_embedding], mongo_embed)
-    
-    # Find the index of the most similar question
-    most_similar_index = np.argmax(similarities)
-    
-    # Retrieve the most similar question
-    most_similar_question = mongo_question[most_similar_index]
+    session = current_session()
+    routing = route_message(user_message)
     
-    # Get the cosine similarity score
-    similarity_score = similarities[0][most_similar_index]
-    
-    # If the question is similar, use RAG for answering
-    if similarity_score > 0.8:
-        answer = process_question(user_message)  # Assuming a function that generates an answer
-        
-        # Store the answer in the RAG collection for future reference
-        rag_collection.insert_one({
-            "user_message": user_message,
-            "most_similar_question": most_similar_question,
-            "similarity_score": similarity_score,
-            "answer": answer
-        })
-        
-        bot_response = f"{answer} (Similarity: {similarity_score})"
+    if routing["route"] == "faq":
+        bot_response = faq_bot_response(routing)
+    elif routing["route"] == "cache":
+        bot_response = cached_bot_response(routing)
+    elif routing["route"] == "rag":
+        turns = chat_history.recent_turns(session, CHAT_HISTORY_TOKENS) if session else []
+        try:
+            with timed("llm_queue"):
+                llm_limiter.acquire(limiter_key(session))
+        except Overloaded as e:
+            bot_response = degraded_response(user_message, routing, session, e.reason)
+        else:
+            try:
+                answer = process_question(user_message, chat_history=turns)  # Assuming a function that generates an answer
+            finally:
+                llm_limiter.release()
+            bot_response = store_rag_answer(user_message, routing, answer)
     else:
-        # If the question is not similar, store it in the teacher_answering collection
-        teacher_answering_collection.insert_one({
-            "user_message": user_message,
-            "similarity_score": similarity_score,
-            "status": "pending"  # Mark it as pending teacher's review
-        })
-        
-        bot_response = f"Teacher Bot: Your question has been submitted for review by the teacher. We'll get back to you shortly."
-
-    # Add the user and bot messages to the history (if applicable)
-    message_history.append({"type": "user", "content": user_message})
-    message_history.append({"type": "bot", "content": bot_response})
-
-    # Limit the history size (optional)
-    if len(message_history) > 50:
-        message_history.pop(0)  # Keep the history to 50 messages for performance
+        bot_response = escalate_to_teacher(user_message, routing, session)
 
-    return jsonify({
+    record_history(session, user_message, bot_response)
+
+    response = {
         "bot_response": bot_response,
-        "similarity_score": similarity_score
-    })
+        "similarity_score": routing["similarity_score"],
+        "cache_hit": routing["cached"] is not None,
+        "lexical_match": routing["lexical"]["kind"] if routing["lexical"] else None,
+        "degraded": routing.get("degraded")
+    }
+    timings = request_timings()
+    if timings is not None:
+        response["timings_ms"] = timings
 
-# Route for the teacher to provide an answer to a pending question
-from bson import ObjectId
+    return jsonify(response)
 
+# Streaming variant of send-message: sends the routing decision first, then the answer tokens as Server-Sent Events
+@app.route("/api/send-message/stream", methods=["POST"])
+def send_message_stream():
+    user_message = request.json.get("message")
+    
+    if not user_message:
+        return jsonify({"error": "Message is required!"}), 400
+    
+    session = current_session()
+    routing = route_message(user_message)
+    summary = {
+        "route": routing["route"],
+        "similarity_score": routing["similarity_score"],
+        "cache_hit": routing["cached"] is not None,
+        "lexical_match": routing["lexical"]["kind"] if routing["lexical"] else None
+    }
+
+    def generate():
+        yield sse_event("route", summary)
+
+        if routing["route"] == "faq":
+            bot_response = faq_bot_response(routing)
+        elif routing["route"] == "cache":
+            bot_response = cached_bot_response(routing)
+        elif routing["route"] == "rag":
+            turns = chat_history.recent_turns(session, CHAT_HISTORY_TOKENS) if session else []
+            try:
+                with timed("llm_queue"):
+                    llm_limiter.acquire(limiter_key(session))
+            except Overloaded as e:
+                bot_response = degraded_response(user_message, routing, session, e.reason)
+            else:
+                try:
+                    # Build the index on first use, otherwise stream from the shared engine
+                    if rag_engine.is_ready():
+                        tokens = rag_engine.stream(user_message, chat_history=turns)
+                    else:
+                        tokens = [process_question(user_message, chat_history=turns)]
+                    answer = []
+                    for token in tokens:
+                        answer.append(token)
+                        yield sse_event("token", {"token": token})
+                finally:
+                    llm_limiter.release()
+                bot_response = store_rag_answer(user_message, routing, "".join(answer))
+        else:
+            bot_response = escalate_to_teacher(user_message, routing, session)
+
+        record_history(session, user_message, bot_response)
+        done = dict(summary, bot_response=bot_response, degraded=routing.get("degraded"))
+        timings = request_timings()
+        if timings is not None:
+            done["timings_ms"] = timings
+        yield sse_event("done", done)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Route for the teacher to answer a pending question and every question clustered with it
 @app.route('/api/teacher-answering/<question_id>', methods=['PUT'])
 def teacher_answer(question_id):
     # Convert the string question_id to ObjectId
@@ -147,39 +519,112 @@ def teacher_answer(question_id):
     teacher_answer = request.json.get('teacher_answer')
     if not teacher_answer:
         return jsonify({"error": "Teacher's answer is required"}), 400
-    
-    # Update the teacher's answer and set the status to 'answered'
-    result = teacher_answering_collection.update_one(
-        {"_id": question_id, "status": "pending"},
-        {"$set": {"teacher_answer": teacher_answer, "status": "answered"}}
-    )
 
-    if result.matched_count == 0:
+    question = teacher_answering_collection.find_one({"_id": question_id}, {"cluster_id": 1})
+    if question is None:
         return jsonify({"error": "Question not found or already answered"}), 404
 
-    # Send the teacher's answer to the student's chat
-    bot_response = f"Teacher Bot: {teacher_answer}"
-
-    # Add the teacher's answer to the chat history
-    message_history.append({"type": "bot", "content": bot_response})
-
-    return jsonify({"message": "Answer updated and sent to student", "bot_response": bot_response}), 200
+    # Close the cluster first, in every worker, so later repeats start a new one instead of joining an
+    # answered one; questions that joined it but are written after the update below are settled elsewhere
+    teacher_clusters.close(question.get("cluster_id"))
 
+    # Mark every pending question in the cluster answered in one update, tagged so they can be read back
+    answer_id = ObjectId()
+    update = answer_update(question, teacher_answer, answer_id)
+    if teacher_answering_collection.update_many(*update).modified_count == 0:
+        return jsonify({"error": "Question not found or already answered"}), 404
 
-from flask import jsonify
-from bson import ObjectId
+    answered = list(teacher_answering_collection.find({"answer_id": answer_id}, ANSWERED_FIELDS).sort("_id", 1))
+    bot_response = deliver_teacher_answer(answered, teacher_answer)
+
+    return jsonify({"message": "Answer updated and sent to students", "bot_response": bot_response,
+                    "answered": len(answered)}), 200
+
+# Fields of the answered questions needed to deliver the teacher's answer
+ANSWERED_FIELDS = {"user_message": 1, "embedding": 1, "session_id": 1}
+
+# Function to build the update_many arguments answering a question's whole cluster
+def answer_update(question, teacher_answer, answer_id):
+    query = {"cluster_id": question["cluster_id"]} if question.get("cluster_id") else {"_id": question["_id"]}
+    query["status"] = "pending"
+    return query, {"$set": {
+        "teacher_answer": teacher_answer,
+        "status": "answered",
+        "answer_id": answer_id,
+        "updated_at": datetime.now(timezone.utc)
+    }}
+
+# Function to add a teacher-answered question to the FAQ bank, in MongoDB and in memory
+def add_to_faq_bank(question, embedding, answer):
+    with faq_bank_lock:
+        if question in lexical_router:
+            return False
+        upsert_faqs(db[COLLECTION_NAME], [faq_document(question, embedding, answer)])
+        faq_matcher.add(question, embedding)
+        lexical_router.add(question, answer)
+    return True
+
+# Function to add the FAQ questions other workers learned since the last poll
+def sync_faq_bank():
+    for question, embedding, answer in faq_feed.poll():
+        with faq_bank_lock:
+            if question not in lexical_router:
+                faq_matcher.add(question, embedding)
+                lexical_router.add(question, answer)
+
+# Function to publish a teacher's answer once its questions are marked answered
+def deliver_teacher_answer(questions, teacher_answer):
+    teacher_queue_changes.notify()
+
+    # Send the teacher's answer to the students' chats
+    bot_response = f"Teacher Bot: {teacher_answer}"
 
+    embedded = []
+    for n, question in enumerate(questions):
+        # Questions routed lexically were queued without an embedding; store it so the cache reloads them
+        embedding = question.get("embedding")
+        if embedding is None:
+            embedding = embed_question(question["user_message"])
+            embedded.append(UpdateOne({"_id": question["_id"]}, {"$set": {"embedding": embedding}}))
+
+        # Let repeats of every wording be answered from the cache
+        answer_cache.add(question["user_message"], embedding, teacher_answer, source="teacher")
+
+        # Let the cluster's first question route like any other FAQ from now on, without reloading the bank
+        if FAQ_LEARNING and n == 0:
+            add_to_faq_bank(question["user_message"], embedding, teacher_answer)
+
+        # Add the teacher's answer to the student's chat history, if they were logged in
+        if question.get("session_id"):
+            chat_history.append(question["session_id"], "bot", bot_response)
+    if embedded:
+        teacher_answering_collection.bulk_write(embedded, ordered=False)
+    return bot_response
+
+# Route to page through clusters of pending questions: ?after=<next_cursor>&limit=<n>
 @app.route('/api/teacher-answering', methods=['GET'])
 def get_teacher_answering():
-    # Fetch only pending questions
-    data = list(teacher_answering_collection.find({"status": "pending"}))  # No field projection here to fetch all fields
+    # Taken before the query, so the change feed picks up anything written during it
+    changes_cursor = int(datetime.now(timezone.utc).timestamp() * 1000)
+    after = request.args.get("after")
+    if after and not ObjectId.is_valid(after):
+        return jsonify({"error": "Invalid cursor"}), 400
+    limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+
+    clusters, next_cursor = list_clusters(teacher_clusters_collection, teacher_answering_collection, after, limit)
 
-    # Convert ObjectId to string for serialization
-    for item in data:
-        item['_id'] = str(item['_id'])  # Convert the ObjectId to string
+    return jsonify({"clusters": clusters, "next_cursor": next_cursor, "changes_cursor": changes_cursor})
 
-    print(data)  # Log the data to verify structure
-    return jsonify(data)
+# Route to long-poll for new and answered questions: ?since=<changes_cursor>&timeout=<seconds>
+@app.route('/api/teacher-answering/changes', methods=['GET'])
+def get_teacher_answering_changes():
+    since = request.args.get("since", type=int)
+    if since is None:
+        return jsonify({"error": "since is required"}), 400
+    timeout = min(max(request.args.get("timeout", 25.0, type=float), 0.0), 30.0)
+
+    changes, cursor = wait_for_changes(teacher_answering_collection, teacher_queue_changes, since, timeout)
+    return jsonify({"changes": changes, "cursor": cursor})
 
 # Registration Route
 @app.route('/register', methods=['POST'])
@@ -211,10 +656,39 @@ def register():
 
     return jsonify({"message": "Registration successful"}), 201
 
-# Route to get message history
+# Route to inspect the cache hit/miss counters and embedding batch statistics
+@app.route("/api/cache-stats", methods=["GET"])
+def cache_stats():
+    return jsonify({
+        "embedding_cache": embedding_cache.stats(),
+        "embedding_batcher": embedding_batcher.stats(),
+        "answer_cache": answer_cache.stats(),
+        "lexical_router": lexical_router.stats(),
+        "llm_limiter": llm_limiter.stats(),
+        "teacher_clusters": teacher_clusters.stats()
+    })
+
+# Route exposing the metrics in the Prometheus text format
+@app.route("/metrics", methods=["GET"])
+def metrics():
+    return Response(registry.render(), mimetype="text/plain; version=0.0.4")
+
+# Route to page back through the caller's message history: ?before=<next_before>&limit=<n>
 @app.route("/api/get-history", methods=["GET"])
 def get_history():
-    return jsonify({"messages": message_history})
+    before = request.args.get("before")
+    if before and not ObjectId.is_valid(before):
+        return jsonify({"error": "Invalid cursor"}), 400
+    limit = min(max(request.args.get("limit", 20, type=int), 1), 200)
+    session = current_session()
+    if session is None:
+        return jsonify({"error": "Login required"}), 401
+
+    messages, next_before = chat_history.page(session, ObjectId(before) if before else None, limit)
+    return jsonify({
+        "messages": [dict(message, _id=str(message["_id"])) for message in messages],
+        "next_before": str(next_before) if next_before else None
+    })
 
 # ------------------------- Main -------------------------
 if __name__ == "__main__":
@@ -0,0 +1,295 @@
+import asyncio
+import json
+from contextlib import asynccontextmanager
+from datetime import date, datetime, timezone
+from email.utils import format_datetime
+
+from bson import ObjectId
+from pymongo import AsyncMongoClient
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+import app as backend
+from llm_limiter import Overloaded
+from metrics import request_timings, start_request_timings, timed
+from teacher_queue import alist_clusters
+from utils import embeddings, process_question, rag_engine
+
+# The FAQ bank, caches, chat histories, write-behind queue and LLM limiter are shared with the Flask
+# app (importing it loads them); only the requests' own I/O moves to the event loop:
+# MongoDB through AsyncMongoClient, embeddings through the batcher's futures, the chain through ainvoke
+mongo = None
+
+
+# Function to reach the app's database through the async driver opened at startup
+def database():
+    return mongo[backend.MONGO_DB]
+
+
+@asynccontextmanager
+async def lifespan(app):
+    global mongo
+    mongo = AsyncMongoClient('mongodb://localhost:27017/')
+    # Load the FAISS index and build the chain before taking traffic
+    await asyncio.to_thread(rag_engine.is_ready)
+    try:
+        yield
+    finally:
+        await mongo.close()
+
+
+# Function to encode what Flask's jsonify would: datetimes as HTTP dates, ObjectIds as strings
+def _json_default(value):
+    if isinstance(value, datetime):
+        return format_datetime(value.astimezone(timezone.utc), usegmt=True)
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class FlaskCompatibleJSONResponse(JSONResponse):
+    """JSON response that serializes the same values, the same way, as the Flask routes."""
+
+    def render(self, content):
+        return json.dumps(content, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+
+# Function to build a JSON response the way the Flask routes' jsonify does
+def jsonify(content, status_code=200):
+    return FlaskCompatibleJSONResponse(content, status_code=status_code)
+
+
+# Function to read a JSON request body, or {} if there is none
+async def request_json(request):
+    try:
+        return await request.json() or {}
+    except ValueError:
+        return {}
+
+
+# Function to identify the caller from the session token issued at login, as the Flask app does;
+# a token not cached in this worker is looked up in MongoDB off the event loop
+async def current_session(request, data):
+    token = request.headers.get("X-Session-Id") or data.get("session_id")
+    return backend.session_store.cached(token) or await asyncio.to_thread(backend.session_store.resolve, token)
+
+
+# Function to queue callers without a session by address, like the Flask app's limiter_key
+def limiter_key(request, session):
+    return session or f"addr:{request.client.host if request.client else None}"
+
+
+# Function to read a bounded integer query parameter, like Flask's request.args.get(..., type=int)
+def int_param(request, name, default, low, high):
+    try:
+        value = int(request.query_params.get(name, default))
+    except ValueError:
+        value = default
+    return min(max(value, low), high)
+
+
+# Function to embed the user question without holding a thread while the batch is in flight
+async def embed_question(question):
+    with timed("embed"):
+        return await embeddings.aembed_query(question)
+
+
+# Function to embed a message and decide whether the FAQ, the cache, RAG or the teacher answers it
+async def route_message(user_message):
+    # Reading the FAQ questions other workers added is blocking I/O
+    if backend.faq_feed.due():
+        await asyncio.to_thread(backend.sync_faq_bank)
+    if backend.LEXICAL_ROUTING:
+        with timed("lexical_match"):
+            lexical = backend.lexical_router.match(user_message)
+        if lexical is not None:
+            return backend.route_lexical(user_message, lexical)
+    return backend.route_embedded(user_message, await embed_question(user_message))
+
+
+# Function to generate a RAG answer on the event loop
+async def answer_question(user_message, turns):
+    # The first question builds the index from the PDFs, which is blocking work; so is loading it
+    _, chain = await rag_engine.aget()
+    if chain is None:
+        return await asyncio.to_thread(process_question, user_message, chat_history=turns)
+    return await rag_engine.arun(user_message, chat_history=turns)
+
+
+# ------------------------- Routes -------------------------
+
+# Login Route
+async def login(request):
+    data = await request_json(request)
+
+    # Check if both username and password exist in MongoDB
+    user = await database().users.find_one({"username": data.get("username"), "password": data.get("password")})
+    if not user:
+        return jsonify({"message": "Invalid username or password"}, 400)
+
+    return jsonify({
+        "message": "Login successful",
+        "session_id": await asyncio.to_thread(backend.session_store.issue, user['username']),
+        "user": {
+            "name": user['name'],
+            "username": user['username'],
+            "role": user['role'],
+            "class_name": user.get('class_name', None)
+        }
+    })
+
+
+# Registration Route
+async def register(request):
+    data = await request_json(request)
+    username = data.get("username")
+    is_student = data.get("isStudent")
+
+    # Check if username already exists
+    if await database().users.find_one({"username": username}):
+        return jsonify({"message": "Username already exists"}, 400)
+
+    await database().users.insert_one({
+        "name": data.get("name"),
+        "username": username,
+        "password": data.get("password"),  # Store password in plain text (not recommended for production)
+        "role": "student" if is_student else "teacher",
+        "class_name": data.get("className") if is_student else None
+    })
+    return jsonify({"message": "Registration successful"}, 201)
+
+
+# API to handle sending messages and processing them
+async def send_message(request):
+    start_request_timings(enabled=bool(request.headers.get("X-Debug-Timing")))
+    data = await request_json(request)
+    user_message = data.get("message")
+
+    if not user_message:
+        return jsonify({"error": "Message is required!"}, 400)
+
+    session = await current_session(request, data)
+    routing = await route_message(user_message)
+
+    if routing["route"] == "faq":
+        bot_response = backend.faq_bot_response(routing)
+    elif routing["route"] == "cache":
+        bot_response = backend.cached_bot_response(routing)
+    elif routing["route"] == "rag":
+        # A session not held in memory is loaded from MongoDB; keep that off the event loop
+        turns = []
+        if session is not None:
+            turns = await asyncio.to_thread(backend.chat_history.recent_turns, session, backend.CHAT_HISTORY_TOKENS)
+        try:
+            with timed("llm_queue"):
+                await backend.llm_limiter.acquire_async(limiter_key(request, session))
+        except Overloaded as e:
+            await asyncio.to_thread(backend.teacher_clusters.sync)
+            bot_response = backend.degraded_response(user_message, routing, session, e.reason)
+        else:
+            try:
+                answer = await answer_question(user_message, turns)
+            finally:
+                backend.llm_limiter.release()
+            bot_response = backend.store_rag_answer(user_message, routing, answer)
+    else:
+        # Read clusters opened in other workers off the event loop; assigning the question is then in memory
+        await asyncio.to_thread(backend.teacher_clusters.sync)
+        bot_response = backend.escalate_to_teacher(user_message, routing, session)
+
+    await asyncio.to_thread(backend.record_history, session, user_message, bot_response)
+
+    response = {
+        "bot_response": bot_response,
+        "similarity_score": routing["similarity_score"],
+        "cache_hit": routing["cached"] is not None,
+        "lexical_match": routing["lexical"]["kind"] if routing["lexical"] else None,
+        "degraded": routing.get("degraded")
+    }
+    timings = request_timings()
+    if timings is not None:
+        response["timings_ms"] = timings
+    return jsonify(response)
+
+
+# Route for the teacher to answer a pending question and every question clustered with it
+async def teacher_answer(request):
+    question_id = request.path_params["question_id"]
+    if not ObjectId.is_valid(question_id):
+        return jsonify({"error": "Invalid question ID"}, 400)
+
+    teacher_answer = (await request_json(request)).get('teacher_answer')
+    if not teacher_answer:
+        return jsonify({"error": "Teacher's answer is required"}, 400)
+
+    collection = database()[backend.teacher_answering_collection.name]
+    question = await collection.find_one({"_id": ObjectId(question_id)}, {"cluster_id": 1})
+    if question is None:
+        return jsonify({"error": "Question not found or already answered"}, 404)
+
+    # Same steps as the Flask route: close the cluster, answer it in one update, read the members back
+    await asyncio.to_thread(backend.teacher_clusters.close, question.get("cluster_id"))
+    answer_id = ObjectId()
+    result = await collection.update_many(*backend.answer_update(question, teacher_answer, answer_id))
+    if result.modified_count == 0:
+        return jsonify({"error": "Question not found or already answered"}, 404)
+
+    answered = await collection.find({"answer_id": answer_id}, backend.ANSWERED_FIELDS).sort("_id", 1).to_list()
+    bot_response = await asyncio.to_thread(backend.deliver_teacher_answer, answered, teacher_answer)
+    return jsonify({"message": "Answer updated and sent to students", "bot_response": bot_response,
+                    "answered": len(answered)})
+
+
+# Route to page through clusters of pending questions: ?after=<next_cursor>&limit=<n>
+async def get_teacher_answering(request):
+    # Taken before the query, so the change feed picks up anything written during it
+    changes_cursor = int(datetime.now(timezone.utc).timestamp() * 1000)
+    after = request.query_params.get("after")
+    if after and not ObjectId.is_valid(after):
+        return jsonify({"error": "Invalid cursor"}, 400)
+    limit = int_param(request, "limit", 50, 1, 200)
+
+    clusters, next_cursor = await alist_clusters(
+        database()[backend.teacher_clusters_collection.name], database()[backend.teacher_answering_collection.name],
+        after, limit
+    )
+    return jsonify({"clusters": clusters, "next_cursor": next_cursor, "changes_cursor": changes_cursor})
+
+
+# Route to page back through the caller's message history: ?before=<next_before>&limit=<n>
+async def get_history(request):
+    before = request.query_params.get("before")
+    if before and not ObjectId.is_valid(before):
+        return jsonify({"error": "Invalid cursor"}, 400)
+    limit = int_param(request, "limit", 20, 1, 200)
+    session = await current_session(request, {})
+    if session is None:
+        return jsonify({"error": "Login required"}, 401)
+
+    messages, next_before = await asyncio.to_thread(
+        backend.chat_history.page, session, ObjectId(before) if before else None, limit
+    )
+    return jsonify({
+        "messages": [dict(message, _id=str(message["_id"])) for message in messages],
+        "next_before": str(next_before) if next_before else None
+    })
+
+
+# ASGI app: uvicorn asgi:app (from the backend folder)
+app = Starlette(
+    routes=[
+        Route("/login", login, methods=["POST"]),
+        Route("/register", register, methods=["POST"]),
+        Route("/api/send-message", send_message, methods=["POST"]),
+        Route("/api/teacher-answering/{question_id}", teacher_answer, methods=["PUT"]),
+        Route("/api/teacher-answering", get_teacher_answering, methods=["GET"]),
+        Route("/api/get-history", get_history, methods=["GET"]),
+    ],
+    middleware=[Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])],
+    lifespan=lifespan,
+)
@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+# The benchmarks never call OpenAI; utils still builds an OpenAI client at import time
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+
+from langchain_community.vectorstores import FAISS  # noqa: E402
+
+from fakes import FakeStreamingChatModel, HashingFakeEmbeddings  # noqa: E402
+from faq_eval import calculate_similarities  # noqa: E402
+from faq_matcher import FAQMatcher  # noqa: E402
+from ingest import iter_chunks, iter_pdf_pages, list_pdfs  # noqa: E402
+from utils import get_conversational_chain, get_pdf_text, get_text_chunks  # noqa: E402
+
+
+# Function to time `fn` and summarize the runs in milliseconds
+def measure(fn, repeat=5, warmup=1):
+    for _ in range(warmup):
+        fn()
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        runs.append((time.perf_counter() - started) * 1000)
+    runs.sort()
+    return {
+        "median_ms": statistics.median(runs),
+        "min_ms": runs[0],
+        "p95_ms": runs[min(len(runs) - 1, int(len(runs) * 0.95))],
+        "runs": len(runs),
+    }
+
+
+# Function to build a synthetic FAQ bank of unit-length embeddings
+def synthetic_bank(size, dim, seed=0):
+    bank = np.random.default_rng(seed).standard_normal((size, dim), dtype=np.float32)
+    bank /= np.linalg.norm(bank, axis=1, keepdims=True)
+    return [f"synthetic question {i}" for i in range(size)], bank
+
+
+def bench_similarity(sizes, dim, repeat, eval_rows, max_eval_bank):
+    results = []
+    queries = np.random.default_rng(1).standard_normal((eval_rows, dim))
+    for size in sizes:
+        questions, bank = synthetic_bank(size, dim)
+        query = queries[0]
+
+        # The original send_message path: sklearn over a float64 matrix, then argmax
+        try:
+            from sklearn.metrics.pairwise import cosine_similarity
+
+            bank64 = bank.astype(np.float64)
+            results.append(dict(name="faq_sklearn_cosine", size=size, **measure(
+                lambda: np.argmax(cosine_similarity([query], bank64)), repeat)))
+            del bank64
+        except ImportError:
+            pass
+
+        matcher = FAQMatcher(questions, bank)
+        results.append(dict(name="faq_matcher_best", size=size, **measure(lambda: matcher.best(query), repeat)))
+        results.append(dict(name="faq_matcher_batch", size=size, batch=eval_rows, **measure(
+            lambda: matcher.search(queries, k=3), repeat)))
+
+        faiss_matcher = FAQMatcher(questions, bank, backend="faiss")
+        results.append(dict(name="faq_matcher_faiss", size=size, **measure(lambda: faiss_matcher.best(query), repeat)))
+
+        if size <= max_eval_bank:
+            csv_questions = [f"csv question {i}" for i in range(eval_rows)]
+            results.append(dict(name="calculate_similarities", size=size, batch=eval_rows, **measure(
+                lambda: calculate_similarities(csv_questions, queries, questions, bank), max(1, repeat // 2))))
+    return results
+
+
+def bench_retrieval(sizes, dim, repeat, index_path):
+    results = []
+    embedder = HashingFakeEmbeddings(dim)
+
+    # The saved index, if it was built with embeddings of the same dimension
+    if os.path.exists(os.path.join(index_path, "index.faiss")):
+        store = FAISS.load_local(index_path, embeddings=embedder, allow_dangerous_deserialization=True)
+        if store.index.d == dim:
+            results.append(dict(name="faiss_saved_index", size=store.index.ntotal, **measure(
+                lambda: store.similarity_search("what is line coding", k=4), repeat)))
+
+    for size in sizes:
+        _, bank = synthetic_bank(size, dim, seed=2)
+        texts = [f"chunk {i}" for i in range(size)]
+        store = FAISS.from_embeddings(list(zip(texts, bank.tolist())), embedder)
+        results.append(dict(name="faiss_synthetic", size=size, **measure(
+            lambda: store.similarity_search("what is line coding", k=4), repeat)))
+
+        # One full RAG answer with the fake LLM, so chain overhead is tracked too
+        if size == sizes[0]:
+            chain = get_conversational_chain(store, llm=FakeStreamingChatModel(streaming=False))
+            results.append(dict(name="rag_chain_fake_llm", size=size, **measure(
+                lambda: chain.invoke({"question": "what is line coding", "chat_history": []}), repeat)))
+    return results
+
+
+def bench_ingestion(pdf_folder, corpus_scales, repeat):
+    results = []
+    paths = list_pdfs(pdf_folder)
+    if not paths:
+        return results
+
+    results.append(dict(name="get_pdf_text", size=len(paths), **measure(lambda: get_pdf_text(paths), repeat, warmup=0)))
+    results.append(dict(name="ingest_pages_and_chunks", size=len(paths), **measure(
+        lambda: sum(1 for _ in iter_chunks(iter_pdf_pages(paths), get_text_chunks)), repeat, warmup=0)))
+
+    text = get_pdf_text(paths)
+    for scale in corpus_scales:
+        corpus = text * scale
+        results.append(dict(name="get_text_chunks", size=len(corpus), **measure(
+            lambda: get_text_chunks(corpus), repeat, warmup=0)))
+    return results
+
+
+# Function to identify the commit the benchmark ran against
+def current_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+# Function to print each benchmark's median next to a previous run's
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = {(r["name"], r["size"]): r for r in json.load(f)["results"]}
+    for result in results:
+        old = baseline.get((result["name"], result["size"]))
+        if old:
+            ratio = result["median_ms"] / old["median_ms"] if old["median_ms"] else float("inf")
+            print(f"{result['name']:28} {result['size']:>10} {old['median_ms']:10.3f} -> {result['median_ms']:10.3f} ms  x{ratio:.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the retrieval and ingestion hot paths.")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="synthetic FAQ bank / corpus sizes")
+    parser.add_argument("--dim", type=int, default=1536, help="embedding dimension (OpenAI ada-002 is 1536)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--eval-rows", type=int, default=10, help="CSV questions for calculate_similarities")
+    parser.add_argument("--max-eval-bank", type=int, default=100000, help="largest bank for calculate_similarities")
+    parser.add_argument("--corpus-scales", default="1,4,16", help="copies of the PDF text to chunk")
+    parser.add_argument("--pdf-folder", default="./teacher_pdfs")
+    parser.add_argument("--index-path", default="./faiss_index")
+    parser.add_argument("--only", choices=["similarity", "retrieval", "ingestion"])
+    parser.add_argument("--output", help="results file (default bench_results/<commit>.json)")
+    parser.add_argument("--compare", help="previous results file to compare against")
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    results = []
+    if args.only in (None, "similarity"):
+        results += bench_similarity(sizes, args.dim, args.repeat, args.eval_rows, args.max_eval_bank)
+    if args.only in (None, "retrieval"):
+        results += bench_retrieval(sizes, args.dim, args.repeat, args.index_path)
+    if args.only in (None, "ingestion"):
+        results += bench_ingestion(args.pdf_folder, [int(s) for s in args.corpus_scales.split(",")], args.repeat)
+
+    for result in results:
+        print(f"{result['name']:28} {result['size']:>10} median {result['median_ms']:10.3f} ms  p95 {result['p95_ms']:10.3f} ms")
+
+    commit = current_commit()
+    output = args.output or os.path.join("bench_results", f"{commit}.json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "timestamp": time.time(),
+            "python": sys.version.split()[0],
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "config": vars(args),
+            "results": results,
+        }, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+
+# Characters per token assumed when tiktoken's encoding cannot be loaded (about right for English)
+CHARS_PER_TOKEN = 4
+
+
+@lru_cache(maxsize=1)
+def _encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        return None
+
+
+# Function to tell whether token counts are exact (tiktoken) or estimated from the length
+def exact_token_counts():
+    return _encoding() is not None
+
+
+# Function to count the prompt tokens a text uses (CHARS_PER_TOKEN characters per token without tiktoken)
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+class ChatHistoryStore:
+    """Per-session chat histories kept in fixed-size ring buffers.
+
+    Each session keeps its last `max_messages` messages in a deque, and at
+    most `max_sessions` sessions stay in memory, least recently used first
+    out. With a MongoDB `collection`, messages are also written through
+    `write_queue`; a session that is not in memory is reloaded from its most
+    recent messages, and pages older than the buffer are read from MongoDB.
+    """
+
+    def __init__(self, max_messages=50, max_sessions=10000, collection=None, write_queue=None):
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.collection = collection
+        self.write_queue = write_queue
+
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        if collection is not None:
+            collection.create_index([("session_id", ASCENDING), ("_id", ASCENDING)])
+
+    def _buffer(self, session_id):
+        with self._lock:
+            buffer = self._sessions.get(session_id)
+            if buffer is not None:
+                self._sessions.move_to_end(session_id)
+                return buffer
+
+        buffer = deque(maxlen=self.max_messages)
+        if self.collection is not None:
+            recent = self.collection.find({"session_id": session_id}, {"session_id": 0, "updated_at": 0})
+            buffer.extend(reversed(list(recent.sort("_id", DESCENDING).limit(self.max_messages))))
+
+        with self._lock:
+            buffer = self._sessions.setdefault(session_id, buffer)
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+        return buffer
+
+    def append(self, session_id, message_type, content):
+        message = {
+            "_id": ObjectId(),
+            "type": message_type,
+            "content": content,
+            "created_at": datetime.now(timezone.utc),
+        }
+        self._buffer(session_id).append(message)
+        if self.collection is not None and self.write_queue is not None:
+            self.write_queue.put(self.collection.name, dict(message, session_id=session_id))
+        return message
+
+    def page(self, session_id, before=None, limit=20):
+        """Return (messages, next_before): up to `limit` messages older than `before`, oldest first.
+
+        Pass next_before back as `before` to fetch the previous page; it is
+        None once the start of the history is reached.
+        """
+        buffer = list(self._buffer(session_id))
+        messages = [message for message in buffer if before is None or message["_id"] < before][-limit:]
+
+        if len(messages) < limit and self.collection is not None:
+            oldest = messages[0]["_id"] if messages else before
+            query = {"session_id": session_id}
+            if oldest is not None:
+                query["_id"] = {"$lt": oldest}
+            older = self.collection.find(query, {"session_id": 0, "updated_at": 0})
+            messages = list(older.sort("_id", DESCENDING).limit(limit - len(messages)))[::-1] + messages
+
+        next_before = messages[0]["_id"] if len(messages) == limit else None
+        return messages, next_before
+
+    def recent_turns(self, session_id, max_tokens):
+        """Return the latest (question, answer) pairs that fit in `max_tokens`, oldest first."""
+        turns, used = [], 0
+        answer = None
+        for message in reversed(list(self._buffer(session_id))):
+            if message["type"] == "bot":
+                answer = message["content"]
+                continue
+            if answer is None:
+                continue
+            used += count_tokens(message["content"]) + count_tokens(answer)
+            if used > max_tokens:
+                break
+            turns.append((message["content"], answer))
+            answer = None
+        return turns[::-1]
+
+    def stats(self):
+        return {"sessions": len(self._sessions)}
@@ -0,0 +1,208 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import pickle
+import re
+import time
+import zlib
+
+import faiss
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_community.vectorstores import FAISS
+
+from chat_history import CHARS_PER_TOKEN, count_tokens, exact_token_counts
+from ingest import iter_chunks, iter_pdf_pages, list_pdfs
+from lexical_router import tokenize
+
+# Mersenne prime for the MinHash permutations; a * x stays below 2**63 for 32-bit shingle hashes
+_PRIME = (1 << 31) - 1
+
+
+# Function to read the chunking settings (CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_DEDUP_THRESHOLD) shared by
+# the backend and the Streamlit app; a threshold of 0 turns near-duplicate removal off
+def chunking_from_env():
+    return {
+        "chunk_tokens": int(os.getenv("CHUNK_TOKENS", "256")),
+        "overlap_tokens": int(os.getenv("CHUNK_OVERLAP_TOKENS", "32")),
+        "dedupe_threshold": float(os.getenv("CHUNK_DEDUP_THRESHOLD", "0.9")) or None,
+    }
+
+
+# Function to build a splitter that sizes chunks in embedding-model tokens
+def token_splitter(chunk_tokens=256, overlap_tokens=32):
+    if not exact_token_counts():
+        # The splitter sums the lengths of words and separators; rounded-up estimates of each would
+        # shrink the chunks, so size them in characters instead
+        return RecursiveCharacterTextSplitter(
+            chunk_size=chunk_tokens * CHARS_PER_TOKEN, chunk_overlap=overlap_tokens * CHARS_PER_TOKEN
+        )
+    return RecursiveCharacterTextSplitter(
+        chunk_size=chunk_tokens, chunk_overlap=overlap_tokens, length_function=count_tokens
+    )
+
+
+# Function to hash a chunk's overlapping word n-grams to 32-bit integers
+def shingles(text, size=3):
+    words = re.findall(r"\w+", text.lower())
+    grams = {" ".join(words[i:i + size]) for i in range(max(1, len(words) - size + 1))}
+    return np.fromiter((zlib.crc32(gram.encode("utf-8")) for gram in grams), dtype=np.uint64, count=len(grams))
+
+
+class NearDuplicateFilter:
+    """Drop chunks whose text nearly repeats a chunk already kept.
+
+    Each chunk gets a MinHash signature of its word 3-grams; locality-
+    sensitive hashing over `bands` bands of the signature finds earlier
+    chunks that might be similar, and a candidate counts as a duplicate
+    when the signatures estimate a Jaccard similarity of at least
+    `threshold`. Exact repeats are caught by a plain hash first.
+
+    Chunks may name their `source` (e.g. the PDF); `duplicate_of` then maps
+    each source to the other sources whose kept chunks caused its drops.
+    """
+
+    def __init__(self, threshold=0.9, num_perm=64, bands=16, seed=0):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _PRIME, num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, num_perm, dtype=np.uint64)
+
+        self._exact = {}  # text hash -> kept chunk
+        self._buckets = {}
+        self._signatures = []
+        self._sources = []
+        self.kept = 0
+        self.duplicates = 0
+        self.duplicate_of = {}
+
+    def signature(self, text):
+        hashes = shingles(text)
+        return ((self._a[:, None] * hashes[None, :] + self._b[:, None]) % _PRIME).min(axis=1)
+
+    def _bands(self, signature):
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def is_duplicate(self, text, source=None):
+        """Return True if `text` nearly repeats a kept chunk; otherwise keep it and return False."""
+        digest = hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).digest()
+        if digest in self._exact:
+            self._dropped(source, self._exact[digest])
+            return True
+
+        signature = self.signature(text)
+        candidates = {kept for key in self._bands(signature) for kept in self._buckets.get(key, ())}
+        for kept in candidates:
+            if np.mean(self._signatures[kept] == signature) >= self.threshold:
+                self._dropped(source, kept)
+                return True
+
+        self.add(text, digest, signature, source)
+        return False
+
+    def _dropped(self, source, kept):
+        self.duplicates += 1
+        kept_source = self._sources[kept]
+        if source is not None and kept_source is not None and kept_source != source:
+            self.duplicate_of.setdefault(source, set()).add(kept_source)
+
+    def add(self, text, digest=None, signature=None, source=None):
+        """Record `text` as kept, e.g. a chunk already in the index."""
+        digest = digest or hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).digest()
+        signature = self.signature(text) if signature is None else signature
+        self._exact.setdefault(digest, len(self._signatures))
+        for key in self._bands(signature):
+            self._buckets.setdefault(key, []).append(len(self._signatures))
+        self._signatures.append(signature)
+        self._sources.append(source)
+        self.kept += 1
+
+    def filter(self, documents):
+        """Yield the documents whose page_content is not a near-duplicate of a kept one."""
+        for document in documents:
+            if not self.is_duplicate(document.page_content, document.metadata.get("source")):
+                yield document
+
+
+# Function to chunk every page of some PDFs the way ingestion does
+def chunk_corpus(paths, split_text, dedupe_threshold=None):
+    documents = iter_chunks(iter_pdf_pages(paths), split_text)
+    dedupe = NearDuplicateFilter(dedupe_threshold) if dedupe_threshold else None
+    if dedupe is not None:
+        documents = dedupe.filter(documents)
+    return [document.page_content for document in documents], dedupe.duplicates if dedupe else 0
+
+
+# Function to measure one chunking setup: index size, embedding work and retrieval quality on FAQ questions
+def evaluate(name, chunks, duplicates, embeddings, questions, answers, k, batch_size=64):
+    started = time.perf_counter()
+    store = FAISS.from_texts(chunks, embeddings)
+    seconds = time.perf_counter() - started
+    index_bytes = faiss.serialize_index(store.index).nbytes + len(pickle.dumps((store.docstore, store.index_to_docstore_id)))
+
+    answer_recall, context_tokens = [], []
+    for question, answer in zip(questions, answers):
+        context = " ".join(doc.page_content for doc in store.similarity_search(question, k=k))
+        context_tokens.append(count_tokens(context))
+        expected = set(tokenize(answer))
+        if expected:
+            answer_recall.append(len(expected & set(tokenize(context))) / len(expected))
+
+    return {
+        "setup": name,
+        "chunks": len(chunks),
+        "duplicates_dropped": duplicates,
+        "tokens_embedded": sum(count_tokens(chunk) for chunk in chunks),
+        "embedding_requests": math.ceil(len(chunks) / batch_size),
+        "index_mb": round(index_bytes / 2**20, 2),
+        "embed_s": round(seconds, 2),
+        f"answer_word_recall@{k}": round(float(np.mean(answer_recall)), 4) if answer_recall else None,
+        "context_tokens_per_query": round(float(np.mean(context_tokens)), 1) if context_tokens else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the old character chunking with token-sized, deduplicated chunks.")
+    parser.add_argument("folder", nargs="?", default="./teacher_pdfs")
+    parser.add_argument("--chunk-tokens", type=int, default=int(os.getenv("CHUNK_TOKENS", "256")))
+    parser.add_argument("--overlap-tokens", type=int, default=int(os.getenv("CHUNK_OVERLAP_TOKENS", "32")))
+    parser.add_argument("--threshold", type=float, default=float(os.getenv("CHUNK_DEDUP_THRESHOLD", "0.9")),
+                        help="MinHash Jaccard similarity above which a chunk is dropped")
+    parser.add_argument("--questions", default="faq.csv", help="CSV with Question and Answers columns")
+    parser.add_argument("--k", type=int, default=4, help="chunks retrieved per question")
+    parser.add_argument("--offline", action="store_true", help="use the hashing fake embedder instead of OpenAI")
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    if args.offline:
+        from fakes import HashingFakeEmbeddings
+        embeddings = HashingFakeEmbeddings()
+    else:
+        from utils import embeddings
+
+    faqs = pd.read_csv(args.questions, encoding="ISO-8859-1").dropna(subset=["Question"])
+    questions = faqs["Question"].astype(str).tolist()
+    answers = faqs["Answers"].fillna("").astype(str).tolist() if "Answers" in faqs else [""] * len(questions)
+
+    paths = list_pdfs(args.folder)
+    before = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=100).split_text
+    after = token_splitter(args.chunk_tokens, args.overlap_tokens).split_text
+    setups = [
+        ("chars 200/100", *chunk_corpus(paths, before)),
+        (f"tokens {args.chunk_tokens}/{args.overlap_tokens} + dedup {args.threshold}",
+         *chunk_corpus(paths, after, args.threshold)),
+    ]
+    for name, chunks, duplicates in setups:
+        print(json.dumps(evaluate(name, chunks, duplicates, embeddings, questions, answers, args.k)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from langchain_core.embeddings import Embeddings
+
+from metrics import Histogram
+
+
+class EmbeddingBatcher:
+    """Coalesce concurrent embedding requests into batched calls.
+
+    Texts submitted within `max_wait` seconds of the first waiting text, up
+    to `max_batch_size` of them, are sent in one `embed_documents` call.
+    Each caller gets a Future for its own vector. At most
+    `max_concurrent_batches` calls are in flight at once.
+    """
+
+    def __init__(self, embed_documents, max_batch_size=64, max_wait=0.01, max_concurrent_batches=4):
+        self.embed_documents = embed_documents
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.max_concurrent_batches = max_concurrent_batches
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+
+        self.batch_sizes = Histogram(
+            "eduquery_embedding_batch_size", "Texts per batched embedding call.",
+            [1, 2, 4, 8, 16, 32, 64, 128, 256, 512],
+        )
+        self.wait_times = Histogram(
+            "eduquery_embedding_batch_wait_seconds", "Time a text waited before its batch was sent.",
+            [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0],
+        )
+        self.queue_depths = Histogram(
+            "eduquery_embedding_queue_depth", "Texts still queued when a batch was sent.",
+            [0, 1, 4, 16, 64, 256, 1024],
+        )
+        self.batches = 0
+        self.texts = 0
+
+    def _ensure_started(self):
+        # Threads don't survive fork, so start (or restart) them in the current process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue()
+            self._slots = threading.Semaphore(self.max_concurrent_batches)
+            self._executor = ThreadPoolExecutor(self.max_concurrent_batches, thread_name_prefix="embedding-batch")
+            threading.Thread(target=self._collect, name="embedding-batcher", daemon=True).start()
+            self._pid = os.getpid()
+
+    def submit(self, text):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((text, future, time.monotonic()))
+        return future
+
+    def embed(self, text):
+        return self.submit(text).result()
+
+    def embed_many(self, texts):
+        futures = [self.submit(text) for text in texts]
+        return [future.result() for future in futures]
+
+    def _collect(self):
+        pending, slots = self._queue, self._slots
+        while True:
+            batch = [pending.get()]
+            # While every slot is busy, later texts keep queueing and join this batch
+            slots.acquire()
+            deadline = max(batch[0][2] + self.max_wait, time.monotonic())
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                try:
+                    batch.append(pending.get(timeout=timeout) if timeout > 0 else pending.get_nowait())
+                except queue.Empty:
+                    break
+
+            now = time.monotonic()
+            self.queue_depths.observe(pending.qsize())
+            self.batch_sizes.observe(len(batch))
+            for _, _, submitted_at in batch:
+                self.wait_times.observe(now - submitted_at)
+            self.batches += 1
+            self.texts += len(batch)
+
+            self._executor.submit(self._run_batch, batch, slots)
+
+    def _run_batch(self, batch, slots):
+        try:
+            vectors = self.embed_documents([text for text, _, _ in batch])
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        finally:
+            slots.release()
+        for (_, future, _), vector in zip(batch, vectors):
+            future.set_result(vector)
+
+    def stats(self):
+        return {
+            "queue_depth": self._queue.qsize(),
+            "batches": self.batches,
+            "texts": self.texts,
+            "batch_size": self.batch_sizes.snapshot(),
+            "wait_seconds": self.wait_times.snapshot(),
+            "queue_depth_at_dispatch": self.queue_depths.snapshot(),
+        }
+
+
+class BatchingEmbeddings(Embeddings):
+    """LangChain embeddings wrapper that routes every text through an EmbeddingBatcher."""
+
+    def __init__(self, embeddings, **batcher_kwargs):
+        self.embeddings = embeddings
+        self.model = getattr(embeddings, "model", None) or type(embeddings).__name__
+        self.batcher = EmbeddingBatcher(embeddings.embed_documents, **batcher_kwargs)
+
+    def embed_query(self, text):
+        return self.batcher.embed(text)
+
+    async def aembed_query(self, text):
+        # Await the batch without holding a thread; the batcher's workers make the call
+        return await asyncio.wrap_future(self.batcher.submit(text))
+
+    def embed_documents(self, texts):
+        return self.batcher.embed_many(texts)
@@ -0,0 +1,176 @@
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+# Function to normalize a question so trivially different phrasings share a cache entry
+def normalize_question(text):
+    text = re.sub(r"\s+", " ", text).strip().lower()
+    return text.rstrip("?!. ")
+
+
+class EmbeddingCache:
+    """Two-tier cache of embedding vectors keyed by model name and text.
+
+    The first tier is an in-process LRU of at most `max_entries` vectors.
+    The optional second tier is a SQLite file at `path` that survives
+    restarts and is trimmed to `max_disk_entries` least recently used rows.
+    """
+
+    def __init__(self, max_entries=10000, path=None, max_disk_entries=200000):
+        self.max_entries = max_entries
+        self.max_disk_entries = max_disk_entries
+        self.path = path
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        self._db_pid = None
+        self._disk_count = 0
+        if path:
+            db = self._connection()
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, accessed REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed)")
+            db.commit()
+            self._disk_count = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _connection(self):
+        # SQLite connections must not be used across fork, so each process opens its own
+        if self._db_pid != os.getpid():
+            self._db = sqlite3.connect(self.path, check_same_thread=False, timeout=5)
+            self._db.execute("PRAGMA journal_mode=WAL")  # Worker processes share the file
+            self._db_pid = os.getpid()
+        return self._db
+
+    @staticmethod
+    def make_key(model, text):
+        return hashlib.sha1(f"{model}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, model, text):
+        key = self.make_key(model, text)
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+
+            if self.path:
+                db = self._connection()
+                row = db.execute("SELECT vector FROM embeddings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    db.execute("UPDATE embeddings SET accessed = ? WHERE key = ?", (time.time(), key))
+                    db.commit()
+                    vector = np.frombuffer(row[0], dtype=np.float32).tolist()
+                    self._remember(key, vector)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return vector
+
+            self.misses += 1
+            return None
+
+    def put(self, model, text, vector):
+        key = self.make_key(model, text)
+        vector = list(vector)
+        with self._lock:
+            self._remember(key, vector)
+            if self.path:
+                db = self._connection()
+                cursor = db.execute(
+                    "INSERT OR IGNORE INTO embeddings (key, model, vector, accessed) VALUES (?, ?, ?, ?)",
+                    (key, model, np.asarray(vector, dtype=np.float32).tobytes(), time.time()),
+                )
+                self._disk_count += cursor.rowcount
+                self._evict_disk(db)
+                db.commit()
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _evict_disk(self, db):
+        if self._disk_count <= self.max_disk_entries:
+            return
+        # Trim an extra 10% so eviction doesn't run on every insert
+        excess = self._disk_count - int(self.max_disk_entries * 0.9)
+        db.execute(
+            "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY accessed LIMIT ?)",
+            (excess,),
+        )
+        self._disk_count = db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self._memory),
+            "disk_entries": self._disk_count,
+        }
+
+
+class CachedEmbeddings(Embeddings):
+    """LangChain embeddings wrapper that consults an EmbeddingCache first.
+
+    Queries are keyed on their normalized text; document chunks are keyed
+    on their exact text, and only the uncached chunks are sent to the
+    wrapped embeddings in one call.
+    """
+
+    def __init__(self, embeddings, cache, model=None):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model or getattr(embeddings, "model", None) or type(embeddings).__name__
+
+    def embed_query(self, text):
+        key = "query:" + normalize_question(text)
+        vector = self.cache.get(self.model, key)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put(self.model, key, vector)
+        return vector
+
+    def cached_query(self, text):
+        """Return the cached vector of query `text`, or None; never calls the wrapped embeddings."""
+        return self.cache.get(self.model, "query:" + normalize_question(text))
+
+    async def aembed_query(self, text):
+        key = "query:" + normalize_question(text)
+        vector = self.cache.get(self.model, key)
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.cache.put(self.model, key, vector)
+        return vector
+
+    def embed_documents(self, texts):
+        keys = ["document:" + text for text in texts]
+        vectors = [self.cache.get(self.model, key) for key in keys]
+
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            # Embed each distinct missing text only once
+            unique_texts = list(dict.fromkeys(texts[i] for i in missing))
+            embedded = dict(zip(unique_texts, self.embeddings.embed_documents(unique_texts)))
+            for i in missing:
+                vectors[i] = embedded[texts[i]]
+                self.cache.put(self.model, keys[i], vectors[i])
+        return vectors
@@ -0,0 +1,70 @@
+import hashlib
+import re
+import time
+from functools import lru_cache
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+class FakeStreamingChatModel(BaseChatModel):
+    """Chat model that replays canned responses word by word with delays.
+
+    With `streaming` enabled each word is reported through the callback
+    manager, the same way ChatOpenAI(streaming=True) reports tokens.
+    """
+
+    responses: list = ["This is a fake answer from the local test model."]
+    first_token_delay: float = 0.0
+    token_delay: float = 0.0
+    streaming: bool = True
+    i: int = 0
+
+    @property
+    def _llm_type(self):
+        return "fake-streaming-chat"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        response = self.responses[self.i % len(self.responses)]
+        self.i += 1
+
+        time.sleep(self.first_token_delay)
+        for n, token in enumerate(re.findall(r"\s*\S+", response)):
+            if n:
+                time.sleep(self.token_delay)
+            if self.streaming and run_manager:
+                run_manager.on_llm_new_token(token)
+
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=response))])
+
+
+# Function to map a word to a fixed pseudo-random vector
+@lru_cache(maxsize=100000)
+def _word_vector(word, size):
+    seed = int.from_bytes(hashlib.md5(word.encode("utf-8")).digest()[:8], "little")
+    return np.random.default_rng(seed).standard_normal(size)
+
+
+class HashingFakeEmbeddings(Embeddings):
+    """Deterministic offline embedder: a normalized bag of hashed words.
+
+    Texts that share words get similar vectors, so similarity search and
+    FAQ routing behave plausibly without calling OpenAI.
+    """
+
+    def __init__(self, size=1536):
+        self.size = size
+        self.model = f"hashing-fake-{size}"
+
+    def embed_query(self, text):
+        vector = np.zeros(self.size)
+        for word in re.findall(r"\w+", text.lower()):
+            vector += _word_vector(word, self.size)
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
@@ -0,0 +1,115 @@
+import argparse
+import os
+import resource
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from faq_matcher import normalize_rows
+
+# Upper bound on similarity scores held at once (rows x bank size), about 64 MB of float32
+MAX_BLOCK_CELLS = 16 * 1024 * 1024
+
+
+# Function to find the closest Mongo FAQ questions for every CSV question
+def calculate_similarities(questions_csv, embeddings_csv, questions_mongo, embeddings_mongo, k=3, block_rows=None):
+    """Return the `k` least dissimilar Mongo questions per CSV question as records.
+
+    CSV questions are scored against the bank a block of rows at a time and
+    the top `k` of each row are picked with argpartition, so memory stays
+    bounded by the block rather than by CSV rows x bank size. Records are
+    grouped by CSV question in sorted order, each group by ascending
+    dissimilarity, as the original DataFrame groupby produced them.
+    """
+    if len(questions_csv) == 0 or len(questions_mongo) == 0:
+        return []
+    bank = normalize_rows(embeddings_mongo)
+    k = min(k, len(questions_mongo))
+    block_rows = block_rows or max(1, MAX_BLOCK_CELLS // len(questions_mongo))
+
+    top_indexes, top_dissimilarities = [], []
+    for start in range(0, len(questions_csv), block_rows):
+        scores = normalize_rows(embeddings_csv[start:start + block_rows]) @ bank.T
+        if k < scores.shape[1]:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        else:
+            top = np.broadcast_to(np.arange(k), (scores.shape[0], k))
+        dissimilarities = np.round(1 - np.take_along_axis(scores, top, axis=1).astype(np.float64), 2)
+
+        # Order each row by rounded dissimilarity, then bank position, like a stable sort
+        order = np.lexsort((top, dissimilarities), axis=1)
+        top_indexes.append(np.take_along_axis(top, order, axis=1))
+        top_dissimilarities.append(np.take_along_axis(dissimilarities, order, axis=1))
+    top_indexes = np.concatenate(top_indexes)
+    top_dissimilarities = np.concatenate(top_dissimilarities)
+
+    results = []
+    for i in sorted(range(len(questions_csv)), key=lambda row: questions_csv[row]):
+        for j, dissimilarity in zip(top_indexes[i], top_dissimilarities[i]):
+            dissimilarity = float(dissimilarity)
+            results.append({
+                "question_from_csv": questions_csv[i],
+                "question_from_mongo": questions_mongo[j],
+                "dissimilarity": dissimilarity,
+                "rag_answer": "True" if 0.0 <= dissimilarity <= 0.35 else "False"
+            })
+    return results
+
+
+# Function to load the FAQ bank (questions and embeddings) from MongoDB; the database defaults to MONGO_DB
+def load_faq_bank(mongo_uri, db_name=None, collection_name="openai_embedding"):
+    from pymongo import MongoClient
+
+    from faq_store import fetch_faq_bank
+
+    db_name = db_name or os.getenv("MONGO_DB", "tutor")
+    return fetch_faq_bank(MongoClient(mongo_uri)[db_name][collection_name])
+
+
+def main():
+    # Read .env first so MONGO_DB and the OpenAI settings apply
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Match every question in a CSV against the MongoDB FAQ bank.")
+    parser.add_argument("csv", nargs="?", default="faq.csv")
+    parser.add_argument("--column", default="Question", help="CSV column holding the questions")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--mongo-db", default=os.getenv("MONGO_DB", "tutor"))
+    parser.add_argument("--collection", default="openai_embedding")
+    parser.add_argument("--k", type=int, default=3, help="matches to keep per question")
+    parser.add_argument("--block-rows", type=int, default=None, help="CSV rows scored at once (default: fit ~64 MB)")
+    parser.add_argument("--output", default="faq_eval_results.csv", help="results file; .parquet writes Parquet")
+    args = parser.parse_args()
+
+    from utils import embeddings
+
+    questions_csv = pd.read_csv(args.csv, encoding="ISO-8859-1")[args.column].dropna().astype(str).tolist()
+    questions_mongo, embeddings_mongo = load_faq_bank(args.mongo_uri, args.mongo_db, args.collection)
+    embeddings_csv = np.array(embeddings.embed_documents(questions_csv), dtype=np.float32)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    results = calculate_similarities(
+        questions_csv, embeddings_csv, questions_mongo, embeddings_mongo, k=args.k, block_rows=args.block_rows
+    )
+    seconds = time.perf_counter() - started
+    _, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    results_df = pd.DataFrame(results, columns=["question_from_csv", "question_from_mongo", "dissimilarity", "rag_answer"])
+    if os.path.splitext(args.output)[1].lower() == ".parquet":
+        results_df.to_parquet(args.output, index=False)
+    else:
+        results_df.to_csv(args.output, index=False)
+
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{len(questions_csv)} questions x {len(questions_mongo)} FAQs -> {len(results_df)} rows in {seconds:.2f}s")
+    print(f"peak traced memory {peak_bytes / 2**20:.1f} MB, peak RSS {peak_rss_mb:.0f} MB")
+    print(f"RAG-answerable: {(results_df.groupby('question_from_csv')['rag_answer'].first() == 'True').mean():.1%}")
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+import threading
+
+import numpy as np
+
+
+# Function to L2-normalize rows into a contiguous float32 matrix
+def normalize_rows(vectors):
+    matrix = np.atleast_2d(np.array(vectors, dtype=np.float32, order="C"))
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    return matrix
+
+
+class FAQMatcher:
+    """Cosine top-k search over the stored FAQ question embeddings.
+
+    Rows are L2-normalized once at build time, so scoring a query is a
+    single matrix-vector product. The "faiss" backend keeps the same rows
+    in an inner-product index for very large FAQ banks.
+
+    Rows that are already unit length (`normalized=True`, e.g. a memory-
+    mapped snapshot) are used as they are, as are int8 rows with per-row
+    `scales`. Quantized float16 or int8 rows are widened to float32 only
+    `block_rows` at a time while scoring.
+
+    Questions added later (`add`) go into a small float32 tail that is
+    copied and swapped in whole, so searches never lock and never see a
+    half-added row; the base rows, often a shared memory map, are untouched.
+    """
+
+    def __init__(self, questions, embeddings, backend="numpy", scales=None, normalized=False, block_rows=65536):
+        if backend not in ("numpy", "faiss"):
+            raise ValueError(f"Unknown FAQ matcher backend: {backend}")
+
+        questions = list(questions)
+        self.backend = backend
+        self.scales = scales
+        self.block_rows = block_rows
+        self.index = None
+        self.base_count = len(questions)
+
+        # (questions, added rows): replaced together by add(), read once per search
+        self._state = (questions, None)
+        self._lock = threading.Lock()
+
+        if not len(questions):
+            self.matrix = np.zeros((0, 0), dtype=np.float32)
+        elif normalized or scales is not None:
+            self.matrix = embeddings
+        else:
+            self.matrix = normalize_rows(embeddings)
+
+        if backend == "faiss" and len(questions):
+            import faiss
+
+            self.index = faiss.IndexFlatIP(self.matrix.shape[1])
+            self.index.add(self._dequantize(0, len(questions)))
+
+    @property
+    def questions(self):
+        return self._state[0]
+
+    def add(self, question, embedding):
+        """Append one question, e.g. one a teacher just answered; returns its index."""
+        row = normalize_rows(embedding)
+        with self._lock:
+            questions, added = self._state
+            added = row if added is None else np.vstack([added, row])
+            self._state = (questions + [question], added)
+            return len(questions)
+
+    def _dequantize(self, start, stop):
+        rows = np.asarray(self.matrix[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            rows = rows * self.scales[start:stop, None]
+        return rows
+
+    def _scores(self, queries):
+        if self.matrix.dtype == np.float32 and self.scales is None:
+            return queries @ self.matrix.T
+
+        # Quantized rows: widen one block at a time instead of the whole bank
+        scores = np.empty((len(queries), self.base_count), dtype=np.float32)
+        for start in range(0, self.base_count, self.block_rows):
+            stop = start + self.block_rows
+            block_scores = queries @ np.asarray(self.matrix[start:stop], dtype=np.float32).T
+            if self.scales is not None:
+                block_scores *= self.scales[start:stop]
+            scores[:, start:stop] = block_scores
+        return scores
+
+    def __len__(self):
+        return len(self._state[0])
+
+    def search(self, queries, k=1):
+        """Return the top-k (index, score) pairs for each query in a batch."""
+        questions, added = self._state
+        if not len(questions):
+            return [[] for _ in range(len(queries))]
+
+        queries = normalize_rows(queries)
+        k = min(k, len(questions))
+
+        if not self.base_count:
+            results = [[] for _ in range(len(queries))]
+        elif self.index is not None:
+            scores, indices = self.index.search(queries, min(k, self.base_count))
+            results = [
+                [(int(i), float(s)) for i, s in zip(row_indices, row_scores) if i >= 0]
+                for row_indices, row_scores in zip(indices, scores)
+            ]
+        else:
+            results = _top_k(self._scores(queries), min(k, self.base_count))
+
+        if added is not None:
+            # Merge in the best of the added questions, numbered after the base rows
+            extra = _top_k(queries @ added.T, min(k, len(added)), offset=self.base_count)
+            results = [sorted(base + tail, key=lambda match: -match[1])[:k] for base, tail in zip(results, extra)]
+        return results
+
+    def top_k(self, query, k=1):
+        """Return the top-k (index, score) pairs for a single query."""
+        return self.search([query], k)[0]
+
+    def best(self, query):
+        """Return (question, index, score) of the closest FAQ, or (None, None, 0.0)."""
+        matches = self.top_k(query, 1)
+        if not matches:
+            return None, None, 0.0
+        index, score = matches[0]
+        return self.questions[index], index, score
+
+
+# Function to pick the k best (index, score) pairs from each row of a score matrix, best first
+def _top_k(scores, k, offset=0):
+    if k < scores.shape[1]:
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    else:
+        top = np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    top = np.take_along_axis(top, order, axis=1)
+    top_scores = np.take_along_axis(top_scores, order, axis=1)
+    return [
+        [(int(i) + offset, float(s)) for i, s in zip(row_indices, row_scores)]
+        for row_indices, row_scores in zip(top, top_scores)
+    ]
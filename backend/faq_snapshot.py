@@ -0,0 +1,294 @@
+import argparse
+import fcntl
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import numpy as np
+from bson import ObjectId
+
+from faq_matcher import normalize_rows
+from faq_store import FEED_OVERLAP, decode_embeddings, deleted_faqs, fetch_faq_bank
+
+# Storage formats for the snapshot's embedding matrix
+SNAPSHOT_DTYPES = ("float32", "float16", "int8")
+
+# Name of the file that records which snapshot version is current
+META_FILE = "meta.json"
+
+
+# Function to quantize unit-length rows for storage; int8 rows get one float32 scale each
+def quantize(matrix, dtype):
+    if dtype == "float32":
+        return matrix, None
+    if dtype == "float16":
+        return matrix.astype(np.float16), None
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127
+        scales[scales == 0] = 1.0
+        return np.rint(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    raise ValueError(f"Unknown snapshot dtype: {dtype}")
+
+
+# Function to widen stored rows back to a writable float32 copy
+def dequantize(stored, scales=None):
+    rows = np.array(stored, dtype=np.float32)
+    return rows * scales[:, None] if scales is not None else rows
+
+
+class FAQSnapshot:
+    """Versioned on-disk copy of the FAQ bank, memory-mapped when loaded.
+
+    Each version is an embeddings .npy file (plus int8 scales) and a JSON
+    sidecar with the question texts, answers and Mongo IDs. meta.json names
+    the current version, the newest _id and updated_at it contains and the
+    newest deletion it has applied, so a later sync only fetches what
+    changed. Older versions are deleted once a new one is current;
+    processes that mapped them keep their pages.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = None
+        meta_path = os.path.join(path, META_FILE)
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                self.meta = json.load(f)
+
+    def _file(self, kind, version, extension):
+        return os.path.join(self.path, f"{kind}-{version}.{extension}")
+
+    @contextmanager
+    def lock(self):
+        # Serialize writers (e.g. several workers starting together)
+        os.makedirs(self.path, exist_ok=True)
+        with open(os.path.join(self.path, ".lock"), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def usable(self, dtype):
+        # Snapshots written before answers and deletions were tracked are rebuilt once
+        return self.meta is not None and self.meta["dtype"] == dtype and "last_deleted_at" in self.meta
+
+    def load(self):
+        """Return (questions, answers, ids, stored, scales); the arrays are read-only memory maps."""
+        version = self.meta["version"]
+        with open(self._file("questions", version, "json")) as f:
+            sidecar = json.load(f)
+        stored = np.load(self._file("embeddings", version, "npy"), mmap_mode="r")
+        scales = None
+        if self.meta["dtype"] == "int8":
+            scales = np.load(self._file("scales", version, "npy"), mmap_mode="r")
+        return sidecar["questions"], sidecar["answers"], sidecar["ids"], stored, scales
+
+    def save(self, questions, answers, ids, stored, scales, last_id, last_updated_at, last_deleted_at):
+        version = str(time.time_ns())
+        np.save(self._file("embeddings", version, "npy"), stored)
+        if scales is not None:
+            np.save(self._file("scales", version, "npy"), scales)
+        with open(self._file("questions", version, "json"), "w") as f:
+            json.dump({"questions": questions, "answers": answers, "ids": ids}, f)
+
+        meta = {
+            "version": version,
+            "dtype": str(stored.dtype),
+            "count": len(questions),
+            "dim": int(stored.shape[1]),
+            "last_id": last_id,
+            "last_updated_at": last_updated_at,
+            "last_deleted_at": last_deleted_at,
+        }
+        tmp_path = os.path.join(self.path, META_FILE + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(self.path, META_FILE))
+        self.meta = meta
+
+        for name in os.listdir(self.path):
+            stem = os.path.splitext(name)[0]
+            if stem.rsplit("-", 1)[0] in ("embeddings", "scales", "questions") and not stem.endswith(version):
+                os.remove(os.path.join(self.path, name))
+
+
+# Function to fetch FAQ documents with the fields a snapshot needs
+def _fetch(collection, query):
+    docs = list(collection.find(query, {"question": 1, "answer": 1, "embedding": 1, "updated_at": 1}).sort("_id", 1))
+    return docs, decode_embeddings([doc["embedding"] for doc in docs])
+
+
+# Function to format a stored timestamp the way meta.json keeps it
+def _isoformat(timestamp):
+    return timestamp.replace(tzinfo=timestamp.tzinfo or timezone.utc).isoformat()
+
+
+# Function to fetch the tombstones of FAQ documents deleted since `last_deleted_at` (all of them if None)
+def _deleted(collection, last_deleted_at):
+    query = {}
+    if last_deleted_at:
+        # Tombstones are stamped by the process that deleted; re-applying one is harmless
+        query = {"deleted_at": {"$gt": datetime.fromisoformat(last_deleted_at) - FEED_OVERLAP}}
+    tombstones = list(deleted_faqs(collection).find(query).sort("deleted_at", 1))
+    if tombstones:
+        last_deleted_at = max(last_deleted_at or "", _isoformat(tombstones[-1]["deleted_at"]))
+    return {str(tombstone["_id"]) for tombstone in tombstones}, last_deleted_at
+
+
+# Function to compute the watermarks a later sync starts from
+def _watermarks(docs, meta=None):
+    last_id = meta["last_id"] if meta else None
+    last_updated_at = meta["last_updated_at"] if meta else None
+    for doc in docs:
+        if last_id is None or doc["_id"] > ObjectId(last_id):
+            last_id = str(doc["_id"])
+        updated_at = doc.get("updated_at")
+        if updated_at is not None:
+            updated_at = _isoformat(updated_at)
+            if last_updated_at is None or updated_at > last_updated_at:
+                last_updated_at = updated_at
+    return last_id, last_updated_at
+
+
+# Function to reopen a just-saved snapshot so its rows are file-backed rather than private memory
+def _mapped(snapshot):
+    questions, answers, _, stored, scales = snapshot.load()
+    return questions, answers, stored, scales
+
+
+# Function to load the FAQ bank from the snapshot, fetching only newer documents from MongoDB
+def load_faq_snapshot(collection, path, dtype="float32", rebuild=False):
+    """Return (questions, answers, stored, scales) with unit-length rows, keeping the snapshot current.
+
+    Documents inserted or updated since the snapshot are merged in, those
+    deleted since (delete_faqs leaves a tombstone for each) are dropped,
+    and a new version is written. If MongoDB then holds fewer documents
+    than the snapshot (some were deleted without a tombstone), or the dtype
+    changed, the snapshot is rebuilt from scratch.
+    """
+    snapshot = FAQSnapshot(path)
+    with snapshot.lock():
+        snapshot = FAQSnapshot(path)
+        meta = snapshot.meta
+        if snapshot.usable(dtype) and not rebuild:
+            questions, answers, ids, stored, scales = snapshot.load()
+            # Tombstones before documents: a document deleted in between is then dropped, not kept
+            deleted, last_deleted_at = _deleted(collection, meta["last_deleted_at"])
+            query = {"_id": {"$gt": ObjectId(meta["last_id"])}}
+            if meta["last_updated_at"]:
+                query = {"$or": [query, {"updated_at": {"$gt": datetime.fromisoformat(meta["last_updated_at"])}}]}
+            docs, vectors = _fetch(collection, query)
+            keep = [i for i, doc_id in enumerate(ids) if doc_id not in deleted]
+            total = collection.estimated_document_count()
+            if not docs and len(keep) == len(ids) and total == len(questions):
+                return questions, answers, stored, scales
+
+            rows = dequantize(stored, scales)
+            if len(keep) < len(ids):
+                rows = rows[keep]
+                questions, answers, ids = ([values[i] for i in keep] for values in (questions, answers, ids))
+            positions = {doc_id: i for i, doc_id in enumerate(ids)}
+            vectors = normalize_rows(vectors) if docs else vectors
+            new_rows = []
+            for doc, vector in zip(docs, vectors):
+                if str(doc["_id"]) in deleted:
+                    continue
+                position = positions.get(str(doc["_id"]))
+                if position is None:
+                    questions.append(doc["question"])
+                    answers.append(doc.get("answer"))
+                    ids.append(str(doc["_id"]))
+                    new_rows.append(vector)
+                else:
+                    questions[position] = doc["question"]
+                    answers[position] = doc.get("answer")
+                    rows[position] = vector
+            if new_rows:
+                rows = np.vstack([rows, new_rows])
+            if total == len(questions) and len(questions):
+                stored, scales = quantize(rows, dtype)
+                snapshot.save(questions, answers, ids, stored, scales, *_watermarks(docs, meta), last_deleted_at)
+                return _mapped(snapshot)
+
+        # No usable snapshot: build one from every document
+        _, last_deleted_at = _deleted(collection, None)
+        docs, vectors = _fetch(collection, {})
+        if not docs:
+            return [], [], np.zeros((0, 0), dtype=np.float32), None
+        stored, scales = quantize(normalize_rows(vectors), dtype)
+        questions = [doc["question"] for doc in docs]
+        answers = [doc.get("answer") for doc in docs]
+        snapshot.save(questions, answers, [str(doc["_id"]) for doc in docs], stored, scales, *_watermarks(docs),
+                      last_deleted_at)
+        return _mapped(snapshot)
+
+
+# Function to compare quantized scoring against float32 on the routing decision
+def check_quantization(matrix, queries, dtype, threshold=0.8):
+    """Score `queries` against `matrix` (unit rows) in float32 and in `dtype`.
+
+    Reports how often the best match and the above/below-threshold routing
+    decision agree, the largest best-score error, and the bytes stored.
+    """
+    queries = normalize_rows(queries)
+    stored, scales = quantize(matrix, dtype)
+    exact = queries @ matrix.T
+    approximate = queries @ dequantize(stored, scales).T
+
+    exact_best, approximate_best = exact.max(axis=1), approximate.max(axis=1)
+    return {
+        "dtype": dtype,
+        "queries": len(queries),
+        "bytes": stored.nbytes + (scales.nbytes if scales is not None else 0),
+        "top1_agreement": float(np.mean(exact.argmax(axis=1) == approximate.argmax(axis=1))),
+        "route_agreement": float(np.mean((exact_best > threshold) == (approximate_best > threshold))),
+        "max_best_score_error": float(np.abs(exact_best - approximate_best).max()),
+    }
+
+
+# Function to make queries near the routing threshold by perturbing FAQ rows
+def synthetic_queries(matrix, count, threshold=0.8, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = matrix[rng.integers(0, len(matrix), count)]
+    # Noise of norm r gives cosine ~1/sqrt(1+r^2); spread r around the threshold's value
+    radius = np.sqrt(1 / threshold ** 2 - 1) * rng.uniform(0.5, 1.5, (count, 1))
+    noise = rng.standard_normal(rows.shape).astype(np.float32)
+    noise *= radius / np.linalg.norm(noise, axis=1, keepdims=True)
+    return rows + noise
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the FAQ snapshot and check quantized storage accuracy.")
+    parser.add_argument("--path", default="./faq_snapshot")
+    parser.add_argument("--dtype", choices=SNAPSHOT_DTYPES, default="float32")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--mongo-db", default=os.getenv("MONGO_DB", "tutor"))
+    parser.add_argument("--rebuild", action="store_true", help="ignore the existing snapshot")
+    parser.add_argument("--check", action="store_true", help="measure float16/int8 routing accuracy")
+    parser.add_argument("--threshold", type=float, default=0.8, help="routing similarity threshold")
+    parser.add_argument("--queries", type=int, default=2000, help="synthetic queries when there are no logged ones")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+
+    db = MongoClient(args.mongo_uri)[args.mongo_db]
+    started = time.perf_counter()
+    questions, _, stored, scales = load_faq_snapshot(db["openai_embedding"], args.path, args.dtype, args.rebuild)
+    print(f"{len(questions)} FAQs, {args.dtype}, {stored.nbytes / 2**20:.1f} MB, synced in {time.perf_counter() - started:.2f}s")
+
+    if args.check and len(questions):
+        matrix = normalize_rows(fetch_faq_bank(db["openai_embedding"])[1])
+        # Real student questions make the best check; fall back to synthetic ones near the threshold.
+        # Questions routed lexically are stored with a null embedding
+        logged = [doc["embedding"] for name in ("rag_answering", "teacher_answering")
+                  for doc in db[name].find({"embedding": {"$ne": None}}, {"embedding": 1}).limit(args.queries)]
+        queries = np.array(logged, dtype=np.float32) if logged else synthetic_queries(matrix, args.queries, args.threshold)
+        for dtype in SNAPSHOT_DTYPES[1:]:
+            print(json.dumps(check_quantization(matrix, queries, dtype, args.threshold)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+import hashlib
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from bson import Binary
+from pymongo import ASCENDING, UpdateOne
+
+from embedding_cache import normalize_question
+
+logger = logging.getLogger(__name__)
+
+# Clock skew allowed between the server processes stamping updated_at; a feed re-reads this much
+FEED_OVERLAP = timedelta(seconds=1)
+
+
+# Function to key an FAQ question so re-loading the same question updates it in place
+def question_hash(question):
+    return hashlib.sha256(normalize_question(question).encode("utf-8")).hexdigest()
+
+
+# Function to pack an embedding as raw little-endian float32 bytes
+def pack_embedding(vector):
+    return Binary(np.asarray(vector, dtype="<f4").tobytes())
+
+
+# Function to decode stored embeddings (packed float32 or legacy arrays of doubles) into one matrix
+def decode_embeddings(stored):
+    if stored and all(isinstance(vector, bytes) for vector in stored):
+        # One buffer, one reshape: no per-vector Python lists
+        return np.frombuffer(b"".join(stored), dtype="<f4").reshape(len(stored), -1)
+    return np.array(
+        [np.frombuffer(vector, dtype="<f4") if isinstance(vector, bytes) else vector for vector in stored],
+        dtype=np.float32,
+    )
+
+
+# Function to build the document stored for one FAQ question
+def faq_document(question, embedding, answer=None):
+    document = {
+        "question_hash": question_hash(question),
+        "question": question,
+        "embedding": pack_embedding(embedding),
+        "dim": len(embedding),
+        "updated_at": datetime.now(timezone.utc),
+    }
+    if answer is not None:
+        document["answer"] = answer
+    return document
+
+
+# Function to create the unique question_hash index, converting legacy documents first
+def ensure_faq_indexes(collection, drop_duplicates=False):
+    migrate_legacy(collection, drop_duplicates=drop_duplicates)
+    collection.create_index([("question_hash", ASCENDING)], unique=True)
+
+
+# Function to convert documents written by the notebook (no hash, array embedding) to the packed format
+def migrate_legacy(collection, batch_size=500, drop_duplicates=False):
+    """Pack legacy embeddings and add question hashes.
+
+    Legacy documents repeating a question already converted cannot take
+    the unique hash; each is logged, and deleted only with
+    `drop_duplicates`, otherwise a ValueError names how many remain.
+    Returns the number of documents converted.
+    """
+    seen = set(collection.distinct("question_hash", {"question_hash": {"$exists": True}}))
+    legacy = collection.find({"question_hash": {"$exists": False}}, {"question": 1, "embedding": 1})
+
+    converted, operations, duplicates = 0, [], []
+    for doc in legacy:
+        digest = question_hash(doc["question"])
+        if digest in seen:
+            duplicates.append(doc["_id"])
+            logger.warning("Legacy FAQ %s repeats the question %r", doc["_id"], doc["question"])
+            continue
+        seen.add(digest)
+        embedding = doc["embedding"]
+        if not isinstance(embedding, bytes):
+            embedding = pack_embedding(embedding)
+        operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+            "question_hash": digest, "embedding": embedding, "dim": len(embedding) // 4,
+        }}))
+        if len(operations) >= batch_size:
+            converted += collection.bulk_write(operations, ordered=False).modified_count
+            operations = []
+    if operations:
+        converted += collection.bulk_write(operations, ordered=False).modified_count
+    if duplicates and not drop_duplicates:
+        raise ValueError(f"{len(duplicates)} legacy FAQ documents repeat a question; "
+                         "rerun with --drop-duplicates to delete them")
+    if duplicates:
+        logger.warning("Deleted %d duplicate legacy FAQ documents", delete_faqs(collection, duplicates))
+    return converted
+
+
+# Function to reach the collection recording which FAQ documents were deleted, and when
+def deleted_faqs(collection):
+    return collection.database[collection.name + "_deleted"]
+
+
+# Function to delete FAQ documents, leaving a tombstone for each so FAQ snapshots drop them too
+def delete_faqs(collection, ids):
+    if not ids:
+        return 0
+    tombstones = deleted_faqs(collection)
+    tombstones.create_index([("deleted_at", ASCENDING)])
+    # Tombstones first: a snapshot that sees one before the delete just drops the document early
+    deleted_at = datetime.now(timezone.utc)
+    tombstones.bulk_write([UpdateOne({"_id": _id}, {"$set": {"deleted_at": deleted_at}}, upsert=True) for _id in ids],
+                          ordered=False)
+    return collection.delete_many({"_id": {"$in": list(ids)}}).deleted_count
+
+
+# Function to upsert FAQ documents by question hash
+def upsert_faqs(collection, documents):
+    operations = [
+        UpdateOne({"question_hash": document["question_hash"]}, {"$set": document}, upsert=True)
+        for document in documents
+    ]
+    if operations:
+        collection.bulk_write(operations, ordered=False)
+
+
+# Function to fetch every FAQ question and its embedding as a float32 matrix
+def fetch_faq_bank(collection, query=None):
+    questions, stored = [], []
+    for doc in collection.find(query or {}, {"_id": 0, "question": 1, "embedding": 1}, batch_size=1000):
+        questions.append(doc["question"])
+        stored.append(doc["embedding"])
+    return questions, decode_embeddings(stored)
+
+
+class FAQFeed:
+    """FAQ documents inserted or updated by any process since a watermark.
+
+    Each server process polls it at most every `interval` seconds to learn
+    the questions other processes added (e.g. teacher-answered ones).
+    `since` should be taken before the FAQ bank was loaded. Documents
+    stamped within FEED_OVERLAP of the watermark are returned again, so
+    callers skip the questions they already have.
+    """
+
+    def __init__(self, collection, since, interval=5.0):
+        self.collection = collection
+        self.interval = interval
+
+        self._watermark = since
+        self._polled_at = time.monotonic()
+        self._lock = threading.Lock()
+        collection.create_index([("updated_at", ASCENDING)])
+
+    def due(self):
+        return time.monotonic() - self._polled_at >= self.interval
+
+    def poll(self, force=False):
+        """Return (question, embedding, answer) for each document changed since the last poll."""
+        if not force and not self.due():
+            return []
+        # One thread polls; the others carry on with the bank they have
+        if not self._lock.acquire(blocking=force):
+            return []
+        try:
+            self._polled_at = time.monotonic()
+            query = {"updated_at": {"$gt": self._watermark - FEED_OVERLAP}}
+            fields = {"question": 1, "embedding": 1, "answer": 1, "updated_at": 1}
+            docs = list(self.collection.find(query, fields).sort("updated_at", ASCENDING))
+            for doc in docs:
+                updated_at = doc["updated_at"]
+                updated_at = updated_at if updated_at.tzinfo else updated_at.replace(tzinfo=timezone.utc)
+                self._watermark = max(self._watermark, updated_at)
+        finally:
+            self._lock.release()
+
+        if not docs:
+            return []
+        vectors = decode_embeddings([doc["embedding"] for doc in docs])
+        return [(doc["question"], vector, doc.get("answer")) for doc, vector in zip(docs, vectors)]
@@ -0,0 +1,38 @@
+import gc
+import os
+
+# Production entry point: gunicorn -c gunicorn.conf.py
+wsgi_app = "wsgi:create_app()"
+bind = os.getenv("GUNICORN_BIND", "0.0.0.0:5000")
+workers = int(os.getenv("GUNICORN_WORKERS", "4"))
+
+# Threads keep streaming answers and teacher long-polls from tying up a whole worker
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "8"))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+# Load the app once in the master so workers share its read-only data
+preload_app = True
+pidfile = os.getenv("GUNICORN_PIDFILE", "./gunicorn.pid")
+
+# No collections while preloading; the loaded objects are then frozen and collection resumes in the
+# master (when_ready) and in each worker (post_fork)
+gc.disable()
+
+
+def when_ready(server):
+    import wsgi
+
+    wsgi.after_preload()
+
+
+def pre_fork(server, worker):
+    import wsgi
+
+    wsgi.before_fork()
+
+
+def post_fork(server, worker):
+    import wsgi
+
+    wsgi.after_fork()
@@ -0,0 +1,163 @@
+import hashlib
+import json
+import os
+
+from langchain_community.vectorstores import FAISS
+
+from chunking import NearDuplicateFilter
+from ingest import ingest_pdfs
+from rag_engine import save_index
+from vector_index import apply_index_config, delete_vectors, needs_rebuild
+
+# Name of the manifest stored next to the FAISS index files
+MANIFEST_FILE = "manifest.json"
+
+
+# Function to hash a PDF's content so renamed or re-uploaded files are recognised
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class IndexManifest:
+    """Map each ingested PDF's content hash to its file name and vector IDs.
+
+    A file's "duplicate_of" lists the hashes of the files whose chunks
+    caused some of its chunks to be dropped as near-duplicates.
+    `chunking` records the settings the chunks were made with.
+    """
+
+    def __init__(self, index_path):
+        self.path = os.path.join(index_path, MANIFEST_FILE)
+        self.files = {}
+        self.chunking = None
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                data = json.load(f)
+            self.files = data["files"]
+            self.chunking = data.get("chunking")
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def save(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"files": self.files, "chunking": self.chunking}, f)
+        os.replace(tmp_path, self.path)
+
+
+# Function to bring the FAISS index in line with a set of PDFs, embedding only what changed
+def sync_index(pdf_paths, embeddings, split_text, index_path, workers=None, batch_size=64, stats=None,
+               index_config=None, chunking=None):
+    """Add vectors for new PDFs, remove vectors for PDFs that are gone, skip the rest.
+
+    Files are identified by content hash, so an unchanged file is never
+    re-embedded. An index built before manifests existed is rebuilt once,
+    or emptied if there are no PDFs left.
+    With `index_config`, the index is converted to the configured type
+    (IVF, HNSW, PQ) before it is saved. `chunking` describes how
+    `split_text` chunks (e.g. its token sizes); if it differs from the
+    settings the index was built with, every file is chunked again. Its
+    "dedupe_threshold", if set, drops chunks that nearly repeat one already
+    in the index; a file whose chunks were dropped for repeating a removed
+    file's is ingested again, so its text stays in the index.
+    Returns the names of the added, removed and re-ingested files and the
+    unchanged count; `stats`, if given, receives the ingestion counts for
+    the files ingested.
+    """
+    manifest = IndexManifest(index_path)
+    current = {}
+    for path in pdf_paths:
+        current.setdefault(file_hash(path), path)
+
+    vector_store = None
+    if manifest.exists():
+        vector_store = FAISS.load_local(index_path, embeddings=embeddings, allow_dangerous_deserialization=True)
+
+    # Chunks made with other settings are not comparable: replace every file's vectors
+    rechunk = chunking is not None and manifest.exists() and manifest.chunking != chunking
+    if chunking is not None:
+        manifest.chunking = chunking
+    removed = [digest for digest in manifest.files if rechunk or digest not in current]
+    added = [digest for digest in current if rechunk or digest not in manifest.files]
+    # Chunks dropped as repeats of a removed file's chunks would otherwise be lost with it
+    gone = set(removed)
+    reingested = [digest for digest, entry in manifest.files.items()
+                  if digest not in gone and gone & set(entry.get("duplicate_of", ()))]
+    # A changed index type (e.g. FAISS_INDEX_TYPE) rebuilds the index even when no file changed
+    retype = vector_store is not None and index_config is not None and needs_rebuild(vector_store.index, index_config)
+    # With no PDFs left nothing stays in the index, not even vectors no manifest entry names
+    clear = not current and os.path.exists(os.path.join(index_path, "index.faiss"))
+    if clear and vector_store is None:
+        vector_store = FAISS.load_local(index_path, embeddings=embeddings, allow_dangerous_deserialization=True)
+    clear = clear and vector_store.index.ntotal > 0
+    if not removed and not added and vector_store is not None and not retype and not clear:
+        return {"added": [], "removed": [], "reingested": [], "unchanged": len(current)}
+
+    removed_ids = [doc_id for digest in removed + reingested for doc_id in manifest.files[digest]["ids"]]
+    if clear:
+        removed_ids = list(vector_store.index_to_docstore_id.values())
+    removed_names = [manifest.files[digest]["name"] for digest in removed]
+    for digest in removed + reingested:
+        del manifest.files[digest]
+    if removed_ids:
+        delete_vectors(vector_store, removed_ids, index_config)
+
+    ingested = added + reingested
+    if ingested:
+        stats = stats if stats is not None else {}
+        dedupe = None
+        if chunking and chunking.get("dedupe_threshold"):
+            dedupe = NearDuplicateFilter(chunking["dedupe_threshold"])
+            for doc_id in (vector_store.index_to_docstore_id.values() if vector_store is not None else []):
+                document = vector_store.docstore.search(doc_id)
+                dedupe.add(document.page_content, source=document.metadata.get("source"))
+        vector_store = ingest_pdfs(
+            [current[digest] for digest in ingested], embeddings, split_text,
+            workers=workers, batch_size=batch_size, stats=stats, vector_store=vector_store, dedupe=dedupe,
+        )
+        # Chunks are tagged with their file's name; the manifest records the file hashes
+        digests = {entry["name"]: digest for digest, entry in manifest.files.items()}
+        digests.update((os.path.basename(current[digest]), digest) for digest in ingested)
+        for digest in ingested:
+            name = os.path.basename(current[digest])
+            sources = dedupe.duplicate_of.get(name, ()) if dedupe is not None else ()
+            manifest.files[digest] = {"name": name, "ids": stats["ids"][name],
+                                      "duplicate_of": sorted(digests[source] for source in sources if source in digests)}
+
+    result = {
+        "added": [os.path.basename(current[digest]) for digest in added],
+        "removed": removed_names,
+        "reingested": [os.path.basename(current[digest]) for digest in reingested],
+        "unchanged": len(current) - len(ingested),
+    }
+
+    if vector_store is not None:
+        save_index(apply_index_config(vector_store, index_config), index_path)
+        manifest.save()
+    return result
+
+
+# Function to delete one PDF and its vectors from the index
+def remove_pdf(path, embeddings, split_text, index_path, index_config=None, chunking=None):
+    """Remove `path` from disk and drop its vectors.
+
+    The other PDFs in its folder are synced as they are, so only those with
+    chunks dropped as repeats of this one's are embedded again.
+    """
+    digest = file_hash(path)
+    os.remove(path)
+
+    manifest = IndexManifest(index_path)
+    if digest not in manifest.files:
+        return False
+
+    folder = os.path.dirname(path)
+    others = [os.path.join(folder, entry["name"]) for other, entry in manifest.files.items() if other != digest]
+    sync_index([other for other in others if os.path.exists(other)], embeddings, split_text, index_path,
+               index_config=index_config, chunking=chunking)
+    return True
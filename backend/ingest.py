@@ -0,0 +1,156 @@
+import argparse
+import os
+import resource
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from PyPDF2 import PdfReader
+
+from rag_engine import save_index
+
+
+# Function to extract the text of a range of pages from one PDF (runs in a worker process)
+def extract_pages(path, start, stop):
+    reader = PdfReader(path)
+    return [(path, number, reader.pages[number].extract_text() or "") for number in range(start, stop)]
+
+
+# Function to split every PDF into page-range tasks for the worker pool
+def iter_page_tasks(paths, pages_per_task):
+    for path in paths:
+        page_count = len(PdfReader(path).pages)
+        for start in range(0, page_count, pages_per_task):
+            yield path, start, min(start + pages_per_task, page_count)
+
+
+# Function to extract PDF pages in a process pool and yield them in order
+def iter_pdf_pages(paths, workers=None, pages_per_task=8):
+    """Yield (path, page_number, text) for every page of every PDF.
+
+    At most two tasks per worker are in flight, so memory stays bounded by
+    the pool size rather than by the size of the PDFs.
+    """
+    workers = workers or os.cpu_count() or 1
+    with ProcessPoolExecutor(workers) as pool:
+        in_flight = deque()
+        for task in iter_page_tasks(paths, pages_per_task):
+            in_flight.append(pool.submit(extract_pages, *task))
+            if len(in_flight) >= workers * 2:
+                yield from in_flight.popleft().result()
+        while in_flight:
+            yield from in_flight.popleft().result()
+
+
+# Function to pass pages through while counting them into `stats`
+def count_pages(pages, stats):
+    for page in pages:
+        stats["pages"] += 1
+        yield page
+
+
+# Function to split pages into chunk documents that remember their source file and page
+def iter_chunks(pages, split_text):
+    for path, number, text in pages:
+        for chunk in split_text(text):
+            yield Document(page_content=chunk, metadata={"source": os.path.basename(path), "page": number + 1})
+
+
+# Function to group an iterable into lists of at most `size` items
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+# Function to ingest PDFs into a FAISS vector store, embedding chunks in batches
+def ingest_pdfs(paths, embeddings, split_text, index_path=None, workers=None, batch_size=64, stats=None, vector_store=None,
+                dedupe=None):
+    """Build (or extend `vector_store`) from `paths` without holding the corpus in memory.
+
+    Pages are extracted in parallel, split as they arrive, and embedded
+    `batch_size` chunks at a time. Chunks that `dedupe` (a
+    NearDuplicateFilter) rejects are never embedded. If `stats` is a dict
+    it is filled with page, chunk, duplicate and timing counts, and with
+    the vector IDs added per file.
+    """
+    stats = stats if stats is not None else {}
+    stats.update(pages=0, chunks=0, duplicates=0, ids={os.path.basename(path): [] for path in paths})
+    started = time.perf_counter()
+
+    pages = count_pages(iter_pdf_pages(paths, workers), stats)
+    chunks = iter_chunks(pages, split_text)
+    if dedupe is not None:
+        chunks = dedupe.filter(chunks)
+    for batch in batched(chunks, batch_size):
+        texts = [doc.page_content for doc in batch]
+        metadatas = [doc.metadata for doc in batch]
+        ids = [str(uuid.uuid4()) for _ in batch]
+        vectors = embeddings.embed_documents(texts)
+        if vector_store is None:
+            vector_store = FAISS.from_embeddings(list(zip(texts, vectors)), embeddings, metadatas=metadatas, ids=ids)
+        else:
+            vector_store.add_embeddings(list(zip(texts, vectors)), metadatas=metadatas, ids=ids)
+        for doc, doc_id in zip(batch, ids):
+            stats["ids"][doc.metadata["source"]].append(doc_id)
+        stats["chunks"] += len(batch)
+
+    stats["duplicates"] = dedupe.duplicates if dedupe is not None else 0
+    stats["seconds"] = time.perf_counter() - started
+
+    if vector_store is not None and index_path:
+        save_index(vector_store, index_path)
+    return vector_store
+
+
+# Function to list the PDF files in a folder
+def list_pdfs(folder):
+    return sorted(os.path.join(folder, name) for name in os.listdir(folder) if name.lower().endswith(".pdf"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingest new PDFs from a folder into the FAISS index, skipping unchanged ones.")
+    parser.add_argument("folder", nargs="?", default="./teacher_pdfs")
+    parser.add_argument("--index-path", default="./faiss_index")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--dry-run", action="store_true", help="extract and chunk only; skip embedding and saving")
+    args = parser.parse_args()
+
+    from index_manifest import sync_index
+    from chunking import NearDuplicateFilter
+    from utils import CHUNKING, embeddings, get_text_chunks, index_config
+
+    paths = list_pdfs(args.folder)
+    stats = {"pages": 0, "chunks": 0, "duplicates": 0}
+    if args.dry_run:
+        started = time.perf_counter()
+        pages = count_pages(iter_pdf_pages(paths, args.workers), stats)
+        chunks = iter_chunks(pages, get_text_chunks)
+        dedupe = NearDuplicateFilter(CHUNKING["dedupe_threshold"]) if CHUNKING["dedupe_threshold"] else None
+        stats["chunks"] = sum(1 for _ in (dedupe.filter(chunks) if dedupe else chunks))
+        stats["duplicates"] = dedupe.duplicates if dedupe else 0
+        stats["seconds"] = time.perf_counter() - started
+    else:
+        started = time.perf_counter()
+        result = sync_index(
+            paths, embeddings, get_text_chunks, args.index_path, args.workers, args.batch_size, stats,
+            index_config, CHUNKING
+        )
+        stats["seconds"] = time.perf_counter() - started
+        print(f"added {result['added']}, removed {result['removed']}, re-ingested {result['reingested']}, "
+              f"{result['unchanged']} unchanged")
+
+    seconds = max(stats["seconds"], 1e-9)
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{len(paths)} files, {stats['pages']} pages, {stats['chunks']} chunks "
+          f"({stats['duplicates']} near-duplicates skipped) in {seconds:.2f}s")
+    print(f"{stats['pages'] / seconds:.1f} pages/sec, {stats['chunks'] / seconds:.1f} chunks/sec, peak RSS {peak_mb:.0f} MB")
+
+
+if __name__ == "__main__":
+    main()
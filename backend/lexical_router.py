@@ -0,0 +1,157 @@
+import math
+import re
+import threading
+from collections import Counter, defaultdict
+
+from embedding_cache import normalize_question
+
+# Words too common to tell FAQ questions apart
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from how i in is it me of on or the this to what when where which who
+why will with you your
+""".split())
+
+
+# Function to split text into lowercase content words
+def tokenize(text):
+    return [token for token in re.findall(r"[a-z0-9]+", text.lower()) if token not in STOPWORDS]
+
+
+class LexicalRouter:
+    """Exact and BM25 matching of messages against the FAQ questions, before any embedding.
+
+    A message whose normalized text equals an FAQ question is an exact
+    match. Otherwise the FAQ questions and answers are ranked with BM25
+    (question words weigh `question_weight` times as much as answer words).
+    The best candidate is a lexical match only if its question shares at
+    least `min_overlap` of its content words (Jaccard) with the message and
+    it outscores the runner-up by `min_margin`. Everything else returns
+    None and goes through the embedding path.
+
+    Questions can be added while matching goes on (`add`): each new
+    question's entries are written before any posting points at it, and
+    the IDF table is swapped in whole.
+    """
+
+    def __init__(self, questions, answers=None, min_overlap=0.8, min_margin=1.2, question_weight=2, k1=1.2, b=0.75):
+        self.min_overlap = min_overlap
+        self.min_margin = min_margin
+        self.question_weight = question_weight
+        self.k1 = k1
+        self.b = b
+
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self.exact = 0
+        self.lexical = 0
+        self.misses = 0
+
+        self.questions, self.answers = [], []
+        self._exact_index = {}
+        self._question_tokens = []
+        self._postings = defaultdict(list)  # term -> [(doc, term frequency)]
+        self._lengths = []
+        answers = answers if answers is not None else [None] * len(questions)
+        for question, answer in zip(questions, answers):
+            self._add(question, answer)
+        self._finish()
+
+    @classmethod
+    def from_collection(cls, collection, **kwargs):
+        """Build the router from the FAQ documents' question and answer text."""
+        questions, answers = [], []
+        for doc in collection.find({}, {"_id": 0, "question": 1, "answer": 1}, batch_size=1000):
+            questions.append(doc["question"])
+            answers.append(doc.get("answer"))
+        return cls(questions, answers, **kwargs)
+
+    def _add(self, question, answer):
+        doc = len(self.questions)
+        self.questions.append(question)
+        self.answers.append(answer if isinstance(answer, str) and answer.strip() else None)
+
+        question_tokens = tokenize(question)
+        terms = Counter(question_tokens * self.question_weight + tokenize(self.answers[doc] or ""))
+        self._question_tokens.append(frozenset(question_tokens))
+        self._lengths.append(sum(terms.values()))
+        for term, count in terms.items():
+            self._postings[term].append((doc, count))
+        self._exact_index.setdefault(normalize_question(question), doc)
+
+    def _finish(self):
+        count = len(self.questions)
+        self._average_length = sum(self._lengths) / count if count else 0.0
+        # Assigned in one step: a match uses either the old table or the new one
+        self._idf = {
+            term: math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for term, postings in self._postings.items()
+        }
+
+    def __len__(self):
+        return len(self.questions)
+
+    def __contains__(self, question):
+        return normalize_question(question) in self._exact_index
+
+    def add(self, question, answer=None):
+        """Add an FAQ question and its answer; returns False if the question is already known."""
+        with self._write_lock:
+            if question in self:
+                return False
+            self._add(question, answer)
+            self._finish()
+        return True
+
+    def answer_for(self, question):
+        """Return the stored answer of the FAQ `question`, or None."""
+        doc = self._exact_index.get(normalize_question(question))
+        return self.answers[doc] if doc is not None else None
+
+    def _rank(self, tokens):
+        scores = defaultdict(float)
+        for term in set(tokens):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for doc, frequency in self._postings[term]:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc] / self._average_length)
+                scores[doc] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return sorted(scores.items(), key=lambda item: -item[1])[:2]
+
+    def match(self, message):
+        """Return {"kind", "index", "question", "answer", "score"} for a confident match, else None."""
+        result = None
+        doc = self._exact_index.get(normalize_question(message))
+        if doc is not None:
+            result = {"kind": "exact", "index": doc, "score": 1.0}
+        else:
+            tokens = tokenize(message)
+            ranked = self._rank(tokens) if tokens else []
+            if ranked:
+                doc, top = ranked[0]
+                runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+                query, candidate = set(tokens), self._question_tokens[doc]
+                overlap = len(query & candidate) / len(query | candidate)
+                if overlap >= self.min_overlap and top >= self.min_margin * runner_up:
+                    result = {"kind": "lexical", "index": doc, "score": round(overlap, 4)}
+
+        with self._lock:
+            if result is None:
+                self.misses += 1
+            elif result["kind"] == "exact":
+                self.exact += 1
+            else:
+                self.lexical += 1
+        if result is None:
+            return None
+        return dict(result, question=self.questions[result["index"]], answer=self.answers[result["index"]])
+
+    def stats(self):
+        lookups = self.exact + self.lexical + self.misses
+        return {
+            "exact": self.exact,
+            "lexical": self.lexical,
+            "misses": self.misses,
+            "short_circuit_rate": (self.exact + self.lexical) / lookups if lookups else 0.0,
+            "questions": len(self.questions),
+        }
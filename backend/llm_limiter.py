@@ -0,0 +1,237 @@
+import argparse
+import asyncio
+import json
+import statistics
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager, contextmanager
+
+from metrics import Histogram
+
+
+class Overloaded(Exception):
+    """Raised when a request cannot get an LLM slot; `reason` is "queue_full" or "deadline"."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason
+
+
+class _Waiter:
+    # One queued request; `granted` is set under the limiter lock when it receives a slot,
+    # then `wake` is called (an Event for threads, a future on the event loop for coroutines)
+    def __init__(self, wake):
+        self.wake = wake
+        self.granted = False
+
+
+# Function to complete a waiter's future unless the waiting coroutine already gave up
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LLMLimiter:
+    """Bound the number of LLM calls running at once, queueing the rest fairly by user.
+
+    At most `max_concurrent` calls run. Further requests wait in a per-user
+    queue, and freed slots go to users in round-robin order, so one student
+    resubmitting cannot starve the others. A request is shed with
+    Overloaded("queue_full") when `max_queue` requests are already waiting
+    or its user has `max_queued_per_user` waiting, and with
+    Overloaded("deadline") if no slot frees up within `max_wait` seconds.
+    """
+
+    def __init__(self, max_concurrent=8, max_queue=64, max_queued_per_user=2, max_wait=10.0):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.max_queued_per_user = max_queued_per_user
+        self.max_wait = max_wait
+
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._queued = 0
+        self._queues = OrderedDict()  # user -> deque of waiters, in round-robin order
+        self.admitted = 0
+        self.shed = Counter()
+        self.wait_times = Histogram(
+            "eduquery_llm_queue_wait_seconds", "Time a request waited for an LLM slot.",
+            [0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0],
+        )
+
+    def _enqueue(self, user, wake):
+        # Take a free slot (returns None) or join the user's queue (returns the waiter)
+        with self._lock:
+            if self._in_flight < self.max_concurrent and not self._queued:
+                self._in_flight += 1
+                self.admitted += 1
+                self.wait_times.observe(0.0)
+                return None
+            if self._queued >= self.max_queue or len(self._queues.get(user, ())) >= self.max_queued_per_user:
+                self.shed["queue_full"] += 1
+                raise Overloaded("queue_full")
+            waiter = _Waiter(wake)
+            self._queues.setdefault(user, deque()).append(waiter)
+            self._queued += 1
+            return waiter
+
+    def _leave(self, user, waiter):
+        # Take a waiter that was never granted a slot out of its user's queue; call with the lock held
+        waiters = self._queues[user]
+        waiters.remove(waiter)
+        if not waiters:
+            del self._queues[user]
+        self._queued -= 1
+
+    def _settle(self, user, waiter, started):
+        # After waking or timing out: either keep the granted slot or leave the queue
+        with self._lock:
+            if not waiter.granted:
+                self._leave(user, waiter)
+                self.shed["deadline"] += 1
+                raise Overloaded("deadline")
+            self.admitted += 1
+        self.wait_times.observe(time.monotonic() - started)
+
+    def _abandon(self, user, waiter):
+        # The waiting coroutine was cancelled: leave the queue, or pass on a slot granted meanwhile
+        with self._lock:
+            if not waiter.granted:
+                self._leave(user, waiter)
+                return
+        self.release()
+
+    def acquire(self, user, timeout=None):
+        """Take an LLM slot for `user`, waiting up to `timeout` (default `max_wait`) seconds."""
+        started = time.monotonic()
+        event = threading.Event()
+        waiter = self._enqueue(user, event.set)
+        if waiter is not None:
+            event.wait(self.max_wait if timeout is None else timeout)
+            self._settle(user, waiter, started)
+
+    async def acquire_async(self, user, timeout=None):
+        """Like acquire, but waits on the event loop instead of blocking a thread."""
+        started = time.monotonic()
+        loop = asyncio.get_running_loop()
+        granted = loop.create_future()
+        waiter = self._enqueue(user, lambda: loop.call_soon_threadsafe(_resolve, granted))
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), self.max_wait if timeout is None else timeout)
+            except asyncio.TimeoutError:
+                pass
+            except asyncio.CancelledError:
+                # E.g. the client disconnected; otherwise the waiter would hold its place, or its slot, forever
+                self._abandon(user, waiter)
+                raise
+            self._settle(user, waiter, started)
+
+    def release(self):
+        with self._lock:
+            self._in_flight -= 1
+            if self._queues:
+                # Hand the slot to the next user in turn, then send that user to the back
+                user, waiters = next(iter(self._queues.items()))
+                waiter = waiters.popleft()
+                if waiters:
+                    self._queues.move_to_end(user)
+                else:
+                    del self._queues[user]
+                self._queued -= 1
+                self._in_flight += 1
+                waiter.granted = True
+                waiter.wake()
+
+    @contextmanager
+    def slot(self, user, timeout=None):
+        self.acquire(user, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, user, timeout=None):
+        await self.acquire_async(user, timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "queued": self._queued,
+                "queued_users": len(self._queues),
+                "admitted": self.admitted,
+                "shed": dict(self.shed),
+            }
+
+
+# Function to drive a limiter with concurrent students calling a fake LLM of fixed latency
+def simulate(limiter, llm, users, requests_per_user, arrival_window):
+    """Send every user's requests spread over `arrival_window` seconds.
+
+    Returns the outcome counts, the latency of answered requests and the
+    number answered per user.
+    """
+    outcomes, latencies, answered = Counter(), [], Counter()
+    lock = threading.Lock()
+
+    def ask(user, delay):
+        time.sleep(delay)
+        started = time.perf_counter()
+        try:
+            with limiter.slot(user):
+                llm.invoke("What is line coding?")
+        except Overloaded as e:
+            with lock:
+                outcomes[e.reason] += 1
+            return
+        with lock:
+            outcomes["answered"] += 1
+            latencies.append(time.perf_counter() - started)
+            answered[user] += 1
+
+    jobs = [(f"student{u}", arrival_window * (r * users + u) / (users * requests_per_user))
+            for r in range(requests_per_user) for u in range(users)]
+    with ThreadPoolExecutor(len(jobs)) as pool:
+        list(pool.map(lambda job: ask(*job), jobs))
+    return outcomes, sorted(latencies), answered
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate a lecture spike against the LLM limiter with a local fake LLM.")
+    parser.add_argument("--users", type=int, default=60)
+    parser.add_argument("--requests-per-user", type=int, default=2)
+    parser.add_argument("--window", type=float, default=2.0, help="seconds over which requests arrive")
+    parser.add_argument("--latency", type=float, default=1.0, help="seconds the fake LLM takes per answer")
+    parser.add_argument("--max-concurrent", type=int, default=8)
+    parser.add_argument("--max-queue", type=int, default=64)
+    parser.add_argument("--max-wait", type=float, default=5.0)
+    args = parser.parse_args()
+
+    from fakes import FakeStreamingChatModel
+
+    llm = FakeStreamingChatModel(first_token_delay=args.latency, streaming=False)
+    limiter = LLMLimiter(args.max_concurrent, args.max_queue, max_wait=args.max_wait)
+    started = time.perf_counter()
+    outcomes, latencies, answered = simulate(limiter, llm, args.users, args.requests_per_user, args.window)
+
+    print(json.dumps({
+        "requests": args.users * args.requests_per_user,
+        "seconds": round(time.perf_counter() - started, 2),
+        "outcomes": dict(outcomes),
+        "median_latency_s": round(statistics.median(latencies), 3) if latencies else None,
+        "max_latency_s": round(latencies[-1], 3) if latencies else None,
+        "users_answered": len(answered),
+        "limiter": limiter.stats(),
+    }))
+
+
+if __name__ == "__main__":
+    main()
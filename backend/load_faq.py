@@ -0,0 +1,111 @@
+import argparse
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from faq_store import ensure_faq_indexes, faq_document, question_hash, upsert_faqs
+from ingest import batched
+
+
+# Function to read the question hashes already loaded by an earlier, interrupted run
+def read_checkpoint(path):
+    if not path or not os.path.exists(path):
+        return set()
+    with open(path) as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+# Function to read (question, answer) rows from the FAQ CSV, skipping blanks and repeats
+def read_faqs(csv_path, question_column="Question", answer_column="Answers"):
+    df = pd.read_csv(csv_path, encoding="ISO-8859-1")
+    answers = df[answer_column] if answer_column in df.columns else [None] * len(df)
+
+    faqs, seen = [], set()
+    for question, answer in zip(df[question_column], answers):
+        if not isinstance(question, str) or not question.strip():
+            continue
+        digest = question_hash(question)
+        if digest in seen:
+            continue
+        seen.add(digest)
+        faqs.append((question.strip(), answer if isinstance(answer, str) else None))
+    return faqs
+
+
+# Function to embed FAQs in batches and upsert them into MongoDB
+def load_faqs(faqs, embeddings, collection, batch_size=256, concurrency=4, checkpoint_path=None):
+    """Embed and store `faqs`, resuming from `checkpoint_path` if a previous run was interrupted.
+
+    At most `concurrency` embedding requests are in flight. Each finished
+    batch is upserted by question hash and its hashes are appended to the
+    checkpoint, so a rerun only embeds what is missing.
+    """
+    done = read_checkpoint(checkpoint_path)
+    pending = [(question, answer) for question, answer in faqs if question_hash(question) not in done]
+    stats = {"skipped": len(faqs) - len(pending), "loaded": 0}
+
+    def embed(batch):
+        return batch, embeddings.embed_documents([question for question, _ in batch])
+
+    def store(batch, vectors):
+        documents = [faq_document(question, vector, answer) for (question, answer), vector in zip(batch, vectors)]
+        upsert_faqs(collection, documents)
+        if checkpoint_path:
+            with open(checkpoint_path, "a") as f:
+                f.writelines(document["question_hash"] + "\n" for document in documents)
+        stats["loaded"] += len(documents)
+
+    with ThreadPoolExecutor(concurrency) as pool:
+        in_flight = deque()
+        for batch in batched(pending, batch_size):
+            in_flight.append(pool.submit(embed, batch))
+            if len(in_flight) >= concurrency:
+                store(*in_flight.popleft().result())
+        while in_flight:
+            store(*in_flight.popleft().result())
+    return stats
+
+
+def main():
+    # Read .env first so MONGO_DB and the OpenAI settings apply
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Embed the FAQ CSV and upsert it into MongoDB as packed float32 vectors.")
+    parser.add_argument("csv", nargs="?", default="faq.csv")
+    parser.add_argument("--question-column", default="Question")
+    parser.add_argument("--answer-column", default="Answers")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/")
+    parser.add_argument("--mongo-db", default=os.getenv("MONGO_DB", "tutor"))
+    parser.add_argument("--collection", default="openai_embedding")
+    parser.add_argument("--batch-size", type=int, default=256, help="questions per embedding request")
+    parser.add_argument("--concurrency", type=int, default=4, help="embedding requests in flight")
+    parser.add_argument("--checkpoint", default="faq_load.checkpoint", help="file of loaded question hashes")
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and re-embed everything")
+    parser.add_argument("--drop-duplicates", action="store_true",
+                        help="delete legacy FAQ documents that repeat a question (each is logged)")
+    args = parser.parse_args()
+
+    from langchain_openai import OpenAIEmbeddings
+
+    # The plain client, so each batch is one request: the server's embedding batcher would re-split
+    # them, and its cache is meant for questions asked at runtime
+    embeddings = OpenAIEmbeddings(chunk_size=args.batch_size)
+
+    collection = MongoClient(args.mongo_uri)[args.mongo_db][args.collection]
+    ensure_faq_indexes(collection, drop_duplicates=args.drop_duplicates)
+    if args.restart and os.path.exists(args.checkpoint):
+        os.remove(args.checkpoint)
+
+    faqs = read_faqs(args.csv, args.question_column, args.answer_column)
+    started = time.perf_counter()
+    stats = load_faqs(faqs, embeddings, collection, args.batch_size, args.concurrency, args.checkpoint)
+    seconds = time.perf_counter() - started
+    print(f"{len(faqs)} FAQs: {stats['loaded']} loaded, {stats['skipped']} already loaded, in {seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import re
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from contextlib import contextmanager
+from multiprocessing import Process
+
+import httpx
+import numpy as np
+
+from fakes import HashingFakeEmbeddings
+
+# Answer the stand-in LLM streams back, word by word
+FAKE_ANSWER = "Line coding converts a sequence of bits into a digital signal, as described in the chapter on digital transmission."
+
+
+# Function to build a local stand-in for the OpenAI embeddings and chat completions endpoints
+def fake_openai_app(embed_latency, llm_latency, token_delay, dim):
+    """Starlette app answering like the OpenAI API after fixed delays.
+
+    Embeddings are hashed bags of words (or of token IDs, which is what
+    langchain sends after tokenizing), so a question always gets the same
+    vector. /stats reports the requests seen and the most that were in
+    flight at once; DELETE /stats resets them between runs.
+    """
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, StreamingResponse
+    from starlette.routing import Route
+
+    embedder = HashingFakeEmbeddings(dim)
+    tokens = re.findall(r"\s*\S+", FAKE_ANSWER)
+    requests, in_flight, peaks = Counter(), Counter(), Counter()
+
+    @contextmanager
+    def tracking(kind):
+        requests[kind] += 1
+        in_flight[kind] += 1
+        peaks[kind] = max(peaks[kind], in_flight[kind])
+        try:
+            yield
+        finally:
+            in_flight[kind] -= 1
+
+    async def embeddings(request):
+        body = await request.json()
+        inputs = body["input"]
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        with tracking("embeddings"):
+            await asyncio.sleep(embed_latency)
+
+        data = []
+        for i, item in enumerate(inputs):
+            text = item if isinstance(item, str) else " ".join(map(str, item))
+            vector = np.array(embedder.embed_query(text), dtype=np.float32)
+            if body.get("encoding_format") == "base64":
+                embedding = base64.b64encode(vector.tobytes()).decode("ascii")
+            else:
+                embedding = vector.tolist()
+            data.append({"object": "embedding", "index": i, "embedding": embedding})
+        return JSONResponse({
+            "object": "list", "data": data, "model": body.get("model"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    async def chat_completions(request):
+        body = await request.json()
+        created = int(time.time())
+
+        def chunk(delta, finish_reason=None):
+            return "data: " + json.dumps({
+                "id": "chatcmpl-loadtest", "object": "chat.completion.chunk", "created": created,
+                "model": body.get("model"), "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }) + "\n\n"
+
+        async def stream():
+            with tracking("chat"):
+                await asyncio.sleep(llm_latency)
+                yield chunk({"role": "assistant", "content": ""})
+                for n, token in enumerate(tokens):
+                    if n:
+                        await asyncio.sleep(token_delay)
+                    yield chunk({"content": token})
+                yield chunk({}, "stop")
+                if (body.get("stream_options") or {}).get("include_usage"):
+                    yield "data: " + json.dumps({
+                        "id": "chatcmpl-loadtest", "object": "chat.completion.chunk", "created": created,
+                        "model": body.get("model"), "choices": [],
+                        "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+                    }) + "\n\n"
+                yield "data: [DONE]\n\n"
+
+        if body.get("stream"):
+            return StreamingResponse(stream(), media_type="text/event-stream")
+        with tracking("chat"):
+            await asyncio.sleep(llm_latency + token_delay * (len(tokens) - 1))
+        return JSONResponse({
+            "id": "chatcmpl-loadtest", "object": "chat.completion", "created": created, "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": FAKE_ANSWER}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": len(tokens), "total_tokens": len(tokens)},
+        })
+
+    async def stats(request):
+        if request.method == "DELETE":
+            requests.clear()
+            peaks.clear()
+        return JSONResponse({"requests": dict(requests), "peak_in_flight": dict(peaks)})
+
+    return Starlette(routes=[
+        Route("/v1/embeddings", embeddings, methods=["POST"]),
+        Route("/v1/chat/completions", chat_completions, methods=["POST"]),
+        Route("/stats", stats, methods=["GET", "DELETE"]),
+    ])
+
+
+# Function to run the stand-in OpenAI API (in its own process, so it never competes with the load generator)
+def serve_fake_openai(port, embed_latency, llm_latency, token_delay, dim):
+    import uvicorn
+
+    app = fake_openai_app(embed_latency, llm_latency, token_delay, dim)
+    uvicorn.run(app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+
+
+# Function to pick a free local port
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+# Function to wait until `url` answers, failing early if the process serving it exits
+def wait_until_ready(url, alive, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if not alive():
+            raise RuntimeError(f"Server for {url} exited during startup")
+        try:
+            if httpx.get(url, timeout=2.0).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    raise RuntimeError(f"{url} not ready after {timeout}s")
+
+
+# Function to start the backend under gunicorn (Flask) or uvicorn (ASGI)
+def start_backend(server, port, workers, threads, env, log):
+    if server == "flask":
+        command = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py"]
+        env = dict(env, GUNICORN_BIND=f"127.0.0.1:{port}", GUNICORN_WORKERS=str(workers), GUNICORN_THREADS=str(threads))
+    else:
+        command = [sys.executable, "-m", "uvicorn", "asgi:app", "--host", "127.0.0.1", "--port", str(port),
+                   "--workers", str(workers), "--no-access-log", "--backlog", "4096"]
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.Popen(command, cwd=backend_dir, env=env, stdout=log, stderr=subprocess.STDOUT)
+
+
+# Function to yield student messages: FAQ questions (answered by RAG) mixed with off-topic ones (sent to the teacher)
+def workload(questions, rag_share, seed=0):
+    rng = random.Random(seed)
+    n = 0
+    while True:
+        n += 1
+        if rng.random() < rag_share:
+            yield rng.choice(questions)
+        else:
+            yield f"Who do I contact about hostel form {n} before the exam week?"
+
+
+# Function to register a load test student and log in, returning the session token the chat routes expect
+async def log_in(client, n):
+    account = {"name": f"Load test student {n}", "username": f"loadtest-student-{n}", "password": "loadtest",
+               "isStudent": True, "className": "loadtest"}
+    await client.post("/register", json=account)  # 400 when it already exists, e.g. on a second server
+    response = await client.post("/login", json={"username": account["username"], "password": account["password"]})
+    response.raise_for_status()
+    return response.json()["session_id"]
+
+
+# Function to keep `students` concurrent sessions sending messages back to back for `duration` seconds
+async def run_load(base_url, messages, students, duration, ramp, timeout):
+    """Return the outcome counts, sorted latencies of answered requests and the elapsed time.
+
+    Each simulated student waits for its answer before asking again, the
+    way the chat UI does; students log in first, then join evenly over
+    `ramp` seconds.
+    """
+    outcomes, latencies = Counter(), []
+    limits = httpx.Limits(max_connections=students, max_keepalive_connections=students)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+        sessions = await asyncio.gather(*(log_in(client, n) for n in range(students)))
+
+        async def student(n):
+            await asyncio.sleep(ramp * n / students)
+            session = sessions[n]
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    response = await client.post("/api/send-message", json={"message": next(messages), "session_id": session})
+                except httpx.TimeoutException:
+                    outcomes["timeout"] += 1
+                    continue
+                except httpx.HTTPError:
+                    outcomes["error"] += 1
+                    await asyncio.sleep(0.1)
+                    continue
+                if response.status_code != 200:
+                    outcomes[f"http_{response.status_code}"] += 1
+                    continue
+                outcomes["degraded" if response.json().get("degraded") else "ok"] += 1
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        deadline = started + ramp + duration
+        await asyncio.gather(*(student(n) for n in range(students)))
+    return outcomes, sorted(latencies), time.perf_counter() - started
+
+
+# Function to read a percentile from sorted values, in milliseconds
+def percentile_ms(values, q):
+    return round(values[min(len(values) - 1, int(len(values) * q))] * 1000, 1) if values else None
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Load test the Flask (gunicorn) and ASGI (uvicorn) backends end to end against a local stand-in "
+                    "OpenAI API. Needs MongoDB running on localhost:27017; there is no in-process mock."
+    )
+    parser.add_argument("--servers", nargs="+", choices=["flask", "asgi"], default=["flask", "asgi"])
+    parser.add_argument("--students", type=int, default=200, help="concurrent student sessions")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of load per server")
+    parser.add_argument("--ramp", type=float, default=2.0, help="seconds over which students join")
+    parser.add_argument("--timeout", type=float, default=60.0, help="client timeout per request")
+    parser.add_argument("--rag-share", type=float, default=0.7, help="fraction of messages that are FAQ questions")
+    parser.add_argument("--workers", type=int, default=1, help="server processes")
+    parser.add_argument("--threads", type=int, default=8, help="threads per gunicorn worker")
+    parser.add_argument("--embed-latency", type=float, default=0.2, help="seconds per stand-in embedding request")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="seconds before the stand-in LLM's first token")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed tokens")
+    parser.add_argument("--dim", type=int, default=1536, help="stand-in embedding size")
+    parser.add_argument("--questions", default="faq.csv", help="FAQ CSV to seed the scratch database with")
+    parser.add_argument("--pdfs", default="./teacher_pdfs", help="PDFs to build the scratch document index from")
+    parser.add_argument("--mongo-db", default="eduquery_loadtest", help="scratch database, dropped afterwards")
+    parser.add_argument("--keep-db", action="store_true")
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    fake_port = free_port()
+    fake_url = f"http://127.0.0.1:{fake_port}"
+    fake = Process(target=serve_fake_openai, daemon=True,
+                   args=(fake_port, args.embed_latency, args.llm_latency, args.token_delay, args.dim))
+    fake.start()
+    wait_until_ready(fake_url + "/stats", fake.is_alive, 30)
+
+    # This process and the servers all embed through the stand-in API
+    os.environ.update(OPENAI_API_KEY="loadtest", OPENAI_API_BASE=fake_url + "/v1", OPENAI_BASE_URL=fake_url + "/v1")
+
+    from langchain_openai import OpenAIEmbeddings
+    from pymongo import MongoClient
+
+    from chunking import token_splitter
+    from faq_store import ensure_faq_indexes
+    from index_manifest import sync_index
+    from ingest import list_pdfs
+    from load_faq import load_faqs, read_faqs
+
+    embeddings = OpenAIEmbeddings()
+    workdir = tempfile.mkdtemp(prefix="eduquery-loadtest-")
+    index_path = os.path.join(workdir, "faiss_index")
+    sync_index(list_pdfs(args.pdfs), embeddings, token_splitter().split_text, index_path)
+
+    # The servers connect to localhost:27017 too, so they see the scratch database seeded here
+    client = MongoClient('mongodb://localhost:27017/')
+    client.drop_database(args.mongo_db)
+    db = client[args.mongo_db]
+    faqs = read_faqs(args.questions)
+    ensure_faq_indexes(db["openai_embedding"])
+    load_faqs(faqs, embeddings, db["openai_embedding"])
+    messages = workload([question for question, _ in faqs], args.rag_share)
+    print(f"{len(faqs)} FAQs, index in {index_path}, stand-in OpenAI API at {fake_url}")
+
+    env = dict(
+        os.environ,
+        MONGO_DB=args.mongo_db, FAQ_SNAPSHOT_PATH="", FAISS_INDEX_PATH=index_path,
+        EMBEDDING_CACHE_PATH="", WRITE_BEHIND_SPILL_PATH="", GUNICORN_PIDFILE=os.path.join(workdir, "gunicorn.pid"),
+        # Every FAQ question is embedded and answered by the LLM: no lexical shortcut or cached answers,
+        # and no LLM limiter in front of the servers' own concurrency
+        LEXICAL_ROUTING="0", ANSWER_CACHE_TTL="0",
+        LLM_MAX_CONCURRENT="100000", LLM_MAX_QUEUE="100000", LLM_MAX_QUEUED_PER_USER="100000",
+    )
+
+    results = []
+    try:
+        for server in args.servers:
+            for name in db.list_collection_names():
+                if name != "openai_embedding":
+                    db.drop_collection(name)
+            httpx.delete(fake_url + "/stats")
+
+            port = free_port()
+            log_path = os.path.join(workdir, f"{server}.log")
+            with open(log_path, "w") as log:
+                process = start_backend(server, port, args.workers, args.threads, env, log)
+                try:
+                    wait_until_ready(f"http://127.0.0.1:{port}/api/get-history", lambda: process.poll() is None,
+                                     args.startup_timeout)
+                    outcomes, latencies, seconds = asyncio.run(run_load(
+                        f"http://127.0.0.1:{port}", messages, args.students, args.duration, args.ramp, args.timeout
+                    ))
+                except RuntimeError as e:
+                    raise RuntimeError(f"{e}; server log: {log_path}") from e
+                finally:
+                    process.terminate()
+                    process.wait(30)
+
+            upstream = httpx.get(fake_url + "/stats").json()
+            answered = outcomes["ok"] + outcomes["degraded"]
+            result = {
+                "server": server,
+                "workers": args.workers,
+                "threads": args.threads if server == "flask" else None,
+                "students": args.students,
+                "seconds": round(seconds, 2),
+                "outcomes": dict(outcomes),
+                "answered_per_s": round(answered / seconds, 2),
+                "median_ms": round(statistics.median(latencies) * 1000, 1) if latencies else None,
+                "p95_ms": percentile_ms(latencies, 0.95),
+                "p99_ms": percentile_ms(latencies, 0.99),
+                "upstream_requests": upstream["requests"],
+                "peak_llm_calls": upstream["peak_in_flight"].get("chat", 0),
+            }
+            results.append(result)
+            print(json.dumps(result))
+    finally:
+        fake.terminate()
+        if not args.keep_db:
+            client.drop_database(args.mongo_db)
+
+    if len(results) == 2 and results[0]["answered_per_s"]:
+        first, second = results
+        print(f"{second['server']} answered {second['answered_per_s'] / first['answered_per_s']:.1f}x as many requests "
+              f"per second as {first['server']} (p95 {second['p95_ms']} ms vs {first['p95_ms']} ms)")
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+import argparse
+import os
+
+# smaps_rollup fields reported per process, in kB
+FIELDS = ("Rss", "Pss", "Shared_Clean", "Shared_Dirty", "Private_Clean", "Private_Dirty")
+
+
+# Function to read a process's memory totals from /proc/<pid>/smaps_rollup
+def smaps_rollup(pid):
+    totals = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[0].rstrip(":") in FIELDS:
+                totals[parts[0].rstrip(":")] = int(parts[1])
+    return totals
+
+
+# Function to list the direct children of a process (the gunicorn workers)
+def child_pids(pid):
+    children = []
+    for name in os.listdir("/proc"):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f"/proc/{name}/stat") as f:
+                # The parent pid is the second field after the parenthesised command name
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        if parent == pid:
+            children.append(int(name))
+    return sorted(children)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report RSS and PSS of the gunicorn master and its workers.")
+    parser.add_argument("pid", nargs="?", type=int, help="master pid (default: read from --pidfile)")
+    parser.add_argument("--pidfile", default="./gunicorn.pid")
+    args = parser.parse_args()
+
+    master = args.pid
+    if master is None:
+        with open(args.pidfile) as f:
+            master = int(f.read().strip())
+
+    rows = [("master", master)] + [("worker", pid) for pid in child_pids(master)]
+    print(f"{'process':8} {'pid':>8} " + " ".join(f"{field:>14}" for field in FIELDS))
+    totals = dict.fromkeys(FIELDS, 0)
+    for role, pid in rows:
+        memory = smaps_rollup(pid)
+        for field in FIELDS:
+            totals[field] += memory.get(field, 0)
+        print(f"{role:8} {pid:>8} " + " ".join(f"{memory.get(field, 0) / 1024:>11.1f} MB" for field in FIELDS))
+
+    # PSS splits shared pages between the processes mapping them, so its sum is the real footprint
+    print(f"{len(rows) - 1} workers: total RSS {totals['Rss'] / 1024:.1f} MB, total PSS {totals['Pss'] / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
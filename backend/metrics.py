@@ -0,0 +1,237 @@
+import contextvars
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Set METRICS_ENABLED=0 to turn all instrumentation into no-ops
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+
+# Per-request stage timings, only collected when a request asks for them
+_request_timings = contextvars.ContextVar("request_timings", default=None)
+
+
+# Function to render a label set in Prometheus syntax
+def _format_labels(labels):
+    if not labels:
+        return ""
+    pairs = ",".join(f'{key}="{value}"' for key, value in labels)
+    return "{" + pairs + "}"
+
+
+class Counter:
+    """Monotonic counter with optional labels."""
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self._values.items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Bucketed histogram with optional labels, in the shape Prometheus expects."""
+
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = list(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+                    break
+            else:
+                series["counts"][-1] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def snapshot(self, **labels):
+        series = self._series.get(tuple(sorted(labels.items())))
+        if series is None:
+            return {"buckets": {}, "sum": 0.0, "count": 0}
+        cumulative, running = {}, 0
+        for bound, count in zip(self.buckets + ["+Inf"], series["counts"]):
+            running += count
+            cumulative[str(bound)] = running
+        return {"buckets": cumulative, "sum": series["sum"], "count": series["count"]}
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for key in sorted(self._series):
+            snapshot = self.snapshot(**dict(key))
+            for bound, count in snapshot["buckets"].items():
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {snapshot['sum']}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {snapshot['count']}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together in the Prometheus text format.
+
+    Collectors are callables returning extra (name, help, value) gauges,
+    for numbers owned by other components such as cache hit counters.
+    """
+
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets):
+        metric = Histogram(name, help_text, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        for collector in self.collectors:
+            for name, help_text, value in collector():
+                lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.histogram(
+    "eduquery_stage_seconds", "Time spent in each stage of answering a message.",
+    [0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0],
+)
+ROUTE_TOTAL = registry.counter("eduquery_route_total", "Messages handled, by routing decision.")
+SIMILARITY_SCORE = registry.histogram(
+    "eduquery_similarity_score", "Best FAQ cosine similarity of incoming messages.",
+    [0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.75, 0.8, 0.85, 0.9, 0.95, 1.0],
+)
+LLM_SHED = registry.counter("eduquery_llm_shed_total", "RAG requests shed by the LLM limiter, by reason and fallback.")
+LLM_TOKENS = registry.counter("eduquery_llm_tokens_total", "LLM tokens used, by kind (prompt or completion).")
+
+
+# Function to record how long a stage took
+def observe_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+@contextmanager
+def _timed(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+# Function to time a block of code as one stage: `with timed("embed"): ...`
+def timed(stage):
+    return _timed(stage) if METRICS_ENABLED else nullcontext()
+
+
+# Function to start (or skip) collecting a per-request timing breakdown
+def start_request_timings(enabled=True):
+    _request_timings.set({} if enabled else None)
+
+
+# Function to return the current request's timings in milliseconds, or None
+def request_timings():
+    timings = _request_timings.get()
+    if timings is None:
+        return None
+    return {stage: round(seconds * 1000, 3) for stage, seconds in timings.items()}
+
+
+class StageTimingHandler(BaseCallbackHandler):
+    """LangChain callback that times retrieval and LLM calls and counts tokens."""
+
+    def __init__(self):
+        self._started = {}
+        self._streamed_tokens = {}
+
+    def on_retriever_start(self, serialized, query, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_retriever_end(self, documents, *, run_id, **kwargs):
+        observe_stage("retrieval", time.perf_counter() - self._started.pop(run_id, time.perf_counter()))
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        self._streamed_tokens[run_id] = self._streamed_tokens.get(run_id, 0) + 1
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        observe_stage("llm", time.perf_counter() - self._started.pop(run_id, time.perf_counter()))
+
+        usage = token_usage(response)
+        streamed = self._streamed_tokens.pop(run_id, 0)
+        if usage:
+            LLM_TOKENS.inc(usage[0], kind="prompt")
+            LLM_TOKENS.inc(usage[1], kind="completion")
+        else:
+            # A streaming response without usage (e.g. a model that can't report it): count the streamed tokens
+            LLM_TOKENS.inc(streamed, kind="completion")
+
+
+# Function to read (prompt, completion) token counts from an LLM result, or None if it has none
+def token_usage(response):
+    usage = (response.llm_output or {}).get("token_usage")
+    if usage:
+        return usage.get("prompt_tokens", 0), usage.get("completion_tokens", 0)
+    # Streamed chat responses report usage on the message (ChatOpenAI with stream_usage=True)
+    for generations in response.generations:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None)
+            if metadata:
+                return metadata.get("input_tokens", 0), metadata.get("output_tokens", 0)
+    return None
+
+
+# Function to return the chain callbacks that record metrics
+def chain_callbacks():
+    return [StageTimingHandler()] if METRICS_ENABLED else []
@@ -0,0 +1,274 @@
+import asyncio
+import contextvars
+import os
+import pickle
+import queue
+import shutil
+import tempfile
+import threading
+import time
+
+import faiss
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import BaseCallbackHandler
+
+from metrics import chain_callbacks
+from vector_index import configure_search
+
+# Name of the marker file written next to the index whenever it is rebuilt
+VERSION_FILE = "VERSION"
+
+
+# Function to mark an index directory as updated so running engines reload it
+def mark_index_updated(index_path):
+    """Write a fresh version marker into the index directory.
+
+    The marker is written after the index files themselves, so an engine
+    watching it never picks up a half-written index.
+    """
+    version = str(time.time_ns())
+    tmp_path = os.path.join(index_path, VERSION_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(version)
+    os.replace(tmp_path, os.path.join(index_path, VERSION_FILE))
+    return version
+
+
+class IndexVersionReader:
+    """Callable returning the index directory's version, re-read at most every `interval` seconds."""
+
+    def __init__(self, index_path, interval=2.0):
+        self.index_path = index_path
+        self.interval = interval
+        self._version = None
+        self._read_at = None
+
+    def __call__(self):
+        now = time.monotonic()
+        if self._read_at is None or now - self._read_at >= self.interval:
+            self._version = read_index_version(self.index_path)
+            self._read_at = now
+        return self._version
+
+
+# Function to save a vector store into an index directory and mark it updated
+def save_index(vector_store, index_path):
+    """Save `vector_store` so readers never see a truncated or half-written index.
+
+    FAISS overwrites index files in place, which breaks processes that have
+    them memory-mapped; writing to a temporary directory and renaming the
+    files in gives each save new files instead.
+    """
+    os.makedirs(index_path, exist_ok=True)
+    tmp_path = tempfile.mkdtemp(prefix=".save-", dir=index_path)
+    try:
+        vector_store.save_local(tmp_path)
+        for name in os.listdir(tmp_path):
+            os.replace(os.path.join(tmp_path, name), os.path.join(index_path, name))
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return mark_index_updated(index_path)
+
+
+# Function to load a saved vector store, memory-mapping flat indexes so processes share one copy
+def load_index(index_path, embeddings, mmap=True, index_config=None):
+    """Load the index saved in `index_path` read-only.
+
+    With `mmap`, the vectors of a flat index are mapped from the file
+    rather than copied into each process; other index types load normally.
+    `index_config`, if given, sets the search parameters (nprobe, efSearch).
+    The returned store must not be modified.
+    """
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", 0) if mmap else 0
+    index = configure_search(faiss.read_index(os.path.join(index_path, "index.faiss"), flags), index_config)
+    with open(os.path.join(index_path, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+# Function to read the current on-disk version of an index directory
+def read_index_version(index_path):
+    """Return a token that changes whenever the index on disk changes, or None."""
+    if not os.path.exists(os.path.join(index_path, "index.faiss")):
+        return None
+
+    version_path = os.path.join(index_path, VERSION_FILE)
+    try:
+        with open(version_path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        pass
+
+    # Indexes saved before the version marker existed: fall back to file mtimes
+    try:
+        entries = sorted(os.scandir(index_path), key=lambda e: e.name)
+    except FileNotFoundError:
+        return None
+    signature = [(e.name, e.stat().st_mtime_ns, e.stat().st_size) for e in entries if e.is_file()]
+    return repr(signature) if signature else None
+
+
+class _TokenQueueHandler(BaseCallbackHandler):
+    # Forwards streamed LLM tokens to the thread consuming the stream
+    def __init__(self, tokens):
+        self.tokens = tokens
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.tokens.put(token)
+
+
+# Sentinel put on the token queue once the chain has finished
+_DONE = object()
+
+
+class RAGEngine:
+    """Long-lived holder for the FAISS vector store and the retrieval chain.
+
+    The index is loaded and the chain is built once, then shared by every
+    request. When the index directory changes on disk the engine reloads it
+    in the background of the calling request: other requests keep using the
+    previous store until the new one is ready, then the two are swapped.
+    With `mmap`, flat indexes are memory-mapped and shared between processes.
+    """
+
+    def __init__(self, index_path, embeddings, chain_factory, check_interval=2.0, mmap=True, index_config=None):
+        self.index_path = index_path
+        self.embeddings = embeddings
+        self.chain_factory = chain_factory
+        self.check_interval = check_interval
+        self.mmap = mmap
+        self.index_config = index_config
+
+        self._state = None  # (version, vector_store, chain)
+        self._last_check = 0.0
+        self._reload_lock = threading.Lock()
+        self._listeners = []
+
+    @property
+    def version(self):
+        state = self._state
+        return state[0] if state else None
+
+    def on_reload(self, callback):
+        """Register callback(version) to run after a new index is swapped in."""
+        self._listeners.append(callback)
+
+    def _load(self, version):
+        vector_store = load_index(self.index_path, self.embeddings, mmap=self.mmap, index_config=self.index_config)
+        chain = self.chain_factory(vector_store)
+        return version, vector_store, chain
+
+    def _due(self):
+        return self._state is None or time.monotonic() - self._last_check >= self.check_interval
+
+    def _refresh(self, force=False):
+        if not force and not self._due():
+            return
+
+        # Only one request performs the reload; the rest keep serving the old state
+        blocking = self._state is None or force
+        if not self._reload_lock.acquire(blocking=blocking):
+            return
+        try:
+            self._last_check = time.monotonic()
+            version = read_index_version(self.index_path)
+            if version is None or (self._state is not None and self._state[0] == version and not force):
+                return
+            try:
+                self._state = self._load(version)
+            except Exception:
+                # A partially written index: keep the old one and retry on the next check
+                if self._state is None:
+                    raise
+                return
+        finally:
+            self._reload_lock.release()
+
+        for callback in self._listeners:
+            callback(version)
+
+    def reload(self):
+        """Force the index to be reloaded from disk."""
+        self._refresh(force=True)
+
+    def is_ready(self):
+        self._refresh()
+        return self._state is not None
+
+    def get(self):
+        """Return (vector_store, chain), or (None, None) if no index exists yet."""
+        self._refresh()
+        return self._current()
+
+    async def aget(self):
+        """Like get, but checking for and loading a new index in a worker thread, off the event loop."""
+        if self._due():
+            await asyncio.to_thread(self._refresh)
+        return self._current()
+
+    def _current(self):
+        state = self._state
+        if state is None:
+            return None, None
+        return state[1], state[2]
+
+    def run(self, question, chat_history=None):
+        vector_store, chain = self.get()
+        if chain is None:
+            raise FileNotFoundError(f"No vector index found at {self.index_path}")
+        return chain.run(question=question, context=vector_store, chat_history=chat_history or [], callbacks=chain_callbacks())
+
+    async def arun(self, question, chat_history=None):
+        """Answer `question` with the chain's async path (async embeddings and LLM client)."""
+        _, chain = await self.aget()
+        if chain is None:
+            raise FileNotFoundError(f"No vector index found at {self.index_path}")
+        output = await chain.ainvoke(
+            {"question": question, "chat_history": chat_history or []}, config={"callbacks": chain_callbacks()}
+        )
+        return output["answer"]
+
+    def stream(self, question, chat_history=None):
+        """Yield answer tokens as the LLM generates them.
+
+        The chain runs in a worker thread and its tokens are handed over
+        through a queue. If the LLM does not stream, the full answer is
+        yielded once it is ready.
+        """
+        vector_store, chain = self.get()
+        if chain is None:
+            raise FileNotFoundError(f"No vector index found at {self.index_path}")
+
+        tokens = queue.Queue()
+        result = {}
+
+        def run_chain():
+            try:
+                output = chain.invoke(
+                    {"question": question, "chat_history": chat_history or []},
+                    config={"callbacks": [_TokenQueueHandler(tokens)] + chain_callbacks()},
+                )
+                result["answer"] = output["answer"]
+            except Exception as e:
+                result["error"] = e
+            finally:
+                tokens.put(_DONE)
+
+        # Copy the request context so stage timings reach the caller's request
+        context = contextvars.copy_context()
+        worker = threading.Thread(target=context.run, args=(run_chain,), daemon=True)
+        worker.start()
+
+        streamed = False
+        while True:
+            token = tokens.get()
+            if token is _DONE:
+                break
+            streamed = True
+            yield token
+        worker.join()
+
+        if "error" in result:
+            raise result["error"]
+        if not streamed:
+            yield result["answer"]
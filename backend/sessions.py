@@ -0,0 +1,76 @@
+import hashlib
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from pymongo import ASCENDING
+
+
+# Function to key a session token; only its hash is stored, so the sessions collection holds no usable tokens
+def token_hash(token):
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+class SessionStore:
+    """Server-issued session tokens mapping a logged-in client to its username.
+
+    `issue` creates a random token at login and stores its hash in
+    `collection`, which expires it after `ttl` seconds (a MongoDB TTL index),
+    so every worker process accepts it. Resolved tokens are cached in memory
+    for at most `cache_ttl` seconds, up to `max_cached` of them.
+    """
+
+    def __init__(self, collection, ttl=7 * 24 * 3600, cache_ttl=300, max_cached=10000):
+        self.collection = collection
+        self.ttl = ttl
+        self.cache_ttl = cache_ttl
+        self.max_cached = max_cached
+
+        self._cache = OrderedDict()  # token hash -> (username, cached until)
+        self._lock = threading.Lock()
+        collection.create_index([("created_at", ASCENDING)], expireAfterSeconds=int(ttl))
+
+    def issue(self, username):
+        token = secrets.token_urlsafe(32)
+        self.collection.insert_one({"_id": token_hash(token), "username": username,
+                                    "created_at": datetime.now(timezone.utc)})
+        self._remember(token_hash(token), username)
+        return token
+
+    def cached(self, token):
+        """Return the username for `token` if it is cached, else None."""
+        if not token:
+            return None
+        key = token_hash(token)
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                return None
+            self._cache.move_to_end(key)
+            return entry[0]
+
+    def resolve(self, token):
+        """Return the username `token` was issued to, or None if it is unknown or expired."""
+        if not token:
+            return None
+        username = self.cached(token)
+        if username is not None:
+            return username
+        doc = self.collection.find_one({"_id": token_hash(token)}, {"username": 1, "created_at": 1})
+        if doc is None:
+            return None
+        created_at = doc["created_at"]
+        # The TTL index removes expired sessions within a minute or so; don't accept them meanwhile
+        if created_at.replace(tzinfo=created_at.tzinfo or timezone.utc).timestamp() + self.ttl < time.time():
+            return None
+        self._remember(doc["_id"], doc["username"])
+        return doc["username"]
+
+    def _remember(self, key, username):
+        with self._lock:
+            self._cache[key] = (username, time.monotonic() + self.cache_ttl)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_cached:
+                self._cache.popitem(last=False)
@@ -0,0 +1,333 @@
+import argparse
+import json
+import random
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from pymongo import ASCENDING, UpdateOne
+
+from faq_matcher import normalize_rows
+from faq_store import decode_embeddings, pack_embedding
+
+
+# Cluster changes from this long before the last sync are read again, covering writes that commit out of order
+SYNC_OVERLAP = timedelta(seconds=1)
+
+
+# Function to create the indexes the cluster sync and the teacher queue listing rely on
+def ensure_cluster_indexes(collection):
+    collection.create_index([("status", ASCENDING), ("_id", ASCENDING)])
+    collection.create_index([("updated_at", ASCENDING)])
+
+
+class TeacherClusters:
+    """Group pending teacher-queue questions that ask the same thing.
+
+    Each question is assigned as it is queued: one matrix-vector product
+    scores it against the leader of every open cluster (the embedding of
+    the question that opened it), and it joins the closest cluster if the
+    cosine similarity is at least `threshold`, otherwise it opens a new one.
+    A cluster's ID is the _id of the question that opened it. At most
+    `max_clusters` are kept in memory; the oldest are dropped first.
+
+    With a `collection`, clusters are shared by every server process: new
+    clusters are stored there (through `write_queue` if given), and each
+    process reads the clusters opened, answered or merged elsewhere at most
+    every `sync_interval` seconds. When two processes open a cluster for the
+    same question at once, the newer cluster is merged into the older one,
+    moving its pending `questions` with it.
+    """
+
+    def __init__(self, threshold=0.9, max_clusters=10000, collection=None, questions=None, write_queue=None,
+                 sync_interval=1.0):
+        self.threshold = threshold
+        self.max_clusters = max_clusters
+        self.collection = collection
+        self.questions = questions
+        self.write_queue = write_queue
+        self.sync_interval = sync_interval
+
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._ids = []
+        self._positions = {}
+        # Rows [0, len(self)) are in use; the buffer doubles when full
+        self._leaders = None
+        self._watermark = None
+        self._synced_at = None
+        self.assigned = 0
+        self.joined = 0
+        self.merged = 0
+        self.settled = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def assign(self, question_id, embedding):
+        """Return the cluster ID for a new question; a question without an embedding opens its own cluster."""
+        self.sync()
+        vector = normalize_rows(embedding)[0] if embedding is not None else None
+        with self._lock:
+            self.assigned += 1
+            if vector is not None and self._ids:
+                scores = self._leaders[:len(self._ids)] @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    self.joined += 1
+                    return self._ids[best]
+            if vector is not None:
+                self._open(question_id, vector)
+        self._store(question_id, embedding)
+        return question_id
+
+    def _store(self, cluster_id, embedding):
+        if self.collection is None:
+            return
+        cluster = {
+            "_id": cluster_id,
+            "leader": pack_embedding(embedding) if embedding is not None else None,
+            "status": "pending",
+            "created_at": datetime.now(timezone.utc),
+        }
+        if self.write_queue is not None:
+            self.write_queue.put(self.collection.name, cluster)
+        else:
+            cluster["updated_at"] = cluster["created_at"]
+            self.collection.insert_one(cluster)
+
+    def _open(self, cluster_id, vector):
+        if len(self._ids) >= self.max_clusters:
+            # Cluster IDs are ObjectIds, so the smallest is the oldest cluster
+            self._drop(min(self._ids))
+        position = len(self._ids)
+        if self._leaders is None:
+            self._leaders = np.zeros((16, len(vector)), dtype=np.float32)
+        elif position == len(self._leaders):
+            self._leaders = np.vstack([self._leaders, np.zeros_like(self._leaders)])
+        self._ids.append(cluster_id)
+        self._positions[cluster_id] = position
+        self._leaders[position] = vector
+
+    def _drop(self, cluster_id):
+        # Move the last cluster into the freed row
+        position = self._positions.pop(cluster_id, None)
+        if position is None:
+            return
+        last_id = self._ids.pop()
+        if last_id != cluster_id:
+            self._ids[position] = last_id
+            self._positions[last_id] = position
+            self._leaders[position] = self._leaders[len(self._ids)]
+
+    def close(self, cluster_id, status="answered"):
+        """Stop assigning questions to a cluster, in every process, e.g. once the teacher has answered it."""
+        with self._lock:
+            self._drop(cluster_id)
+        if self.collection is not None and cluster_id is not None:
+            self.collection.update_one(
+                {"_id": cluster_id}, {"$set": {"status": status, "updated_at": datetime.now(timezone.utc)}}
+            )
+
+    def sync(self, force=False):
+        """Apply clusters opened, answered or merged by other processes since the last sync."""
+        if self.collection is None:
+            return
+        if not force and self._synced_at is not None and time.monotonic() - self._synced_at < self.sync_interval:
+            return
+        # One thread syncs; the others carry on with the clusters they have
+        if not self._sync_lock.acquire(blocking=force or self._synced_at is None):
+            return
+        try:
+            self._synced_at = time.monotonic()
+            started = datetime.now(timezone.utc)
+            if self._watermark is None:
+                query = {"status": "pending"}
+            else:
+                query = {"updated_at": {"$gt": self._watermark - SYNC_OVERLAP}}
+            docs = list(self.collection.find(query).sort("updated_at", ASCENDING))
+            if self._watermark is None:
+                self._watermark = started
+            for doc in docs:
+                updated_at = doc.get("updated_at")
+                if updated_at is not None:
+                    updated_at = updated_at if updated_at.tzinfo else updated_at.replace(tzinfo=timezone.utc)
+                    self._watermark = max(self._watermark, updated_at)
+
+            merges = []
+            with self._lock:
+                for doc in docs:
+                    if doc["status"] != "pending":
+                        self._drop(doc["_id"])
+                    elif doc["_id"] not in self._positions and doc.get("leader") is not None:
+                        merge = self._add_synced(doc["_id"], normalize_rows(decode_embeddings([doc["leader"]]))[0])
+                        if merge:
+                            merges.append(merge)
+            for newer, older in merges:
+                self._merge(newer, older)
+        finally:
+            self._sync_lock.release()
+
+    def _add_synced(self, cluster_id, vector):
+        # Add a cluster another process opened; if an open cluster already matches it, keep the older of the two
+        if self._ids:
+            scores = self._leaders[:len(self._ids)] @ vector
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                existing = self._ids[best]
+                if cluster_id < existing:
+                    self._drop(existing)
+                    self._open(cluster_id, vector)
+                    return existing, cluster_id
+                return cluster_id, existing
+        self._open(cluster_id, vector)
+        return None
+
+    def _merge(self, newer, older):
+        # Idempotent, so every process that notices the duplicate can run it
+        now = datetime.now(timezone.utc)
+        result = self.collection.update_one(
+            {"_id": newer, "status": "pending"},
+            {"$set": {"status": "merged", "merged_into": older, "updated_at": now}}
+        )
+        self.merged += result.modified_count
+        if self.questions is not None:
+            self.questions.update_many(
+                {"cluster_id": newer, "status": "pending"}, {"$set": {"cluster_id": older, "updated_at": now}}
+            )
+
+    def settle(self, questions):
+        """Move newly written questions whose cluster was answered or merged meanwhile into an open cluster.
+
+        Call it with questions once they are in MongoDB. A question joins a
+        cluster when it is queued but is written a moment later, so the
+        teacher can answer that cluster in between.
+        """
+        if self.collection is None:
+            return
+        cluster_ids = list({question["cluster_id"] for question in questions if question.get("cluster_id") is not None})
+        if not cluster_ids:
+            return
+        closed = {doc["_id"] for doc in self.collection.find(
+            {"_id": {"$in": cluster_ids}, "status": {"$ne": "pending"}}, {"_id": 1}
+        )}
+        if not closed:
+            return
+
+        self.sync(force=True)
+        for question in questions:
+            if question.get("cluster_id") in closed:
+                cluster_id = self.assign(question["_id"], question.get("embedding"))
+                # Unless the teacher's answer reached it first
+                result = self.questions.update_one(
+                    {"_id": question["_id"], "cluster_id": question["cluster_id"], "status": "pending"},
+                    {"$set": {"cluster_id": cluster_id, "updated_at": datetime.now(timezone.utc)}}
+                )
+                self.settled += result.modified_count
+
+    def load(self, batch_size=500):
+        """Load the open clusters, then settle pending questions that are in none of them.
+
+        That covers questions queued before clustering existed and ones
+        written after their cluster was answered while no process was
+        running to settle them.
+        """
+        self.sync(force=True)
+        open_ids = {doc["_id"] for doc in self.collection.find({"status": "pending"}, {"_id": 1})}
+
+        operations = []
+        docs = self.questions.find({"status": "pending"}, {"embedding": 1, "cluster_id": 1}).sort("_id", ASCENDING)
+        for doc in docs:
+            if doc.get("cluster_id") in open_ids:
+                continue
+            cluster_id = self.assign(doc["_id"], doc.get("embedding"))
+            open_ids.add(cluster_id)
+            operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {"cluster_id": cluster_id}}))
+            if len(operations) >= batch_size:
+                self.questions.bulk_write(operations, ordered=False)
+                operations = []
+        if operations:
+            self.questions.bulk_write(operations, ordered=False)
+
+    def stats(self):
+        return {
+            "open_clusters": len(self._ids),
+            "assigned": self.assigned,
+            "joined": self.joined,
+            "join_rate": self.joined / self.assigned if self.assigned else 0.0,
+            "merged": self.merged,
+            "settled": self.settled,
+        }
+
+
+# Filler students add around the same question
+_PREFIXES = ["", "", "please ", "sir, ", "can someone explain ", "i have a doubt: ", "quick question - "]
+_SUFFIXES = ["", "", "?", " please", " in simple words", " with an example", " again"]
+
+
+# Function to make a student's rewording of a question
+def reword(question, rng):
+    return f"{rng.choice(_PREFIXES)}{question.rstrip('?')}{rng.choice(_SUFFIXES)}"
+
+
+# Function to replay a burst of escalated questions through the clusterer
+def simulate(clusters, embeddings, questions, students, seed=0):
+    """Queue `students` rewordings of each question in random order.
+
+    Returns queue and cluster counts, cluster purity (clusters holding a
+    single original question), clusters per original question, and the
+    assignment time per question.
+    """
+    rng = random.Random(seed)
+    arrivals = [(original, reword(question, rng)) for original, question in enumerate(questions)
+                for _ in range(students)]
+    rng.shuffle(arrivals)
+    vectors = embeddings.embed_documents([message for _, message in arrivals])
+
+    started = time.perf_counter()
+    assigned = [clusters.assign(n, vector) for n, vector in enumerate(vectors)]
+    seconds = time.perf_counter() - started
+
+    originals_by_cluster, clusters_by_original = {}, {}
+    for (original, _), cluster_id in zip(arrivals, assigned):
+        originals_by_cluster.setdefault(cluster_id, set()).add(original)
+        clusters_by_original.setdefault(original, set()).add(cluster_id)
+    sizes = Counter(assigned)
+    return {
+        "queued": len(arrivals),
+        "clusters": len(sizes),
+        "largest_cluster": max(sizes.values()),
+        "purity": sum(len(found) == 1 for found in originals_by_cluster.values()) / len(originals_by_cluster),
+        "clusters_per_question": float(np.mean([len(found) for found in clusters_by_original.values()])),
+        "assign_us": round(seconds / len(arrivals) * 1e6, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure how far clustering shrinks a burst of repeated teacher-queue questions.")
+    parser.add_argument("--questions", type=int, default=20, help="distinct questions in the burst")
+    parser.add_argument("--students", type=int, default=40, help="students asking each question")
+    parser.add_argument("--csv", default="faq.csv", help="CSV to take the questions from")
+    parser.add_argument("--threshold", type=float, nargs="+", default=[0.85, 0.9, 0.95])
+    parser.add_argument("--offline", action="store_true", help="use the hashing fake embedder instead of OpenAI")
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    if args.offline:
+        from fakes import HashingFakeEmbeddings
+        embeddings = HashingFakeEmbeddings()
+    else:
+        from utils import embeddings
+
+    questions = pd.read_csv(args.csv, encoding="ISO-8859-1")["Question"].dropna().astype(str)
+    questions = questions.drop_duplicates().sample(args.questions, random_state=0).tolist()
+    for threshold in args.threshold:
+        result = simulate(TeacherClusters(threshold), embeddings, questions, args.students)
+        print(json.dumps(dict(result, threshold=threshold)))
+
+
+if __name__ == "__main__":
+    main()
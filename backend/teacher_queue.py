@@ -0,0 +1,173 @@
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING
+
+# Fields the teacher dashboard shows; the stored question embedding is never sent
+QUEUE_FIELDS = {"user_message": 1, "similarity_score": 1, "status": 1, "deferred": 1, "updated_at": 1, "cluster_id": 1}
+
+# Reworded variants shown with each cluster on the dashboard, picked from its first CLUSTER_MESSAGES questions
+CLUSTER_EXAMPLES = 5
+CLUSTER_MESSAGES = 50
+
+# Question IDs listed with each cluster (the newest), so dashboards can skip questions the change feed resends
+CLUSTER_QUESTION_IDS = 100
+
+# Changes from this long before a cursor are sent again, covering writes that commit out of order
+CHANGES_OVERLAP = timedelta(seconds=1)
+
+
+class ChangeNotifier:
+    """Wake long-polling requests when this process changes the teacher queue."""
+
+    def __init__(self):
+        self._condition = threading.Condition()
+        self.version = 0
+
+    def notify(self):
+        with self._condition:
+            self.version += 1
+            self._condition.notify_all()
+
+    def wait(self, version, timeout):
+        """Block until notified after `version`, or `timeout` seconds pass."""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.version != version, timeout)
+
+
+# Function to create the indexes the queue listing and change feed rely on
+def ensure_indexes(collection):
+    collection.create_index([("status", ASCENDING), ("_id", ASCENDING)])
+    collection.create_index([("updated_at", ASCENDING)])
+    collection.create_index([("status", ASCENDING), ("cluster_id", ASCENDING), ("_id", ASCENDING)])
+    collection.create_index([("answer_id", ASCENDING)], sparse=True)
+
+
+# Function to convert a datetime (naive ones are UTC, as pymongo returns them) to epoch milliseconds
+def to_millis(value):
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1000)
+
+
+# Function to convert epoch milliseconds back to a UTC datetime
+def from_millis(millis):
+    return datetime.fromtimestamp(millis / 1000, timezone.utc)
+
+
+# Function to make a queue document JSON-serializable
+def serialize(doc):
+    doc["_id"] = str(doc["_id"])
+    if doc.get("cluster_id") is not None:
+        doc["cluster_id"] = str(doc["cluster_id"])
+    if doc.get("updated_at") is not None:
+        doc["updated_at"] = to_millis(doc["updated_at"])
+    return doc
+
+
+# Function to list one page of pending question clusters, oldest first
+def list_clusters(clusters, questions, after=None, limit=50):
+    """Return (clusters, next_cursor); pass next_cursor as `after` for the next page.
+
+    The page's cluster IDs come from the (status, _id) index of the
+    `clusters` collection, and only their questions are grouped, so each
+    page costs the same however long the backlog is. Each cluster has its
+    first question's text, the number of pending questions in it, the IDs
+    of the most recent ones and a few of the other wordings.
+    """
+    page = list(clusters.find(_cluster_page_query(after), {"_id": 1}).sort("_id", ASCENDING).limit(limit + 1))
+    cluster_ids, next_cursor = _split_page(page, limit)
+    groups = list(questions.aggregate(_cluster_pipeline(cluster_ids))) if cluster_ids else []
+    return _serialize_clusters(groups, cluster_ids), next_cursor
+
+
+# Function to list one page of pending question clusters through async (AsyncMongoClient) collections
+async def alist_clusters(clusters, questions, after=None, limit=50):
+    cursor = clusters.find(_cluster_page_query(after), {"_id": 1}).sort("_id", ASCENDING).limit(limit + 1)
+    cluster_ids, next_cursor = _split_page(await cursor.to_list(), limit)
+    groups = await (await questions.aggregate(_cluster_pipeline(cluster_ids))).to_list() if cluster_ids else []
+    return _serialize_clusters(groups, cluster_ids), next_cursor
+
+
+# Function to build the query for pending clusters after a cursor
+def _cluster_page_query(after):
+    query = {"status": "pending"}
+    if after:
+        query["_id"] = {"$gt": ObjectId(after)}
+    return query
+
+
+# Function to split one extra cluster off a page to find the next cursor
+def _split_page(page, limit):
+    next_cursor = str(page[limit - 1]["_id"]) if len(page) > limit else None
+    return [doc["_id"] for doc in page[:limit]], next_cursor
+
+
+# Function to build the aggregation grouping the pending questions of a page of clusters
+def _cluster_pipeline(cluster_ids):
+    return [
+        {"$match": {"status": "pending", "cluster_id": {"$in": cluster_ids}}},
+        {"$sort": {"cluster_id": ASCENDING, "_id": ASCENDING}},
+        {"$group": {
+            "_id": "$cluster_id",
+            "user_message": {"$first": "$user_message"},
+            "similarity_score": {"$first": "$similarity_score"},
+            "count": {"$sum": 1},
+            "question_ids": {"$push": "$_id"},
+            "messages": {"$push": "$user_message"},
+            "deferred": {"$max": "$deferred"},
+            "updated_at": {"$max": "$updated_at"},
+        }},
+        {"$project": {
+            "user_message": 1, "similarity_score": 1, "count": 1, "deferred": 1, "updated_at": 1,
+            # The newest IDs are the ones the change feed may send again
+            "question_ids": {"$slice": ["$question_ids", -CLUSTER_QUESTION_IDS]},
+            "messages": {"$slice": ["$messages", CLUSTER_MESSAGES]},
+        }},
+    ]
+
+
+# Function to make cluster groups JSON-serializable, in page order
+def _serialize_clusters(groups, cluster_ids):
+    by_id = {group["_id"]: group for group in groups}
+    serialized = []
+    # A cluster whose questions are still in the write-behind queue has nothing to show yet
+    for group in (by_id[cluster_id] for cluster_id in cluster_ids if cluster_id in by_id):
+        examples = []
+        for message in group.pop("messages"):
+            if message != group["user_message"] and message not in examples and len(examples) < CLUSTER_EXAMPLES:
+                examples.append(message)
+        group["question_ids"] = [str(question_id) for question_id in group["question_ids"]]
+        group["examples"] = examples
+        group["deferred"] = bool(group.get("deferred"))
+        serialized.append(serialize(group))
+    return serialized
+
+
+# Function to list questions added or answered after `since` (epoch milliseconds)
+def list_changes(collection, since, limit=200):
+    query = {"updated_at": {"$gt": from_millis(since) - CHANGES_OVERLAP}}
+    docs = collection.find(query, QUEUE_FIELDS).sort("updated_at", ASCENDING).limit(limit)
+    return [serialize(doc) for doc in docs]
+
+
+# Function to long-poll for queue changes
+def wait_for_changes(collection, notifier, since, timeout, poll_interval=2.0, limit=200):
+    """Return (changes, cursor) as soon as anything changed after `since`.
+
+    Changes are re-read whenever this process notifies and at least every
+    `poll_interval` seconds, so writes from other worker processes are seen
+    too. Changes from the overlap window before `since` are included again;
+    clients merge them by _id.
+    """
+    deadline = time.monotonic() + timeout
+    while True:
+        version = notifier.version
+        changes = list_changes(collection, since, limit)
+        newest = max((change["updated_at"] for change in changes), default=since)
+        remaining = deadline - time.monotonic()
+        if newest > since or remaining <= 0:
+            return changes, max(newest, since)
+        notifier.wait(version, min(remaining, poll_interval))
@@ -0,0 +1,33 @@
+import os
+import sys
+
+# The backend modules import each other by name, as when run from the backend folder
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Importing utils builds the OpenAI embedder; the tests only use local fakes and never call it
+os.environ.setdefault("OPENAI_API_KEY", "test")
+os.environ.setdefault("EMBEDDING_CACHE_PATH", "")
+
+
+# mongomock's bulk_write predates pymongo's UpdateOne(sort=...); run the updates one by one instead
+def _bulk_write(self, operations, ordered=True, **kwargs):
+    from pymongo import UpdateOne
+    from pymongo.results import BulkWriteResult
+
+    modified = upserted = 0
+    for operation in operations:
+        if not isinstance(operation, UpdateOne):
+            raise NotImplementedError(type(operation).__name__)
+        result = self.update_one(operation._filter, operation._doc, upsert=bool(operation._upsert))
+        modified += result.modified_count
+        upserted += result.upserted_id is not None
+    return BulkWriteResult({"nModified": modified, "nUpserted": upserted, "nMatched": modified, "nInserted": 0,
+                            "nRemoved": 0, "upserted": []}, True)
+
+
+try:
+    import mongomock
+except ImportError:
+    pass
+else:
+    mongomock.Collection.bulk_write = _bulk_write
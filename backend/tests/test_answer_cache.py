@@ -0,0 +1,23 @@
+import mongomock
+
+from answer_cache import SemanticAnswerCache
+
+
+def test_load_skips_questions_stored_without_an_embedding():
+    db = mongomock.MongoClient().db
+    db.rag_answering.insert_many([
+        {"user_message": "What is line coding?", "answer": "Bits to signals.", "embedding": [1.0, 0.0]},
+        {"user_message": "What is block coding?", "answer": "Redundant bits.", "embedding": None},
+    ])
+    db.teacher_answering.insert_many([
+        {"user_message": "Can I bring a calculator?", "teacher_answer": "Yes.", "status": "answered",
+         "embedding": [0.0, 1.0]},
+        # Routed lexically and answered before its embedding was saved back
+        {"user_message": "When is the exam?", "teacher_answer": "In May.", "status": "answered", "embedding": None},
+    ])
+
+    cache = SemanticAnswerCache()
+    cache.load(db.rag_answering, db.teacher_answering)
+
+    assert len(cache) == 2
+    assert cache.lookup([0.0, 1.0])["answer"] == "Yes."
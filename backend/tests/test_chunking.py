@@ -0,0 +1,14 @@
+import chunking
+from chat_history import count_tokens
+
+TEXT = " ".join(["Line coding converts a sequence of bits into a digital signal for transmission."] * 400)
+
+
+def test_estimated_chunks_fill_the_token_budget(monkeypatch):
+    monkeypatch.setattr(chunking, "exact_token_counts", lambda: False)
+    monkeypatch.setattr("chat_history._encoding", lambda: None)
+    chunks = chunking.token_splitter(256, 32).split_text(TEXT)
+
+    sizes = [count_tokens(chunk) for chunk in chunks[:-1]]
+    assert max(sizes) <= 256
+    assert min(sizes) >= 240
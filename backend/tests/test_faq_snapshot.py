@@ -0,0 +1,26 @@
+import mongomock
+
+from faq_snapshot import load_faq_snapshot
+from faq_store import delete_faqs, faq_document, upsert_faqs
+from lexical_router import LexicalRouter
+
+
+def test_delete_then_insert_is_not_missed(tmp_path):
+    collection = mongomock.MongoClient().db.openai_embedding
+    upsert_faqs(collection, [faq_document("When is the exam?", [1.0, 0.0], "In May."),
+                             faq_document("Where is the library?", [0.0, 1.0], "Block B.")])
+    questions, _, _, _ = load_faq_snapshot(collection, str(tmp_path))
+    assert sorted(questions) == ["When is the exam?", "Where is the library?"]
+
+    # Same document count as the snapshot: only the tombstone reveals the deletion
+    library = collection.find_one({"question": "Where is the library?"})
+    assert delete_faqs(collection, [library["_id"]]) == 1
+    upsert_faqs(collection, [faq_document("Can I bring a calculator?", [0.6, 0.8], "Yes.")])
+
+    questions, answers, stored, _ = load_faq_snapshot(collection, str(tmp_path))
+    assert sorted(zip(questions, answers)) == [("Can I bring a calculator?", "Yes."), ("When is the exam?", "In May.")]
+    assert stored.shape == (2, 2)
+
+    # The lexical router needs nothing beyond the snapshot
+    router = LexicalRouter(questions, answers)
+    assert router.match("can i bring a calculator?")["answer"] == "Yes."
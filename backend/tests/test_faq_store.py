@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+import numpy as np
+import pytest
+
+from faq_store import FAQFeed, deleted_faqs, ensure_faq_indexes, faq_document, upsert_faqs
+
+
+def test_feed_returns_questions_added_after_the_watermark():
+    collection = mongomock.MongoClient().db.openai_embedding
+    old = faq_document("When is the exam?", [1.0, 0.0], "In May.")
+    old["updated_at"] = datetime.now(timezone.utc) - timedelta(minutes=5)
+    upsert_faqs(collection, [old])
+    feed = FAQFeed(collection, since=datetime.now(timezone.utc), interval=3600)
+
+    assert feed.poll() == []  # Not due yet
+    upsert_faqs(collection, [faq_document("Can I bring a calculator?", [0.0, 1.0], "Yes.")])
+
+    [(question, embedding, answer)] = feed.poll(force=True)
+    assert (question, answer) == ("Can I bring a calculator?", "Yes.")
+    np.testing.assert_array_equal(embedding, [0.0, 1.0])
+
+
+def legacy_collection():
+    collection = mongomock.MongoClient().db.openai_embedding
+    collection.insert_many([
+        {"question": "When is the exam?", "embedding": [1.0, 0.0]},
+        {"question": "when is the exam", "embedding": [1.0, 0.0]},
+        {"question": "Where is the library?", "embedding": [0.0, 1.0]},
+    ])
+    return collection
+
+
+def test_migrate_legacy_keeps_duplicates_unless_asked(caplog):
+    collection = legacy_collection()
+    with pytest.raises(ValueError, match="--drop-duplicates"):
+        ensure_faq_indexes(collection)
+    assert collection.count_documents({}) == 3
+    assert "when is the exam" in caplog.text
+
+    ensure_faq_indexes(collection, drop_duplicates=True)
+    assert sorted(collection.distinct("question")) == ["When is the exam?", "Where is the library?"]
+    assert deleted_faqs(collection).count_documents({}) == 1
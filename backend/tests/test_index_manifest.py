@@ -0,0 +1,61 @@
+import pytest
+from langchain_community.vectorstores import FAISS
+
+import ingest
+from fakes import HashingFakeEmbeddings
+from index_manifest import IndexManifest, file_hash, remove_pdf, sync_index
+from rag_engine import load_index, save_index
+
+SHARED = "Hamming codes add parity bits at power-of-two positions so a single flipped bit can be located and corrected."
+CHUNKING = {"dedupe_threshold": 0.9}
+
+
+@pytest.fixture(autouse=True)
+def text_pages(monkeypatch):
+    # Plain-text stand-ins for PDFs: each file is one page
+    def iter_pdf_pages(paths, workers=None):
+        for path in paths:
+            with open(path) as f:
+                yield path, 0, f.read()
+
+    monkeypatch.setattr(ingest, "iter_pdf_pages", iter_pdf_pages)
+
+
+def split_paragraphs(text):
+    return [paragraph for paragraph in text.split("\n\n") if paragraph.strip()]
+
+
+def indexed_texts(index_path):
+    store = load_index(str(index_path), HashingFakeEmbeddings(size=32), mmap=False)
+    return sorted(store.docstore.search(doc_id).page_content for doc_id in store.index_to_docstore_id.values())
+
+
+def test_removing_a_file_reingests_files_deduplicated_against_it(tmp_path):
+    first, second = tmp_path / "lecture1.pdf", tmp_path / "lecture2.pdf"
+    first.write_text(f"Parity checks detect odd numbers of bit errors.\n\n{SHARED}")
+    second.write_text(f"{SHARED}\n\nReed-Solomon codes correct burst errors over symbols.")
+    embeddings, index_path = HashingFakeEmbeddings(size=32), tmp_path / "index"
+
+    sync_index([str(first)], embeddings, split_paragraphs, str(index_path), chunking=CHUNKING)
+    sync_index([str(first), str(second)], embeddings, split_paragraphs, str(index_path), chunking=CHUNKING)
+    assert indexed_texts(index_path).count(SHARED) == 1
+    files = IndexManifest(str(index_path)).files
+    assert files[file_hash(second)]["duplicate_of"] == [file_hash(first)]
+
+    assert remove_pdf(str(first), embeddings, split_paragraphs, str(index_path), chunking=CHUNKING)
+
+    assert indexed_texts(index_path) == sorted([SHARED, "Reed-Solomon codes correct burst errors over symbols."])
+    [entry] = IndexManifest(str(index_path)).files.values()
+    assert entry["name"] == "lecture2.pdf" and entry["duplicate_of"] == []
+
+
+def test_syncing_no_files_empties_an_index_built_before_manifests(tmp_path):
+    embeddings, index_path = HashingFakeEmbeddings(size=32), tmp_path / "index"
+    save_index(FAISS.from_texts([SHARED, "Parity checks detect odd numbers of bit errors."], embeddings),
+               str(index_path))
+
+    result = sync_index([], embeddings, split_paragraphs, str(index_path))
+
+    assert result["unchanged"] == 0
+    assert indexed_texts(index_path) == []
+    assert IndexManifest(str(index_path)).exists()
@@ -0,0 +1,101 @@
+import asyncio
+
+import pytest
+
+from fakes import FakeStreamingChatModel
+from llm_limiter import LLMLimiter, Overloaded, simulate
+
+
+async def queued(limiter, user):
+    # Start waiting for a slot, and let the task join the queue before returning
+    task = asyncio.create_task(limiter.acquire_async(user))
+    await asyncio.sleep(0)
+    return task
+
+
+def test_freed_slots_go_to_users_in_turn():
+    async def run():
+        limiter = LLMLimiter(max_concurrent=1, max_queued_per_user=3)
+        await limiter.acquire_async("holder")
+        tasks = {name: await queued(limiter, name[0]) for name in ("a1", "a2", "a3", "b1", "c1")}
+
+        order = []
+        for _ in tasks:
+            limiter.release()
+            await asyncio.sleep(0.01)
+            order.extend(name for name, task in tasks.items() if task.done() and name not in order)
+        return order
+
+    assert asyncio.run(run()) == ["a1", "b1", "c1", "a2", "a3"]
+
+
+def test_requests_past_the_queue_limits_are_shed():
+    async def run():
+        limiter = LLMLimiter(max_concurrent=1, max_queue=3, max_queued_per_user=2)
+        await limiter.acquire_async("holder")
+        waiting = [await queued(limiter, "a"), await queued(limiter, "a")]
+        with pytest.raises(Overloaded) as per_user:
+            await limiter.acquire_async("a")
+        waiting.append(await queued(limiter, "b"))
+        with pytest.raises(Overloaded) as total:
+            await limiter.acquire_async("c")
+        for task in waiting:
+            task.cancel()
+        return per_user.value.reason, total.value.reason, limiter.stats()
+
+    per_user, total, stats = asyncio.run(run())
+    assert per_user == total == "queue_full"
+    assert stats["shed"] == {"queue_full": 2}
+
+
+def test_request_is_shed_when_no_slot_frees_up_in_time():
+    limiter = LLMLimiter(max_concurrent=1, max_wait=0.05)
+    limiter.acquire("holder")
+    with pytest.raises(Overloaded) as error:
+        limiter.acquire("a")
+    assert error.value.reason == "deadline"
+    assert limiter.stats()["queued"] == 0
+
+
+def test_cancelled_waiter_leaves_the_queue():
+    async def run():
+        limiter = LLMLimiter(max_concurrent=1)
+        await limiter.acquire_async("holder")
+        task = await queued(limiter, "a")
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        limiter.release()
+        return limiter.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["queued"], stats["queued_users"], stats["in_flight"]) == (0, 0, 0)
+
+
+def test_slot_granted_to_a_cancelled_waiter_is_passed_on():
+    async def run():
+        limiter = LLMLimiter(max_concurrent=1)
+        await limiter.acquire_async("holder")
+        cancelled, next_in_line = await queued(limiter, "a"), await queued(limiter, "b")
+        # The slot is granted, but the request is cancelled before it resumes
+        limiter.release()
+        cancelled.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await cancelled
+        await asyncio.wait_for(next_in_line, 1)
+        limiter.release()
+        return limiter.stats()
+
+    stats = asyncio.run(run())
+    assert (stats["queued"], stats["in_flight"]) == (0, 0)
+
+
+def test_spike_against_a_fake_llm_answers_every_user():
+    llm = FakeStreamingChatModel(first_token_delay=0.05, streaming=False)
+    limiter = LLMLimiter(max_concurrent=2, max_queue=100, max_wait=5.0)
+
+    outcomes, latencies, answered = simulate(limiter, llm, users=6, requests_per_user=2, arrival_window=0.05)
+
+    assert outcomes == {"answered": 12}
+    assert len(answered) == 6
+    assert limiter.stats()["in_flight"] == 0
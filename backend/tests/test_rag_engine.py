@@ -0,0 +1,61 @@
+import asyncio
+import re
+import threading
+
+from langchain_community.vectorstores import FAISS
+
+from fakes import FakeStreamingChatModel, HashingFakeEmbeddings
+from rag_engine import RAGEngine, save_index
+from utils import get_conversational_chain
+
+TEXTS = [
+    "Line coding converts a sequence of bits into a digital signal.",
+    "Block coding adds redundant bits to help detect errors.",
+    "Scrambling replaces long runs of zeros to keep the receiver synchronized.",
+]
+ANSWER = "Line coding turns bits into a digital signal."
+
+
+def build_engine(tmp_path):
+    embeddings = HashingFakeEmbeddings(size=64)
+    save_index(FAISS.from_texts(TEXTS, embeddings), str(tmp_path))
+    llm = FakeStreamingChatModel(responses=[ANSWER])
+    return RAGEngine(str(tmp_path), embeddings, lambda vector_store: get_conversational_chain(vector_store, llm=llm))
+
+
+def test_stream_yields_answer_tokens_in_order(tmp_path):
+    engine = build_engine(tmp_path)
+    assert list(engine.stream("What is line coding?")) == re.findall(r"\s*\S+", ANSWER)
+
+
+def test_stream_with_history_does_not_leak_condensed_question(tmp_path):
+    engine = build_engine(tmp_path)
+    history = [("What is block coding?", "Block coding adds redundant bits.")]
+    tokens = list(engine.stream("And line coding?", chat_history=history))
+    assert "".join(tokens) == ANSWER
+
+
+def test_run_matches_stream(tmp_path):
+    engine = build_engine(tmp_path)
+    history = [("What is block coding?", "Block coding adds redundant bits.")]
+    assert engine.run("And line coding?", chat_history=history) == ANSWER
+
+
+def test_arun_loads_the_index_off_the_event_loop(tmp_path):
+    engine = build_engine(tmp_path)
+    load = engine._load
+    loaded_in = []
+
+    def tracking_load(version):
+        loaded_in.append(threading.current_thread())
+        return load(version)
+
+    engine._load = tracking_load
+
+    async def ask():
+        answer = await engine.arun("What is line coding?")
+        return answer, threading.current_thread()
+
+    answer, loop_thread = asyncio.run(ask())
+    assert answer == ANSWER
+    assert loaded_in and loop_thread not in loaded_in
@@ -0,0 +1,28 @@
+from datetime import datetime, timedelta, timezone
+
+import mongomock
+
+from sessions import SessionStore, token_hash
+
+
+def test_issued_tokens_resolve_in_every_worker():
+    collection = mongomock.MongoClient().db.sessions
+    token = SessionStore(collection).issue("alice")
+
+    other_worker = SessionStore(collection)
+    assert other_worker.cached(token) is None
+    assert other_worker.resolve(token) == "alice"
+    assert other_worker.cached(token) == "alice"
+    assert collection.find_one({"_id": token}) is None
+
+
+def test_unknown_and_expired_tokens_resolve_to_none():
+    collection = mongomock.MongoClient().db.sessions
+    store = SessionStore(collection, ttl=60)
+    token = store.issue("alice")
+    assert store.resolve(None) is None
+    assert store.resolve("alice") is None
+
+    collection.update_one({"_id": token_hash(token)},
+                          {"$set": {"created_at": datetime.now(timezone.utc) - timedelta(seconds=61)}})
+    assert SessionStore(collection, ttl=60).resolve(token) is None
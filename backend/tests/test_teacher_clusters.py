@@ -0,0 +1,116 @@
+import mongomock
+import numpy as np
+import pytest
+from bson import ObjectId
+
+from teacher_clusters import TeacherClusters
+
+
+def vector(*values):
+    return list(values) + [0.0] * (8 - len(values))
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def worker(db):
+    # One server process: its own clusters in memory, synced through the shared collection
+    return TeacherClusters(threshold=0.9, collection=db.teacher_clusters, questions=db.teacher_answering,
+                           sync_interval=0)
+
+
+def queue(db, clusters, embedding, status="pending"):
+    question_id = ObjectId()
+    cluster_id = clusters.assign(question_id, embedding)
+    db.teacher_answering.insert_one({"_id": question_id, "cluster_id": cluster_id, "embedding": embedding,
+                                     "status": status})
+    return question_id, cluster_id
+
+
+def test_similar_questions_share_a_cluster_and_others_do_not(db):
+    clusters = worker(db)
+    first, cluster_id = queue(db, clusters, vector(1, 0.1))
+    _, same = queue(db, clusters, vector(1, 0.12))
+    _, other = queue(db, clusters, vector(0, 1))
+
+    assert cluster_id == first == same
+    assert other != cluster_id
+    assert db.teacher_clusters.count_documents({"status": "pending"}) == 2
+
+
+def test_workers_see_each_others_clusters(db):
+    a, b = worker(db), worker(db)
+    _, cluster_id = queue(db, a, vector(1, 0.1))
+    _, joined = queue(db, b, vector(1, 0.12))
+    assert joined == cluster_id
+
+
+def test_close_reaches_other_workers(db):
+    a, b = worker(db), worker(db)
+    _, cluster_id = queue(db, a, vector(1, 0.1))
+    b.sync(force=True)
+    a.close(cluster_id)
+
+    _, new_cluster = queue(db, b, vector(1, 0.12))
+    assert new_cluster != cluster_id
+
+
+def test_duplicate_clusters_opened_at_once_merge_into_the_older(db):
+    a, b = worker(db), worker(db)
+    a.sync(force=True)
+    b.sync(force=True)
+    a.sync_interval = b.sync_interval = 3600
+    # Neither worker has synced the other's cluster when it opens its own
+    first, older = queue(db, a, vector(1, 0.1))
+    second, newer = queue(db, b, vector(1, 0.12))
+    assert older != newer
+
+    a.sync(force=True)
+    b.sync(force=True)
+
+    assert db.teacher_clusters.find_one({"_id": newer})["status"] == "merged"
+    assert db.teacher_answering.find_one({"_id": second})["cluster_id"] == older
+    assert a.assign(ObjectId(), vector(1, 0.11)) == older
+    assert b.assign(ObjectId(), vector(1, 0.11)) == older
+
+
+def test_settle_moves_questions_written_after_their_cluster_closed(db):
+    clusters = worker(db)
+    _, cluster_id = queue(db, clusters, vector(1, 0.1))
+    # Assigned before the teacher answered, written after
+    late_id = ObjectId()
+    assert clusters.assign(late_id, vector(1, 0.12)) == cluster_id
+    clusters.close(cluster_id)
+    late = {"_id": late_id, "cluster_id": cluster_id, "embedding": vector(1, 0.12), "status": "pending"}
+    db.teacher_answering.insert_one(dict(late))
+
+    clusters.settle([late])
+
+    moved = db.teacher_answering.find_one({"_id": late_id})["cluster_id"]
+    assert moved != cluster_id
+    assert db.teacher_clusters.find_one({"_id": moved})["status"] == "pending"
+
+
+def test_load_assigns_pending_questions_without_an_open_cluster(db):
+    legacy = [ObjectId(), ObjectId()]
+    db.teacher_answering.insert_many([
+        {"_id": legacy[0], "embedding": vector(1, 0.1), "status": "pending"},
+        {"_id": legacy[1], "embedding": vector(1, 0.12), "status": "pending"},
+    ])
+    clusters = worker(db)
+    clusters.load()
+
+    assigned = {doc["cluster_id"] for doc in db.teacher_answering.find()}
+    assert assigned == {legacy[0]}
+    assert len(clusters) == 1
+
+
+def test_in_memory_clusters_reuse_rows_after_close():
+    clusters = TeacherClusters(threshold=0.9)
+    ids = [clusters.assign(n, np.eye(8)[n]) for n in range(8)]
+    clusters.close(ids[2])
+    assert len(clusters) == 7
+    assert clusters.assign(100, np.eye(8)[7]) == ids[7]
+    assert clusters.assign(101, np.eye(8)[2]) == 101
@@ -0,0 +1,63 @@
+from datetime import datetime, timezone
+
+import mongomock
+import pytest
+from bson import ObjectId
+
+import teacher_queue
+from teacher_queue import list_clusters
+
+
+@pytest.fixture
+def db():
+    return mongomock.MongoClient().db
+
+
+def add_cluster(db, messages, status="pending"):
+    question_ids = [ObjectId() for _ in messages]
+    cluster_id = question_ids[0]
+    db.teacher_clusters.insert_one({"_id": cluster_id, "status": status})
+    db.teacher_answering.insert_many([
+        {"_id": question_id, "cluster_id": cluster_id, "user_message": message, "similarity_score": 0.2,
+         "status": status, "updated_at": datetime.now(timezone.utc)}
+        for question_id, message in zip(question_ids, messages)
+    ])
+    return cluster_id
+
+
+def test_pages_cover_every_pending_cluster_once(db):
+    cluster_ids = [add_cluster(db, [f"question {n}", f"question {n}?"]) for n in range(5)]
+    add_cluster(db, ["answered question"], status="answered")
+
+    seen, after = [], None
+    while True:
+        clusters, after = list_clusters(db.teacher_clusters, db.teacher_answering, after, limit=2)
+        seen.extend(clusters)
+        if after is None:
+            break
+
+    assert [cluster["_id"] for cluster in seen] == [str(cluster_id) for cluster_id in cluster_ids]
+    assert all(cluster["count"] == 2 for cluster in seen)
+    assert seen[0]["user_message"] == "question 0"
+    assert seen[0]["examples"] == ["question 0?"]
+
+
+def test_cluster_lists_are_capped(db, monkeypatch):
+    monkeypatch.setattr(teacher_queue, "CLUSTER_MESSAGES", 3)
+    monkeypatch.setattr(teacher_queue, "CLUSTER_QUESTION_IDS", 2)
+    add_cluster(db, [f"wording {n}" for n in range(10)])
+
+    [cluster], next_cursor = list_clusters(db.teacher_clusters, db.teacher_answering)
+
+    assert next_cursor is None
+    assert cluster["count"] == 10
+    assert cluster["examples"] == ["wording 1", "wording 2"]
+    assert len(cluster["question_ids"]) == 2
+
+
+def test_cluster_without_written_questions_is_skipped(db):
+    db.teacher_clusters.insert_one({"_id": ObjectId(), "status": "pending"})
+    cluster_id = add_cluster(db, ["written question"])
+
+    clusters, _ = list_clusters(db.teacher_clusters, db.teacher_answering)
+    assert [cluster["_id"] for cluster in clusters] == [str(cluster_id)]
@@ -0,0 +1,29 @@
+import pytest
+from langchain_community.vectorstores import FAISS
+
+from fakes import HashingFakeEmbeddings
+from vector_index import IndexConfig, apply_index_config, delete_vectors, index_type_of
+
+TEXTS = [f"Lecture {n} covers topic {n * 7 % 97} and exercise {n}." for n in range(400)]
+
+
+@pytest.mark.parametrize("index_type", ["flat", "ivf", "ivfpq", "hnsw"])
+def test_search_after_delete_returns_remaining_documents(index_type):
+    config = IndexConfig(index_type, nprobe=64, ef_search=256)
+    store = FAISS.from_texts(TEXTS, HashingFakeEmbeddings(size=64), ids=[str(n) for n in range(len(TEXTS))])
+    store = apply_index_config(store, config)
+    assert index_type_of(store.index) == index_type
+
+    delete_vectors(store, [str(n) for n in range(200)], config)
+
+    assert store.index.ntotal == 200
+    found = store.similarity_search(TEXTS[300], k=4)
+    assert all(int(doc.id) >= 200 for doc in found)
+    if index_type != "ivfpq":  # PQ codes only approximate the vectors
+        assert found[0].page_content == TEXTS[300]
+
+    # Documents added afterwards get positions that don't collide with the remaining ones
+    [new_id] = store.add_texts(["A brand new lecture on error correction."])
+    assert store.index_to_docstore_id[store.index.ntotal - 1] == new_id
+    found = store.similarity_search(TEXTS[399], k=4)
+    assert all(int(doc.id) >= 200 for doc in found if doc.id != new_id)
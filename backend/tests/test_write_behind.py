@@ -0,0 +1,125 @@
+import time
+
+import mongomock
+import pytest
+from pymongo.errors import AutoReconnect
+
+from write_behind import WriteBehindQueue
+
+
+class FlakyDatabase:
+    """mongomock database whose inserts fail with AutoReconnect while `down` is set."""
+
+    def __init__(self):
+        self.db = mongomock.MongoClient().db
+        self.down = False
+
+    def __getitem__(self, name):
+        collection = self.db[name]
+        if not self.down:
+            return collection
+
+        class Unavailable:
+            def insert_many(self, documents, ordered=True):
+                raise AutoReconnect("connection refused")
+
+        return Unavailable()
+
+
+@pytest.fixture
+def database():
+    return FlakyDatabase()
+
+
+def make_queue(database, tmp_path, **kwargs):
+    kwargs.setdefault("flush_interval", 0.05)
+    return WriteBehindQueue(database, spill_path=str(tmp_path / "spill.jsonl"), **kwargs)
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_flush_writes_queued_documents_and_notifies(database, tmp_path):
+    writes = make_queue(database, tmp_path, stamp_field="updated_at")
+    flushed = []
+    writes.on_flush(lambda name, docs: flushed.append((name, len(docs))))
+
+    ids = [writes.put("answers", {"n": n}) for n in range(3)]
+    writes.flush()
+
+    docs = list(database.db.answers.find().sort("n"))
+    assert [doc["_id"] for doc in docs] == ids
+    assert all("updated_at" in doc for doc in docs)
+    assert writes.flushed == 3
+    assert sum(count for _, count in flushed) == 3
+
+
+def test_worker_writes_in_the_background(database, tmp_path):
+    writes = make_queue(database, tmp_path)
+    writes.put("answers", {"n": 1})
+    wait_for(lambda: database.db.answers.count_documents({}) == 1)
+
+
+def test_outage_spills_and_next_flush_replays(database, tmp_path):
+    writes = make_queue(database, tmp_path)
+    database.down = True
+    for n in range(3):
+        writes.put("answers", {"n": n})
+    writes.flush()
+
+    assert writes.spilled == 3
+    assert (tmp_path / "spill.jsonl").exists()
+    assert database.db.answers.count_documents({}) == 0
+
+    database.down = False
+    writes.flush()
+
+    assert sorted(doc["n"] for doc in database.db.answers.find()) == [0, 1, 2]
+    assert not (tmp_path / "spill.jsonl").exists()
+
+
+def test_replay_is_idempotent_for_documents_already_written(database, tmp_path):
+    writes = make_queue(database, tmp_path)
+    _id = writes.put("answers", {"n": 1})
+    writes.flush()
+    # The same document spilled again, e.g. after a timeout on a write that went through
+    writes._spill([("answers", {"_id": _id, "n": 1})])
+    writes.flush()
+
+    assert database.db.answers.count_documents({}) == 1
+    assert not (tmp_path / "spill.jsonl").exists()
+
+
+def test_replay_skips_corrupt_lines(database, tmp_path):
+    writes = make_queue(database, tmp_path)
+    database.down = True
+    writes.put("answers", {"n": 1})
+    writes.flush()
+    with open(tmp_path / "spill.jsonl", "a") as f:
+        f.write('{"collection": "answers", "document": \n')
+
+    database.down = False
+    writes.flush()
+
+    assert [doc["n"] for doc in database.db.answers.find()] == [1]
+    assert writes.dropped == 1
+
+
+def test_worker_survives_a_failing_listener(database, tmp_path):
+    writes = make_queue(database, tmp_path)
+
+    def fail(name, docs):
+        raise RuntimeError("listener bug")
+
+    writes.on_flush(fail)
+    writes.put("answers", {"n": 1})
+    wait_for(lambda: writes.flushed == 1)
+    writes.put("answers", {"n": 2})
+    wait_for(lambda: writes.flushed == 2)
+
+    assert writes._worker.is_alive()
+    assert database.db.answers.count_documents({}) == 2
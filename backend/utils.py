@@ -4,16 +4,44 @@ from langchain.chains import ConversationalRetrievalChain
 from langchain.prompts import PromptTemplate
 from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_community.vectorstores import FAISS
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from PyPDF2 import PdfReader
 
+from chunking import chunking_from_env, token_splitter
+from embedding_batcher import BatchingEmbeddings
+from embedding_cache import CachedEmbeddings, EmbeddingCache
+from index_manifest import sync_index
+from rag_engine import RAGEngine, save_index
+from vector_index import IndexConfig, apply_index_config
+
 # Load environment variables
 load_dotenv()
 
 # Setup paths and embeddings
-INDEX_PATH = "./faiss_index"
+INDEX_PATH = os.getenv("FAISS_INDEX_PATH", "./faiss_index")
 UPLOAD_FOLDER = './teacher_pdfs'
-embeddings = OpenAIEmbeddings()
+
+# Index type (FAISS_INDEX_TYPE: flat, ivf, hnsw, ivfpq) and search parameters (FAISS_NPROBE, FAISS_EF_SEARCH, RAG_TOP_K)
+index_config = IndexConfig.from_env()
+
+# Chunks are sized in embedding tokens; chunks nearly repeating one already indexed are not embedded
+CHUNKING = chunking_from_env()
+text_splitter = token_splitter(CHUNKING["chunk_tokens"], CHUNKING["overlap_tokens"])
+
+# Embeddings are cached in memory and, unless EMBEDDING_CACHE_PATH is empty, in SQLite
+embedding_cache = EmbeddingCache(
+    max_entries=int(os.getenv("EMBEDDING_CACHE_SIZE", "10000")),
+    path=os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3") or None,
+    max_disk_entries=int(os.getenv("EMBEDDING_CACHE_DISK_SIZE", "200000")),
+)
+
+# Cache misses arriving close together are sent to OpenAI in one batched call
+batching_embeddings = BatchingEmbeddings(
+    OpenAIEmbeddings(),
+    max_batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", "64")),
+    max_wait=float(os.getenv("EMBEDDING_BATCH_WAIT", "0.01")),
+)
+embedding_batcher = batching_embeddings.batcher
+embeddings = CachedEmbeddings(batching_embeddings, embedding_cache)
 
 # Ensure the upload folder exists
 if not os.path.exists(UPLOAD_FOLDER):
@@ -25,26 +53,26 @@ def check_existing_index(index_path):
 
 # Function to get text from uploaded PDF files
 def get_pdf_text(pdf_docs):
-    text = ""
+    # Join once at the end instead of re-copying the text for every page
+    pages = []
     for pdf in pdf_docs:
         pdf_reader = PdfReader(pdf)
         for page in pdf_reader.pages:
-            text += page.extract_text()
-    return text
+            pages.append(page.extract_text() or "")
+    return "".join(pages)
 
-# Function to split the text into chunks for vector store
+# Function to split the text into token-sized chunks for vector store
 def get_text_chunks(text):
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=200, chunk_overlap=100)
     chunks = text_splitter.split_text(text)
     return chunks
 
 # Function to create and save a vector store from text chunks
 def get_vector_store(text_chunks):
     vector_store = FAISS.from_texts(text_chunks, embeddings)
-    vector_store.save_local(INDEX_PATH)
+    save_index(apply_index_config(vector_store, index_config), INDEX_PATH)
 
 # Function to create a conversational retrieval chain
-def get_conversational_chain(vectorstore):
+def get_conversational_chain(vectorstore, llm=None, condense_question_llm=None):
     prompt_template = """
     System: You are a highly knowledgeable tutor, specializing in explaining the content of specific documents provided by the user. Your task is to help the user understand and learn from the documents they have uploaded, strictly using only the information provided therein. Here are your guidelines:
 
@@ -71,37 +99,40 @@ def get_conversational_chain(vectorstore):
         template=prompt_template
     )
 
-    llm = ChatOpenAI(model_name="gpt-4o", temperature=0.1)
-    retriever = vectorstore.as_retriever()
+    # The answering LLM streams its tokens; rephrasing the follow-up question does not,
+    # so the rephrased question never reaches the caller's token stream
+    if llm is None:
+        # stream_usage asks OpenAI to end the stream with the token counts, which /metrics reports
+        llm = ChatOpenAI(model_name="gpt-4o", temperature=0.1, streaming=True, stream_usage=True)
+    if condense_question_llm is None:
+        condense_question_llm = llm.model_copy(update={"streaming": False}) if getattr(llm, "streaming", False) else llm
+    retriever = vectorstore.as_retriever(search_kwargs={"k": index_config.k})
 
     chain = ConversationalRetrievalChain.from_llm(
         llm=llm,
         retriever=retriever,
+        condense_question_llm=condense_question_llm,
         combine_docs_chain_kwargs={'prompt': prompt}
     )
     return chain
 
+# Shared RAG engine: the vector store and chain are loaded once per process;
+# flat indexes are memory-mapped unless FAISS_MMAP=0, so worker processes share them
+rag_engine = RAGEngine(
+    INDEX_PATH, embeddings, get_conversational_chain,
+    mmap=os.getenv("FAISS_MMAP", "1") != "0", index_config=index_config,
+)
+
 # Function to process question and get an answer
-def process_question(question, uuploaded_pdfs = ["teacher_pdfs/chapter4.pdf", "teacher_pdfs/chapter5.pdf"] ):
+def process_question(question, uploaded_pdfs = ["teacher_pdfs/chapter4.pdf", "teacher_pdfs/chapter5.pdf"], chat_history=None):
     # Extract text from PDFs and create a vector store if necessary
-    if check_existing_index(INDEX_PATH):
-        # Load existing vector store
-        vector_store = FAISS.load_local(INDEX_PATH, embeddings=embeddings, allow_dangerous_deserialization=True)
-    else:
-        # Process the uploaded PDFs
-        raw_text = get_pdf_text(uploaded_pdfs)
-        text_chunks = get_text_chunks(raw_text)
-        get_vector_store(text_chunks)
-        vector_store = FAISS.load_local(INDEX_PATH, embeddings=embeddings, allow_dangerous_deserialization=True)
-
-    # Create the conversational retrieval chain
-    chain = get_conversational_chain(vector_store)
-
-    # Initialize chat history
-    chat_history = []
-
-    # Run the chain to get the answer
-    response = chain.run(question=question, context=vector_store, chat_history=chat_history)
+    if not rag_engine.is_ready():
+        # Process the uploaded PDFs page by page in parallel
+        sync_index(uploaded_pdfs, embeddings, get_text_chunks, INDEX_PATH, index_config=index_config, chunking=CHUNKING)
+        rag_engine.reload()
+
+    # Run the shared chain to get the answer, with the earlier (question, answer) turns if any
+    response = rag_engine.run(question, chat_history=chat_history or [])
 
     return response
 
@@ -0,0 +1,295 @@
+import argparse
+import json
+import math
+import os
+import statistics
+import time
+
+import faiss
+import numpy as np
+
+# FAISS index types the document store can be built with
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+
+# k-means wants this many training points per centroid; fewer gives poor centroids
+POINTS_PER_CENTROID = 39
+
+
+class IndexConfig:
+    """How the document index is built and searched.
+
+    `nlist` (IVF lists) and `pq_m` (PQ sub-quantizers) are sized from the
+    corpus when left as None. `nprobe` and `ef_search` trade recall for
+    latency at query time; `k` is how many chunks the retriever returns.
+    """
+
+    def __init__(self, index_type="flat", nlist=None, nprobe=8, hnsw_m=32, ef_search=64, pq_m=None, k=4):
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type: {index_type}")
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.hnsw_m = hnsw_m
+        self.ef_search = ef_search
+        self.pq_m = pq_m
+        self.k = k
+
+    @classmethod
+    def from_env(cls):
+        nlist, pq_m = os.getenv("FAISS_NLIST"), os.getenv("FAISS_PQ_M")
+        return cls(
+            index_type=os.getenv("FAISS_INDEX_TYPE", "flat").lower(),
+            nlist=int(nlist) if nlist else None,
+            nprobe=int(os.getenv("FAISS_NPROBE", "8")),
+            hnsw_m=int(os.getenv("FAISS_HNSW_M", "32")),
+            ef_search=int(os.getenv("FAISS_EF_SEARCH", "64")),
+            pq_m=int(pq_m) if pq_m else None,
+            k=int(os.getenv("RAG_TOP_K", "4")),
+        )
+
+    def nlist_for(self, count):
+        # About 4*sqrt(n) lists, capped so every centroid gets enough training points
+        nlist = self.nlist or int(4 * math.sqrt(count))
+        return max(1, min(nlist, count // POINTS_PER_CENTROID))
+
+    def factory_string(self, dim, count):
+        if self.index_type == "flat":
+            return "Flat"
+        if self.index_type == "hnsw":
+            return f"HNSW{self.hnsw_m}"
+        # Too few vectors to train centroids: search them exactly
+        if count < POINTS_PER_CENTROID:
+            return "Flat"
+        ivf = f"IVF{self.nlist_for(count)}"
+        if self.index_type == "ivf":
+            return f"{ivf},Flat"
+        # PQ needs m to divide the dimension and 2^nbits codebook entries it can train
+        m = self.pq_m or max(d for d in range(1, dim // 16 + 1) if dim % d == 0)
+        nbits = max(1, min(8, int(math.log2(max(2, count // POINTS_PER_CENTROID)))))
+        return f"{ivf},PQ{m}x{nbits}"
+
+
+# Function to name the type of a FAISS index
+def index_type_of(index):
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ):
+        return "ivfpq"
+    if isinstance(index, faiss.IndexIVF):
+        return "ivf"
+    return "flat"
+
+
+# Function to build and fill an index of the configured type over `vectors`
+def build_index(vectors, config):
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    index = faiss.index_factory(vectors.shape[1], config.factory_string(vectors.shape[1], len(vectors)), faiss.METRIC_L2)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add(vectors)
+    configure_search(index, config)
+    return index
+
+
+# Function to apply the query-time parameters (nprobe, efSearch) to a loaded index
+def configure_search(index, config):
+    if config is None:
+        return index
+    kind = index_type_of(index)
+    if kind in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).nprobe = config.nprobe
+    elif kind == "hnsw":
+        faiss.downcast_index(index).hnsw.efSearch = config.ef_search
+    return index
+
+
+# Function to read every vector back out of an index, in position order
+def read_vectors(index):
+    """Return the stored vectors as a float32 matrix.
+
+    Exact for flat, IVF-flat and HNSW indexes; PQ codes decode to
+    approximations, which is why a PQ index is never rebuilt from itself.
+    """
+    if index.ntotal == 0:
+        return np.zeros((0, index.d), dtype=np.float32)
+    if index_type_of(index) in ("ivf", "ivfpq"):
+        faiss.extract_index_ivf(index).make_direct_map()
+    return index.reconstruct_n(0, index.ntotal)
+
+
+# Function to tell whether a store's index must be rebuilt to match the configuration
+def needs_rebuild(index, config):
+    kind = index_type_of(index)
+    expected = config.index_type
+    if expected in ("ivf", "ivfpq") and index.ntotal < POINTS_PER_CENTROID:
+        expected = "flat"
+    if kind != expected:
+        return True
+    # An IVF index trained on a much smaller corpus has too few, overfull lists
+    if kind == "ivf" and index.ntotal:
+        return config.nlist_for(index.ntotal) >= 2 * faiss.extract_index_ivf(index).nlist
+    return False
+
+
+# Function to convert a vector store's index to the configured type, keeping its documents
+def apply_index_config(vector_store, config):
+    """Rebuild `vector_store.index` in place if its type or size calls for it.
+
+    Positions are preserved, so the docstore mapping stays valid. Returns
+    the store for chaining.
+    """
+    if config is None or vector_store is None or vector_store.index.ntotal == 0:
+        return vector_store
+    if needs_rebuild(vector_store.index, config):
+        vector_store.index = build_index(read_vectors(vector_store.index), config)
+    configure_search(vector_store.index, config)
+    return vector_store
+
+
+# Function to remove vectors from an IVF index in place, renumbering the rest to positions 0..n-1
+def _remove_ivf(index, kept):
+    """Keep only the vectors labelled `kept` (ascending); the i-th of them is relabelled i.
+
+    IVF lists store each vector's label, and removal leaves the others'
+    labels as they were, unlike a flat index whose positions shift down.
+    The docstore mapping is by position, so the labels are rewritten.
+    """
+    ivf = faiss.extract_index_ivf(index)
+    # An array direct map (left by read_vectors) does not support removal
+    ivf.set_direct_map_type(faiss.DirectMap.NoMap)
+    kept = np.asarray(kept, dtype=np.int64)
+    index.remove_ids(np.setdiff1d(np.arange(index.ntotal, dtype=np.int64), kept))
+    for list_no in range(ivf.nlist):
+        size = ivf.invlists.list_size(list_no)
+        if size:
+            labels = faiss.rev_swig_ptr(ivf.invlists.get_ids(list_no), size)
+            labels[:] = np.searchsorted(kept, labels)
+
+
+# Function to delete documents from a vector store, rebuilding indexes that cannot remove vectors
+def delete_vectors(vector_store, ids, config=None):
+    """Remove the vectors for docstore `ids`.
+
+    Flat and IVF indexes remove in place (IVF labels are then renumbered to
+    match the docstore mapping). HNSW graphs do not support removal, so the
+    remaining vectors are re-inserted into a new graph.
+    """
+    if not ids:
+        return vector_store
+    kind = index_type_of(vector_store.index)
+    if kind == "flat":
+        vector_store.delete(ids)
+        return vector_store
+
+    removed = set(ids)
+    kept = [(i, doc_id) for i, doc_id in sorted(vector_store.index_to_docstore_id.items()) if doc_id not in removed]
+    if kind == "hnsw":
+        vectors = read_vectors(vector_store.index)[[i for i, _ in kept]]
+        config = config or IndexConfig("hnsw", hnsw_m=faiss.downcast_index(vector_store.index).hnsw.nb_neighbors(1))
+        vector_store.index = build_index(vectors, config)
+    else:
+        _remove_ivf(vector_store.index, [i for i, _ in kept])
+    vector_store.docstore.delete(list(removed & set(vector_store.index_to_docstore_id.values())))
+    vector_store.index_to_docstore_id = {i: doc_id for i, (_, doc_id) in enumerate(kept)}
+    return vector_store
+
+
+# Function to measure one index configuration against exact search
+def evaluate(corpus, queries, exact, config, search_values, k):
+    """Build `config` over `corpus`, then report recall@k and latency per search value.
+
+    `exact` holds the true top-k positions per query. Latency is measured
+    one query at a time, the way the retriever searches.
+    """
+    started = time.perf_counter()
+    index = build_index(corpus, config)
+    build_seconds = time.perf_counter() - started
+    size_bytes = faiss.serialize_index(index).nbytes
+
+    results = []
+    for value in search_values:
+        if config.index_type in ("ivf", "ivfpq"):
+            config.nprobe = value
+        elif config.index_type == "hnsw":
+            config.ef_search = value
+        configure_search(index, config)
+
+        found, runs = [], []
+        for query in queries:
+            started = time.perf_counter()
+            _, positions = index.search(query[None, :], k)
+            runs.append((time.perf_counter() - started) * 1000)
+            found.append(positions[0])
+        recall = np.mean([len(set(f) & set(e)) / k for f, e in zip(found, exact)])
+        runs.sort()
+        results.append({
+            "index": config.factory_string(corpus.shape[1], len(corpus)),
+            "search": {"ivf": "nprobe", "ivfpq": "nprobe", "hnsw": "efSearch"}.get(config.index_type),
+            "value": value,
+            f"recall@{k}": round(float(recall), 4),
+            "median_ms": statistics.median(runs),
+            "p95_ms": runs[min(len(runs) - 1, int(len(runs) * 0.95))],
+            "build_s": round(build_seconds, 3),
+            "mb": round(size_bytes / 2**20, 2),
+        })
+    return results
+
+
+# Function to make queries near corpus vectors when no real questions are available
+def synthetic_queries(corpus, count, noise=0.5, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = corpus[rng.integers(0, len(corpus), count)]
+    scale = noise * np.linalg.norm(rows, axis=1, keepdims=True) / math.sqrt(corpus.shape[1])
+    return (rows + rng.standard_normal(rows.shape).astype(np.float32) * scale).astype(np.float32)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report recall@k and latency of each FAISS index type on the document corpus.")
+    parser.add_argument("--index-path", default="./faiss_index")
+    parser.add_argument("--questions", default="faq.csv", help="CSV of real questions to search with")
+    parser.add_argument("--column", default="Question")
+    parser.add_argument("--queries", type=int, default=500, help="number of queries to run")
+    parser.add_argument("--synthetic", action="store_true", help="perturb corpus vectors instead of embedding the CSV")
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--types", nargs="+", choices=INDEX_TYPES, default=list(INDEX_TYPES))
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--ef-search", type=int, nargs="+", default=[16, 32, 64, 128])
+    parser.add_argument("--output", help="also write the results as JSON")
+    args = parser.parse_args()
+
+    corpus = read_vectors(faiss.read_index(os.path.join(args.index_path, "index.faiss")))
+    if not args.synthetic and os.path.exists(args.questions):
+        import pandas as pd
+
+        from utils import embeddings
+
+        questions = pd.read_csv(args.questions, encoding="ISO-8859-1")[args.column].dropna().astype(str).tolist()
+        queries = np.array(embeddings.embed_documents(questions[:args.queries]), dtype=np.float32)
+    else:
+        queries = synthetic_queries(corpus, args.queries)
+
+    k = min(args.k, len(corpus))
+    exact_index = faiss.IndexFlatL2(corpus.shape[1])
+    exact_index.add(corpus)
+    _, exact = exact_index.search(queries, k)
+    print(f"{len(corpus)} vectors x {corpus.shape[1]} dims, {len(queries)} queries, k={k}")
+
+    results = []
+    for index_type in args.types:
+        search_values = {"ivf": args.nprobe, "ivfpq": args.nprobe, "hnsw": args.ef_search}.get(index_type, [None])
+        for result in evaluate(corpus, queries, exact, IndexConfig(index_type, k=k), search_values, k):
+            results.append(result)
+            search = f"{result['search']}={result['value']}" if result["search"] else ""
+            print(f"{result['index']:22} {search:13} recall@{k} {result[f'recall@{k}']:.3f}  "
+                  f"median {result['median_ms']:.3f} ms  p95 {result['p95_ms']:.3f} ms  "
+                  f"{result['mb']:.1f} MB  built in {result['build_s']:.2f}s")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"vectors": len(corpus), "queries": len(queries), "k": k, "results": results}, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+import atexit
+import fcntl
+import logging
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+
+from bson import ObjectId, json_util
+from pymongo.errors import BulkWriteError, PyMongoError
+
+logger = logging.getLogger(__name__)
+
+# MongoDB error code for a duplicate _id, expected when replaying spilled documents
+DUPLICATE_KEY = 11000
+
+# Sentinel telling the worker to write what it holds and exit
+_STOP = object()
+
+
+class WriteBehindQueue:
+    """Buffer MongoDB inserts and write them in bulk from a background thread.
+
+    `put` returns immediately; the worker flushes with `insert_many` once
+    `max_batch` documents are waiting or `flush_interval` seconds have
+    passed, so a queued document reaches MongoDB within roughly one
+    interval. If MongoDB is slow or down, batches are appended to a JSON
+    lines file at `spill_path` (up to `max_spill_bytes`) and replayed after
+    the next successful flush. Remaining documents are flushed at exit.
+
+    With `stamp_field`, each document gets the time it was actually written
+    in that field, so readers polling by time never miss a late write.
+
+    Several processes (e.g. gunicorn workers) can share one spill file: it
+    is only read or written under an exclusive lock on `spill_path + ".lock"`.
+    """
+
+    def __init__(self, db, max_batch=100, flush_interval=0.5, spill_path=None,
+                 max_spill_bytes=50 * 1024 * 1024, max_queued=10000, stamp_field=None):
+        self.db = db
+        self.stamp_field = stamp_field
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.spill_path = spill_path
+        self.max_spill_bytes = max_spill_bytes
+
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pid = None
+        self._worker = None
+        self._listeners = []
+
+        self.flushed = 0
+        self.spilled = 0
+        self.dropped = 0
+        atexit.register(self.close)
+
+    def on_flush(self, callback):
+        """Register callback(collection_name, documents) to run after each successful insert."""
+        self._listeners.append(callback)
+
+    def _ensure_started(self):
+        # Threads don't survive fork, so start (or restart) the worker in the current process
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            self._worker = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._worker.start()
+            self._pid = os.getpid()
+
+    def put(self, collection_name, document):
+        """Queue `document` for insertion and return its _id, assigned up front."""
+        self._ensure_started()
+        document.setdefault("_id", ObjectId())
+        try:
+            self._queue.put_nowait((collection_name, document))
+        except queue.Full:
+            self._spill([(collection_name, document)])
+        return document["_id"]
+
+    def _run(self):
+        pending = self._queue
+        while True:
+            try:
+                if self._run_batch(pending):
+                    return
+            except Exception:
+                # Keep writing later batches whatever went wrong with this one
+                logger.exception("Write-behind batch failed")
+
+    def _run_batch(self, pending):
+        # Collect and write one batch; returns True once asked to stop
+        item = pending.get()
+        stop = item is _STOP
+        batch = [] if stop else [item]
+        deadline = time.monotonic() + self.flush_interval
+        while not stop and len(batch) < self.max_batch:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = pending.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                stop = True
+            else:
+                batch.append(item)
+        if batch:
+            self._write(batch)
+        return stop
+
+    def _drain(self):
+        batch = []
+        while True:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                return batch
+
+    def flush(self):
+        """Write everything queued so far, then replay any spilled documents."""
+        batch = [item for item in self._drain() if item is not _STOP]
+        if batch:
+            self._write(batch)
+        else:
+            with self._flush_lock:
+                self._replay_spill()
+
+    def close(self, timeout=10):
+        """Stop the worker after it writes what it holds, then flush the rest."""
+        if self._pid == os.getpid() and self._worker.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                pass
+            self._worker.join(timeout)
+            self._pid = None
+        self.flush()
+
+    def _write(self, batch):
+        with self._flush_lock:
+            by_collection = defaultdict(list)
+            for collection_name, document in batch:
+                by_collection[collection_name].append(document)
+
+            failed = self._insert_all(by_collection)
+            if failed:
+                self._spill(failed)
+            else:
+                self._replay_spill()
+
+    def _insert_all(self, by_collection):
+        # Insert each collection's documents; return the ones to retry later
+        failed = []
+        for collection_name, documents in by_collection.items():
+            try:
+                self._insert(collection_name, documents)
+            except PyMongoError:
+                failed.extend((collection_name, document) for document in documents)
+            except Exception:
+                # Not a MongoDB outage (e.g. a document BSON can't encode): retrying would fail the same way
+                logger.exception("Dropping %d documents for %s", len(documents), collection_name)
+                self.dropped += len(documents)
+        return failed
+
+    def _insert(self, collection_name, documents):
+        if self.stamp_field:
+            written_at = datetime.now(timezone.utc)
+            for document in documents:
+                document[self.stamp_field] = written_at
+        try:
+            self.db[collection_name].insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # Documents already written by an earlier, partially failed attempt are fine
+            if any(error["code"] != DUPLICATE_KEY for error in e.details.get("writeErrors", [])):
+                raise
+        self.flushed += len(documents)
+        for callback in self._listeners:
+            try:
+                callback(collection_name, documents)
+            except Exception:
+                logger.exception("Write-behind flush listener failed")
+
+    def _spill_lock(self):
+        # Exclusive lock on the spill file, across threads and processes; release by closing the file
+        lock_file = open(self.spill_path + ".lock", "a")
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _spill(self, items):
+        if not self.spill_path:
+            self.dropped += len(items)
+            return
+        with self._lock, self._spill_lock():
+            size = os.path.getsize(self.spill_path) if os.path.exists(self.spill_path) else 0
+            with open(self.spill_path, "a") as f:
+                for collection_name, document in items:
+                    line = json_util.dumps({"collection": collection_name, "document": document}) + "\n"
+                    if size + len(line) > self.max_spill_bytes:
+                        self.dropped += 1
+                        continue
+                    f.write(line)
+                    size += len(line)
+                    self.spilled += 1
+
+    def _replay_spill(self):
+        if not self.spill_path or not os.path.exists(self.spill_path):
+            return
+        # Take the whole file under the lock, so another process replaying at the same time finds nothing
+        with self._lock, self._spill_lock():
+            try:
+                with open(self.spill_path) as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                return
+            os.remove(self.spill_path)
+
+        by_collection = defaultdict(list)
+        for line in lines:
+            if not line.strip():
+                continue
+            try:
+                item = json_util.loads(line)
+                by_collection[item["collection"]].append(item["document"])
+            except (ValueError, KeyError, TypeError):
+                logger.error("Skipping unreadable write-behind spill line: %r", line[:200])
+                self.dropped += 1
+
+        failed = self._insert_all(by_collection)
+        if failed:
+            self._spill(failed)
+
+    def stats(self):
+        return {
+            "queued": self._queue.qsize(),
+            "flushed": self.flushed,
+            "spilled": self.spilled,
+            "dropped": self.dropped,
+        }
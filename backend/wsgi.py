@@ -0,0 +1,40 @@
+import gc
+
+import app as application
+from utils import rag_engine
+
+
+# Function to build the Flask app with its read-only retrieval data loaded
+def create_app():
+    """WSGI app factory, run once in the gunicorn master (see gunicorn.conf.py).
+
+    Importing the app loads the FAQ snapshot, the answer cache and the
+    clients; warming the RAG engine loads the FAISS index and builds the
+    chain. Done before workers fork, all of it is shared copy-on-write,
+    and the FAQ matrix and flat FAISS vectors are file-backed memory maps.
+    Background threads (write-behind, embedding batches) and the SQLite
+    cache connection start lazily in each worker, and PyMongo resets its
+    clients in forked children.
+    """
+    rag_engine.is_ready()
+    return application.app
+
+
+# Function to run in the master once the app is preloaded, before the first worker is forked
+def after_preload():
+    # Freeze what preloading built and collect again: the master keeps running (and respawning
+    # workers) for the life of the server, and must not leak cycles with collection off
+    gc.freeze()
+    gc.enable()
+
+
+# Function to run in the master just before each worker is forked
+def before_fork():
+    # Move everything loaded so far out of the collector's reach, so a
+    # worker's garbage collections don't write to (and copy) shared pages
+    gc.freeze()
+
+
+# Function to run in each worker right after it is forked
+def after_fork():
+    gc.enable()
@@ -41,6 +41,9 @@ const Login = () => {
       const result = await response.json();
 
       if (response.status === 200) {
+        // Keep the session token that keeps the student's chat history private
+        sessionStorage.setItem("sessionId", result.session_id);
+
         // Successful login, navigate to the appropriate dashboard based on role
         console.log("User Role:", result.user.role); // Log the user role to check it
         if (isStudent) {
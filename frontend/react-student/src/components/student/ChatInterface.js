@@ -2,6 +2,12 @@ import React, { useState } from "react";
 import { AiOutlineSend } from "react-icons/ai";
 import Sidebar from "./Sidebar"; // Import Sidebar
 
+// Identify this student with the session token issued at login; without one the backend keeps no history
+const sessionHeaders = () => {
+  const sessionId = sessionStorage.getItem("sessionId");
+  return sessionId ? { "X-Session-Id": sessionId } : {};
+};
+
 const ChatInterface = ({ messageHistory = [], addQuestionToSidebar }) => {
   const [userMessage, setUserMessage] = useState("");
   const [messages, setMessages] = useState(messageHistory);
@@ -23,24 +29,52 @@ const ChatInterface = ({ messageHistory = [], addQuestionToSidebar }) => {
         { content: userMessage, status: "rag" }, // Assuming "rag" as a status for now
       ]);
 
-      // Send the user message to the backend (assuming a POST request to /api/send-message)
+      // Send the user message to the backend and stream the answer as it is generated
       try {
-        const response = await fetch("http://127.0.0.1:5000/api/send-message", {
+        const response = await fetch("http://127.0.0.1:5000/api/send-message/stream", {
           method: "POST",
           headers: {
             "Content-Type": "application/json",
+            ...sessionHeaders(),
           },
           body: JSON.stringify({ message: userMessage }),
         });
 
         // Check if the request was successful
         if (response.ok) {
-          const data = await response.json();
-          // Assuming the response contains a "bot_response" field with the bot's answer
+          // Add an empty bot message and fill it in as tokens arrive
           setMessages((prevMessages) => [
             ...prevMessages,
-            { type: "bot", content: data.bot_response },
+            { type: "bot", content: "" },
           ]);
+          const updateBotMessage = (update) =>
+            setMessages((prevMessages) => {
+              const lastMessage = prevMessages[prevMessages.length - 1];
+              return [...prevMessages.slice(0, -1), { ...lastMessage, content: update(lastMessage.content) }];
+            });
+
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder();
+          let buffer = "";
+          while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            // Server-Sent Events are separated by a blank line
+            const events = buffer.split("\n\n");
+            buffer = events.pop();
+            for (const rawEvent of events) {
+              const eventName = rawEvent.match(/^event: (.*)$/m)?.[1];
+              const data = JSON.parse(rawEvent.match(/^data: (.*)$/m)?.[1] || "{}");
+              if (eventName === "token") {
+                updateBotMessage((content) => content + data.token);
+              } else if (eventName === "done") {
+                // The final event carries the complete bot response
+                updateBotMessage(() => data.bot_response);
+              }
+            }
+          }
         } else {
           // Handle error from the backend
           setMessages((prevMessages) => [
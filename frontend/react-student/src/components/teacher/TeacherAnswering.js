@@ -1,18 +1,92 @@
 import React, { useState, useEffect } from "react";
 import Navbar from "./Navbar";
 
+const API_URL = "http://localhost:5000/api/teacher-answering";
+
+const MAX_EXAMPLES = 5;
+
+// Merge a page of clusters into the list by _id, appending new ones
+const mergeClusters = (prevData, clusters) => {
+  const byId = new Map(clusters.map((cluster) => [cluster._id, cluster]));
+  const merged = prevData.map((item) =>
+    byId.has(item._id) ? { ...item, ...byId.get(item._id) } : item
+  );
+  const known = new Set(prevData.map((item) => item._id));
+  return merged.concat(clusters.filter((cluster) => !known.has(cluster._id)));
+};
+
+// Take a question out of the cluster it was listed in, if the server has moved it to another one
+const removeMovedQuestion = (data, change, clusterId) => {
+  data.forEach((cluster, index) => {
+    if (cluster._id === clusterId || !(cluster.question_ids || []).includes(change._id)) return;
+    data[index] = {
+      ...cluster,
+      count: cluster.count - 1,
+      question_ids: cluster.question_ids.filter((id) => id !== change._id),
+    };
+  });
+};
+
+// Merge changed questions into their clusters: count new pending ones, mark answered ones
+const mergeChanges = (prevData, changes) => {
+  const data = [...prevData];
+  const position = new Map(data.map((item, index) => [item._id, index]));
+  changes.forEach((change) => {
+    const clusterId = change.cluster_id || change._id;
+    // Clusters opened twice at once are merged, and late questions move out of answered clusters
+    if (change.status === "pending") removeMovedQuestion(data, change, clusterId);
+    if (!position.has(clusterId)) {
+      if (change.status !== "pending") return;
+      position.set(clusterId, data.length);
+      data.push({
+        _id: clusterId,
+        user_message: change.user_message,
+        similarity_score: change.similarity_score,
+        count: 1,
+        question_ids: [change._id],
+        examples: [],
+        deferred: Boolean(change.deferred),
+      });
+      return;
+    }
+    const index = position.get(clusterId);
+    const cluster = data[index];
+    if (change.status === "answered") {
+      data[index] = { ...cluster, status: "answered" };
+    } else if (!cluster.question_ids.includes(change._id)) {
+      const examples = cluster.examples || [];
+      const isNewWording =
+        change.user_message !== cluster.user_message && !examples.includes(change.user_message);
+      data[index] = {
+        ...cluster,
+        status: "pending",
+        count: cluster.count + 1,
+        question_ids: cluster.question_ids.concat(change._id),
+        examples: isNewWording && examples.length < MAX_EXAMPLES ? examples.concat(change.user_message) : examples,
+        deferred: cluster.deferred || Boolean(change.deferred),
+      };
+    }
+  });
+  return data.filter((cluster) => cluster.count > 0 || cluster.status === "answered");
+};
+
 const TeacherAnswering = () => {
   const [data, setData] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [changesCursor, setChangesCursor] = useState(null);
+  const [polls, setPolls] = useState(0);
   const [teacherAnswer, setTeacherAnswer] = useState("");
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState(null);
 
-  // Fetch data from the Flask backend
+  // Fetch the first page of pending question clusters from the Flask backend
   useEffect(() => {
-    fetch("http://localhost:5000/api/teacher-answering")
+    fetch(API_URL)
       .then((response) => response.json())
-      .then((data) => {
-        setData(data);
+      .then((page) => {
+        setData(page.clusters);
+        setNextCursor(page.next_cursor);
+        setChangesCursor(page.changes_cursor);
         setLoading(false);
       })
       .catch((error) => {
@@ -21,11 +95,49 @@ const TeacherAnswering = () => {
       });
   }, []);
 
-  // Handle answer submission
-  const handleAnswerSubmit = (question_id) => {
+  // Long-poll for new and answered questions instead of re-downloading the queue
+  useEffect(() => {
+    if (changesCursor === null) return;
+    const controller = new AbortController();
+    let retryTimer;
+
+    fetch(`${API_URL}/changes?since=${changesCursor}&timeout=25`, { signal: controller.signal })
+      .then((response) => response.json())
+      .then((feed) => {
+        setData((prevData) => mergeChanges(prevData, feed.changes));
+        setChangesCursor(feed.cursor);
+        setPolls((count) => count + 1);
+      })
+      .catch((error) => {
+        if (error.name === "AbortError") return;
+        // Back off before polling again
+        retryTimer = setTimeout(() => setPolls((count) => count + 1), 5000);
+      });
+
+    return () => {
+      controller.abort();
+      clearTimeout(retryTimer);
+    };
+  }, [changesCursor, polls]);
+
+  // Fetch the next page of pending question clusters
+  const loadMore = () => {
+    fetch(`${API_URL}?after=${nextCursor}`)
+      .then((response) => response.json())
+      .then((page) => {
+        setData((prevData) => mergeClusters(prevData, page.clusters));
+        setNextCursor(page.next_cursor);
+      })
+      .catch((error) => {
+        console.error("Error fetching more questions:", error);
+      });
+  };
+
+  // Handle answer submission; the answer goes to every student in the cluster
+  const handleAnswerSubmit = (cluster_id) => {
     const answerData = { teacher_answer: teacherAnswer };
 
-    fetch(`http://localhost:5000/api/teacher-answering/${question_id}`, {
+    fetch(`${API_URL}/${cluster_id}`, {
       method: "PUT",
       headers: {
         "Content-Type": "application/json",
@@ -34,14 +146,18 @@ const TeacherAnswering = () => {
     })
       .then((response) => response.json())
       .then((data) => {
+        if (data.error) {
+          alert(data.error);
+          return;
+        }
         console.log(data.message);
-        alert("Answer updated successfully!");
+        alert(`Answer sent to ${data.answered} student(s)!`);
         setTeacherAnswer("");  // Clear the answer input
 
-        // Update the status of the current question to "answered"
+        // Update the status of the current cluster to "answered"
         setData((prevData) => {
           return prevData.map((item) => {
-            if (item._id === question_id) {
+            if (item._id === cluster_id) {
               return { ...item, status: "answered" };
             }
             return item;
@@ -69,6 +185,7 @@ const TeacherAnswering = () => {
             <tr>
               <th>#</th>
               <th>Question</th>
+              <th>Students</th>
               <th>Teacher Answer</th>
               <th>Status</th>
             </tr>
@@ -77,7 +194,17 @@ const TeacherAnswering = () => {
             {data.map((item, index) => (
               <tr key={item._id}>
                 <td>{index + 1}</td>
-                <td>{item.user_message}</td>
+                <td>
+                  {item.user_message}
+                  {item.examples && item.examples.length > 0 && (
+                    <ul style={styles.examples}>
+                      {item.examples.map((example) => (
+                        <li key={example}>{example}</li>
+                      ))}
+                    </ul>
+                  )}
+                </td>
+                <td>{item.count}</td>
                 <td>
                   <textarea
                     value={teacherAnswer}
@@ -87,17 +214,25 @@ const TeacherAnswering = () => {
                     cols="50"
                   />
                   <button
-                    onClick={() => handleAnswerSubmit(item._id)} // Pass the _id instead of index
+                    onClick={() => handleAnswerSubmit(item._id)} // The cluster _id is its first question's _id
                     style={styles.button}
                   >
                     Submit Answer
                   </button>
                 </td>
-                <td>{item.status || "Not Answered"}</td>
+                <td>
+                  {item.status || "Not Answered"}
+                  {item.deferred && " (deferred: assistant was busy)"}
+                </td>
               </tr>
             ))}
           </tbody>
         </table>
+        {nextCursor && (
+          <button onClick={loadMore} style={styles.button}>
+            Load More
+          </button>
+        )}
       </div>
     </div>
   );
@@ -117,6 +252,11 @@ const styles = {
     backgroundColor: "white",
     boxShadow: "0 4px 8px rgba(0, 0, 0, 0.1)",
   },
+  examples: {
+    marginTop: "6px",
+    color: "#6c757d",
+    fontSize: "0.9em",
+  },
   button: {
     marginTop: "10px",
     padding: "8px 16px",